@@ -0,0 +1,583 @@
+#!/usr/bin/env python3
+"""
+Python stand-in for the MPS backend (mqtt.service.ts)
+BackendStandIn follows MqttService: it subscribes to discovery and
+sessionPing, answers each discovery by subscribing to the device's UP topics
+and publishing the cmd 106 config request, forwards cmd 115 PIR status to an
+/events endpoint, and drops devices that stop pinging. Liveness is a heap of
+deadlines fed by the pings, so the 60 s inactivity check only touches devices
+that are actually due instead of scanning them all. EventSink serves /events
+locally, and the closed-loop runner puts a simulated fleet, the backend and
+the sink on one machine, measuring throughput and latency at every hop
+"""
+
+import argparse
+import asyncio
+import heapq
+import http.client
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench_roundtrip import percentile
+from esp32_fleet import FIRST_DEVICE_ID, MQTT_BROKER, MQTT_PORT, FleetRunner
+from mqtt_transport import AsyncioHelper, create_client, is_memory_broker
+from payload_codec import CODECS, decode_payload, negotiate, to_json
+from sim_logging import configure_logging, get_logger
+from sim_metrics import METRICS
+
+DISCOVERY_TOPIC = "MPS/global/discovery"
+SESSION_PING_TOPIC = "MPS/global/sessionPing"
+CONFIG_REQUEST = {"ch_t": "LED", "ch_addr": "LED1", "cmd": 106, "cmd_m": "config"}
+INACTIVITY_TIMEOUT = 60.0  # seconds without a ping before a device is dropped
+INACTIVITY_CHECK = 60.0  # seconds between inactivity checks
+
+log = get_logger("backend")
+
+BACKEND_MESSAGES = METRICS.counter("backend_messages_total", "Messages handled by the backend stand-in", ("kind",))
+BACKEND_EVENTS = METRICS.counter("backend_events_total", "PIR events forwarded to /events", ("result",))
+BACKEND_INACTIVE = METRICS.counter("backend_inactive_total", "Devices dropped for missing pings")
+
+
+def topic_device_id(topic):
+    """Device id of MPS/global/UP/<device_id>/<suffix> (extractDeviceId in the service)"""
+    parts = topic.split("/")
+    return parts[3] if len(parts) > 3 else None
+
+
+class LivenessIndex:
+    """Last ping per device plus a heap of (deadline, seq, device_id)
+
+    A ping pushes a new deadline and leaves the old heap entry behind; stale
+    entries are recognised and skipped when they reach the top, and the heap
+    is rebuilt once they outnumber the live ones.
+    """
+
+    def __init__(self, timeout=INACTIVITY_TIMEOUT):
+        self.timeout = timeout
+        self.last_seen = {}  # device_id -> time of the last ping
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.last_seen)
+
+    def touch(self, device_id, now):
+        self.last_seen[device_id] = now
+        heapq.heappush(self._heap, (now + self.timeout, next(self._seq), device_id))
+        if len(self._heap) > 2 * len(self.last_seen) + 1024:
+            self._compact()
+
+    def remove(self, device_id):
+        self.last_seen.pop(device_id, None)
+
+    def expired(self, now):
+        """Remove and return every device whose last ping is older than the timeout"""
+        heap = self._heap
+        last_seen = self.last_seen
+        expired = []
+        while heap and heap[0][0] < now:
+            deadline, _, device_id = heapq.heappop(heap)
+            seen = last_seen.get(device_id)
+            if seen is not None and seen + self.timeout == deadline:
+                del last_seen[device_id]
+                expired.append(device_id)
+        return expired
+
+    def _compact(self):
+        self._heap = [(seen + self.timeout, next(self._seq), device_id) for device_id, seen in self.last_seen.items()]
+        heapq.heapify(self._heap)
+
+
+class PipelineProbe:
+    """Timestamps per device as a message crosses each hop; hop latencies are kept as samples"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.samples = defaultdict(list)  # hop name -> [seconds]
+        self.windows = {}  # hop name -> [first, last] arrival, for the hop's rate
+        self.started = {}  # device_id -> boot start
+        self.discovered = {}  # device_id -> discovery seen by the backend
+        self._to_backend = defaultdict(deque)  # device_id -> [motion time]
+        self._to_sink = defaultdict(deque)  # device_id -> [(motion time, backend time)]
+
+    def boot(self, device_ids):
+        now = self.clock()
+        self.started.update((device_id, now) for device_id in device_ids)
+
+    def discovery(self, device_id):
+        now = self.clock()
+        self.discovered[device_id] = now
+        started = self.started.get(device_id)
+        if started is not None:
+            self._add("device -> backend (discovery)", now, started)
+
+    def config_delivered(self, device_id):
+        discovered = self.discovered.get(device_id)
+        if discovered is not None:
+            self._add("backend -> device (config 106)", self.clock(), discovered)
+
+    def motion(self, device_id):
+        self._to_backend[device_id].append(self.clock())
+
+    def status(self, device_id):
+        pending = self._to_backend.get(device_id)
+        if pending:
+            now = self.clock()
+            motion = pending.popleft()
+            self._add("device -> backend (status 115)", now, motion)
+            self._to_sink[device_id].append((motion, now))
+
+    def event(self, device_id):
+        pending = self._to_sink.get(device_id)
+        if pending:
+            now = self.clock()
+            motion, backend = pending.popleft()
+            self._add("backend -> /events", now, backend)
+            self._add("motion -> /events (total)", now, motion)
+
+    def _add(self, hop, now, since):
+        self.samples[hop].append(now - since)
+        window = self.windows.get(hop)
+        if window is None:
+            self.windows[hop] = [now, now]
+        else:
+            window[1] = now
+
+    def report(self):
+        print(f"   {'hop':<32}{'count':>8}{'per s':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        for hop, values in self.samples.items():
+            ordered = sorted(values)
+            first, last = self.windows[hop]
+            rate = len(ordered) / (last - first) if last > first else 0
+            print(f"   {hop:<32}{len(ordered):>8}{rate:>9.0f}"
+                  f"{percentile(ordered, 0.5) * 1000:>9.2f}{percentile(ordered, 0.99) * 1000:>9.2f}"
+                  f"{ordered[-1] * 1000:>9.2f}")
+
+
+class EventSink:
+    """Local /events endpoint: counts the PIR events the backend forwards"""
+
+    def __init__(self, host="127.0.0.1", port=0, probe=None):
+        self.host = host
+        self.port = port
+        self.probe = probe
+        self.received = 0
+        self.server = None
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        """One POSTed {"payload", "topic"} event"""
+        with self._lock:
+            self.received += 1
+        if self.probe is not None:
+            self.probe.event(topic_device_id(event.get("topic", "")))
+
+    def start(self):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive for the backend's forwarder
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path != "/events":
+                    self.send_error(404)
+                    return
+                try:
+                    event = json.loads(body)
+                except ValueError:
+                    self.send_error(400)
+                    return
+                sink.record(event)
+                self.send_response(201)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="events-sink", daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/events"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class EventForwarder:
+    """POSTs events to an /events URL from a worker thread over one keep-alive connection
+
+    The service awaits each POST inside its message handler; a queue in front
+    of the worker keeps the MQTT loop from blocking on HTTP the same way.
+    """
+
+    def __init__(self, url):
+        host, _, path = url.removeprefix("http://").partition("/")
+        self.address = host
+        self.path = "/" + path
+        self.posted = 0
+        self.failed = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="events-forwarder", daemon=True)
+        self._thread.start()
+
+    def post(self, payload, topic):
+        self._queue.put(json.dumps({"payload": payload, "topic": topic}))
+
+    def _run(self):
+        connection = None
+        while True:
+            body = self._queue.get()
+            if body is None:
+                break
+            for attempt in (1, 2):  # one retry on a fresh connection if the old one went stale
+                try:
+                    if connection is None:
+                        connection = http.client.HTTPConnection(self.address, timeout=10)
+                    connection.request("POST", self.path, body, {"Content-Type": "application/json"})
+                    response = connection.getresponse()
+                    response.read()
+                    ok = response.status < 300
+                    break
+                except (OSError, http.client.HTTPException) as e:
+                    if connection is not None:
+                        connection.close()
+                    connection = None
+                    ok = False
+                    if attempt == 2:
+                        log.warning("❌ POST %s failed: %s", self.path, e)
+            if ok:
+                self.posted += 1
+                BACKEND_EVENTS.inc(("posted",))
+            else:
+                self.failed += 1
+                BACKEND_EVENTS.inc(("failed",))
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(10)
+
+
+class BackendStandIn:
+    """MqttService's discovery -> config -> status/ping handling on one MQTT connection"""
+
+    def __init__(self, broker_host=MQTT_BROKER, broker_port=MQTT_PORT, events=None, probe=None,
+                 inactivity_timeout=INACTIVITY_TIMEOUT, check_interval=INACTIVITY_CHECK, clock=time.monotonic,
+                 codecs=("json",)):
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.events = events  # EventForwarder, EventSink (in-process) or None
+        self.probe = probe
+        self.clock = clock
+        self.check_interval = check_interval
+        self.codecs = codecs  # payload codecs a device may be switched to (payload_codec)
+        self.devices = {}  # device_id -> {"device_id", "SNO", "Firmware", "MacAddr", "status", ...}
+        self.liveness = LivenessIndex(inactivity_timeout)
+        self.client = None
+        self.helper = None
+        self.loop = None
+        self._check_handle = None
+        self._subscribed = None
+        self._suback_pending = 0
+
+    async def connect(self, timeout=10.0):
+        self.loop = asyncio.get_running_loop()
+        self._subscribed = self.loop.create_future()
+        self.client = create_client(f"mps-backend-{os.getpid()}", self.broker_host)
+        self.client.username_pw_set("mps-bam100", "bam100")
+        self.client.on_connect = self.on_connect
+        self.client.on_subscribe = self.on_subscribe
+        self.client.on_message = self.on_message
+        if not is_memory_broker(self.broker_host):
+            self.helper = AsyncioHelper(self.loop, self.client)
+            self.client.max_inflight_messages_set(1000)
+        self.client.connect(self.broker_host, self.broker_port, 120)
+        await asyncio.wait_for(asyncio.shield(self._subscribed), timeout)
+        self._check_handle = self.loop.call_later(self.check_interval, self.check_device_inactivity)
+        return self
+
+    def close(self):
+        if self._check_handle is not None:
+            self._check_handle.cancel()
+            self._check_handle = None
+        if self.client is not None:
+            self.client.disconnect()
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            if not self._subscribed.done():
+                self._subscribed.set_exception(ConnectionError(f"MQTT connect failed, return code {rc}"))
+            return
+        log.info("✅ Backend connected to MQTT broker")
+        self._suback_pending = 1
+        client.subscribe([(DISCOVERY_TOPIC, 0), (SESSION_PING_TOPIC, 0)])
+
+    def on_subscribe(self, client, userdata, mid, granted_qos):
+        if self._suback_pending:
+            self._suback_pending = 0
+            if not self._subscribed.done():
+                self._subscribed.set_result(True)
+
+    def on_message(self, client, userdata, msg):
+        topic = msg.topic
+        payload = msg.payload  # JSON or a negotiated binary codec; decode_payload takes both
+        if topic == DISCOVERY_TOPIC:
+            self.handle_device_discovery(payload)
+        elif "/config" in topic:
+            self.handle_device_config(payload, topic)
+        elif "/status" in topic:
+            self.handle_device_status(payload, topic)
+        elif "/sessionPing" in topic:
+            self.handle_session_ping(payload)
+        elif "/control" not in topic:
+            log.error("❌ Unexpected topic received: %s", topic)
+
+    def handle_device_discovery(self, payload):
+        BACKEND_MESSAGES.inc(("discovery",))
+        try:
+            info = decode_payload(payload)
+            device_id = str(info["device_id"])
+        except (ValueError, KeyError, TypeError) as e:
+            log.error("❌ Failed to decode discovery payload: %s", e)
+            return
+        if self.probe is not None:
+            self.probe.discovery(device_id)
+        self.client.subscribe([(f"MPS/global/UP/{device_id}/{suffix}", 0) for suffix in ("config", "control", "status")])
+        codec = negotiate(info.get("codecs"), self.codecs)
+        request = CONFIG_REQUEST if codec == "json" else dict(CONFIG_REQUEST, codec=codec)
+        self.client.publish(f"MPS/global/{device_id}/config", json.dumps(request), qos=1)
+        if device_id not in self.devices:
+            log.debug("📋 Discovered device: %s", device_id)
+            self.devices[device_id] = {"device_id": device_id, "SNO": info.get("SNO"),
+                                       "Firmware": info.get("Firmware"), "MacAddr": info.get("MacAddr"),
+                                       "codec": codec}
+            # Like the service's missing lastPing: no ping yet counts as long inactive
+            self.liveness.touch(device_id, float("-inf"))
+
+    def handle_session_ping(self, payload):
+        BACKEND_MESSAGES.inc(("ping",))
+        try:
+            device_id = str(decode_payload(payload)["device_id"])
+        except (ValueError, KeyError, TypeError) as e:
+            log.error("❌ Failed to process session ping: %s", e)
+            return
+        device = self.devices.get(device_id)
+        if device is None:
+            log.debug("Unknown Device in Ping Message: %s", device_id)
+            return
+        now = self.clock()
+        device["lastPing"] = now
+        self.liveness.touch(device_id, now)
+
+    def handle_device_status(self, payload, topic):
+        BACKEND_MESSAGES.inc(("status",))
+        device_id = topic_device_id(topic)
+        device = self.devices.get(device_id)
+        if device is None:
+            log.error("❌ Device ID %s not found in devices list!", device_id)
+            return
+        try:
+            status = decode_payload(payload)
+        except ValueError as e:
+            log.error("❌ Failed to parse status from topic %s: %s", topic, e)
+            return
+        device["status"] = status
+        if isinstance(status, dict) and status.get("cmd") == 115:
+            if self.probe is not None:
+                self.probe.status(device_id)
+            if self.events is not None:
+                payload = to_json(payload)  # /events takes the JSON text whatever the device sent
+                if isinstance(self.events, EventSink):
+                    self.events.record({"payload": payload, "topic": topic})
+                else:
+                    self.events.post(payload, topic)
+
+    def handle_device_config(self, payload, topic):
+        BACKEND_MESSAGES.inc(("config",))
+        device = self.devices.get(topic_device_id(topic))
+        if device is None:
+            log.error("❌ Device ID %s not found in devices list!", topic_device_id(topic))
+            return
+        try:
+            device["config"] = decode_payload(payload)
+        except ValueError as e:
+            log.error("❌ Failed to parse device config from topic %s: %s", topic, e)
+
+    def check_device_inactivity(self):
+        """Every check_interval: drop the devices whose pings stopped"""
+        for device_id in self.liveness.expired(self.clock()):
+            self.handle_inactive_device(device_id)
+        if self.loop is not None:
+            self._check_handle = self.loop.call_later(self.check_interval, self.check_device_inactivity)
+
+    def handle_inactive_device(self, device_id):
+        BACKEND_INACTIVE.inc()
+        self.devices.pop(device_id, None)
+        log.warning("📢 Admin Notification: Device %s is inactive.", device_id)
+
+
+async def observe_config_requests(host, port, probe):
+    """Extra subscriber stamping when each cmd 106 config request reaches the devices' topics"""
+    loop = asyncio.get_running_loop()
+    subscribed = loop.create_future()
+
+    def on_message(client, userdata, msg):
+        if b'"cmd": 106' in msg.payload:
+            probe.config_delivered(msg.topic.split("/")[2])
+
+    client = create_client(f"mps-observer-{os.getpid()}", host)
+    client.username_pw_set("mps-bam100", "bam100")
+    client.on_connect = lambda c, userdata, flags, rc: c.subscribe("MPS/global/+/config") if rc == 0 else None
+    client.on_subscribe = lambda c, userdata, mid, qos: subscribed.done() or subscribed.set_result(True)
+    client.on_message = on_message
+    if not is_memory_broker(host):
+        AsyncioHelper(loop, client)
+    client.connect(host, port, 60)
+    await asyncio.wait_for(subscribed, 10)
+    return client
+
+
+async def run_closed_loop(args):
+    """Fleet -> broker -> backend -> /events on one machine, with per-hop latency"""
+    loop = asyncio.get_running_loop()
+    probe = PipelineProbe()
+    sink = EventSink(port=args.sink_port, probe=probe)
+    forwarder = None
+    if args.events == "http":
+        sink.start()
+        forwarder = EventForwarder(sink.url)
+        print(f"📥 Event sink on {sink.url}")
+    backend = BackendStandIn(args.host, args.port, events=forwarder or sink, probe=probe,
+                             inactivity_timeout=args.inactivity_timeout, check_interval=args.check_interval,
+                             codecs=("json", *args.codecs))
+    await backend.connect()
+    observer = await observe_config_requests(args.host, args.port, probe)
+
+    fleet = FleetRunner(args.devices, args.host, args.port, args.connections, args.first_id,
+                        ping_interval=args.ping_interval, codecs=args.codecs)
+    print(f"🚀 Booting {args.devices} devices...")
+    started = time.perf_counter()
+    probe.boot(device.device_id for device in fleet.devices)
+    await fleet.start()
+    deadline = loop.time() + 30
+    while loop.time() < deadline and not all(device.config_received for device in fleet.devices):
+        await asyncio.sleep(0.01)
+    configured = sum(device.config_received for device in fleet.devices)
+    boot_elapsed = time.perf_counter() - started
+    print(f"✅ {configured}/{args.devices} devices configured in {boot_elapsed:.2f}s "
+          f"({len(backend.devices)} known to the backend)")
+
+    print(f"📈 Motion: {args.rate:.0f} PIR events/s for {args.duration:.0f}s")
+    devices = fleet.devices
+    interval = 1.0 / args.rate
+    sent = 0
+    begin = loop.time()
+    motion_started = time.perf_counter()
+    while loop.time() - begin < args.duration:
+        due = int((loop.time() - begin) / interval) + 1
+        while sent < due:
+            device = devices[sent % len(devices)]
+            probe.motion(device.device_id)
+            if device.pir.first_motion_sent:
+                device.pir.cancel()
+                device.pir.expire()  # timer runs out: no-motion status
+            else:
+                device.simulate_motion_detection(True)
+            sent += 1
+        await asyncio.sleep(0.001)
+    drain = loop.time() + args.drain
+    while loop.time() < drain and sink.received < sent:
+        await asyncio.sleep(0.01)
+    motion_elapsed = time.perf_counter() - motion_started
+
+    observer.disconnect()
+    fleet.stop()
+    backend.close()
+    if forwarder is not None:
+        forwarder.close()
+    sink.stop()
+
+    print("\n📊 Closed-loop summary")
+    print(f"   PIR events: {sent} triggered, {sink.received} reached /events "
+          f"({sink.received / motion_elapsed:.0f}/s over {motion_elapsed:.1f}s)")
+    probe.report()
+
+
+async def run_backend(args):
+    """Backend only, against real or separately simulated devices"""
+    sink = EventSink(port=args.sink_port).start() if args.events != "none" and not args.events_url else None
+    forwarder = EventForwarder(args.events_url or sink.url) if (args.events_url or sink) else None
+    backend = BackendStandIn(args.host, args.port, events=forwarder,
+                             inactivity_timeout=args.inactivity_timeout, check_interval=args.check_interval,
+                             codecs=("json", *args.codecs))
+    await backend.connect()
+    print(f"✅ Backend listening on {args.host}:{args.port}" + (f", events to {args.events_url or sink.url}" if forwarder else ""))
+    try:
+        while True:
+            await asyncio.sleep(args.report_interval)
+            print(f"   devices {len(backend.devices)}, pinging {len(backend.liveness)}, "
+                  f"events {sink.received if sink else (forwarder.posted if forwarder else 0)}")
+    finally:
+        backend.close()
+        if forwarder is not None:
+            forwarder.close()
+        if sink is not None:
+            sink.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MPS backend stand-in and closed-loop pipeline benchmark")
+    parser.add_argument("--mode", choices=["closed-loop", "backend"], default="closed-loop",
+                        help="closed-loop runs a fleet against the backend; backend runs the backend alone")
+    parser.add_argument("--host", default=MQTT_BROKER, help='MQTT broker host ("memory" = in-process)')
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--connections", type=int, default=2)
+    parser.add_argument("--first-id", type=int, default=FIRST_DEVICE_ID)
+    parser.add_argument("--ping-interval", type=float, default=30)
+    parser.add_argument("--rate", type=float, default=500, help="PIR events/s in closed-loop mode")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of motion in closed-loop mode")
+    parser.add_argument("--drain", type=float, default=5, help="seconds to wait for the last events")
+    parser.add_argument("--events", choices=["http", "inprocess", "none"], default="http",
+                        help="forward PIR events over HTTP to the local sink, or hand them over in-process")
+    parser.add_argument("--codec", dest="codecs", action="append", default=[],
+                        choices=[name for name in CODECS if name != "json"],
+                        help="accept this binary payload codec from devices that offer it (closed loop: offer it too)")
+    parser.add_argument("--events-url", default=None, help="backend mode: POST events to this URL instead")
+    parser.add_argument("--sink-port", type=int, default=0)
+    parser.add_argument("--inactivity-timeout", type=float, default=INACTIVITY_TIMEOUT)
+    parser.add_argument("--check-interval", type=float, default=INACTIVITY_CHECK)
+    parser.add_argument("--report-interval", type=float, default=10)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    configure_logging(getattr(logging, args.log_level.upper()))
+
+    print("🧪 MPS Backend Stand-in")
+    print("=" * 50)
+    try:
+        asyncio.run(run_closed_loop(args) if args.mode == "closed-loop" else run_backend(args))
+    except KeyboardInterrupt:
+        pass
+    print("👋 Goodbye!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the binary payload codec
+For each of the simulator's outbound message kinds (the bench_payloads cases)
+and a few inbound commands, compares JSON with bin1: payload size, encode time
+(templates for outbound, encode() for inbound) and decode time, after checking
+that both decode to the same value
+"""
+
+import argparse
+import json
+import sys
+import timeit
+
+from bench_payloads import DEVICE_ID, cases
+from payload_codec import BinaryPayloadTemplates, decode_payload, encode
+from payload_templates import PayloadTemplates
+
+# Inbound commands as the backend sends them
+COMMANDS = [
+    ("LED on (104)", {"ch_t": "LED", "ch_addr": "LED3", "cmd": 104, "cmd_m": "LED_ON"}),
+    ("brightness (102)", {"ch_t": "LED", "ch_addr": "LED3", "cmd": 102, "cmd_m": "75"}),
+    ("config request (106)", {"ch_t": "LED", "ch_addr": "LED1", "cmd": 106, "cmd_m": "config"}),
+    ("timer set (200)", {"ch_t": "TIMER", "cmd": 200, "sensor_id": 2, "port": 1, "timer_value": 90}),
+]
+
+
+def as_bytes(payload):
+    return payload.encode("utf-8") if isinstance(payload, str) else payload
+
+
+def rows():
+    """(kind, JSON encoder, bin1 encoder) per message kind"""
+    json_templates = PayloadTemplates(DEVICE_ID)
+    binary_templates = BinaryPayloadTemplates(DEVICE_ID)
+    result = [(name, text, binary)
+              for (name, _, text), (_, _, binary) in zip(cases(json_templates), cases(binary_templates))]
+    for name, command in COMMANDS:
+        result.append((name, lambda command=command: json.dumps(command), lambda command=command: encode(command)))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON and bin1 payload size and speed")
+    parser.add_argument("-n", "--number", type=int, default=50000, help="messages per case (best of three runs)")
+    args = parser.parse_args()
+
+    print("🧪 Payload codec benchmark (JSON vs bin1)")
+    print("=" * 96)
+    print(f"   {'kind':<22}{'JSON B':>8}{'bin1 B':>8}{'size':>7}"
+          f"{'enc JSON':>11}{'enc bin1':>11}{'dec JSON':>11}{'dec bin1':>11}")
+
+    mismatches = 0
+    totals = [0, 0]
+    for name, encode_json, encode_binary in rows():
+        text, binary = as_bytes(encode_json()), encode_binary()
+        if decode_payload(binary) != json.loads(text):
+            print(f"❌ {name}: bin1 decodes to {decode_payload(binary)}, JSON to {json.loads(text)}")
+            mismatches += 1
+            continue
+        totals[0] += len(text)
+        totals[1] += len(binary)
+        # Best of three runs: the machine's noise only ever adds time
+        timings = [min(timeit.repeat(call, number=args.number, repeat=3)) / args.number * 1e9 for call in (
+            encode_json, encode_binary, lambda: decode_payload(text), lambda: decode_payload(binary))]
+        print(f"   {name:<22}{len(text):>8}{len(binary):>8}{len(binary) / len(text):>7.0%}"
+              + "".join(f"{timing:>8.0f} ns" for timing in timings))
+
+    print(f"   {'total':<22}{totals[0]:>8}{totals[1]:>8}{totals[1] / totals[0]:>7.0%}")
+    if mismatches:
+        sys.exit(1)
+    print("✅ bin1 decodes to the same values as JSON for every kind")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for inbound command dispatch
+Measures the table lookup on its own (no-op handlers) and the full on_message
+path of a simulator with printing and publishing discarded
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import timeit
+
+from command_dispatcher import CommandDispatcher
+from esp32_simulator_complete import DEFAULT_DISPATCHER, ESP32Simulator
+from inmemory_broker import MQTT_ERR_SUCCESS, InMemoryMessageInfo
+
+MESSAGES = [
+    ("control", {"ch_t": "LED", "ch_addr": "LED6", "cmd": 104, "cmd_m": "LED_ON"}),
+    ("control", {"ch_t": "LED", "ch_addr": "LED12", "cmd": 102, "cmd_m": "75"}),
+    ("control", {"ch_t": "SHADE", "ch_addr": "SHADE2", "cmd": 113, "cmd_m": "open"}),
+    ("timer", {"cmd": 200, "sensor_id": 1, "port": 1, "timer_value": 60}),
+    ("timer", {"cmd": 202, "sensor_id": 1, "port": 1}),
+    ("scene", {"ch_t": "LED", "ch_addr": [2, 7], "cmd": 117, "cmd_m": "LED_OFF"}),
+]
+
+
+class NullClient:
+    """Stands in for the MQTT client so only simulator work is measured"""
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        return InMemoryMessageInfo(0, MQTT_ERR_SUCCESS)
+
+
+class Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def null_dispatcher():
+    """DEFAULT_DISPATCHER's keys with no-op handlers"""
+    dispatcher = CommandDispatcher()
+    dispatcher._channels = DEFAULT_DISPATCHER._channels
+    for key, (handler, channel_type) in DEFAULT_DISPATCHER._handlers.items():
+        dispatcher._handlers[key] = (lambda device, data, channel: None, channel_type)
+    return dispatcher
+
+
+def report(name, seconds, count):
+    print(f"   {name:<28} {seconds / count * 1e9:>10.0f} ns/msg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark simulator command dispatch")
+    parser.add_argument("-n", "--number", type=int, default=200000, help="messages per case")
+    args = parser.parse_args()
+
+    print("🧪 Dispatch microbenchmark")
+    print("=" * 50)
+
+    dispatcher = null_dispatcher()
+    print("📋 Table lookup only:")
+    for suffix, data in MESSAGES:
+        seconds = timeit.timeit(lambda: dispatcher.dispatch(None, suffix, data), number=args.number)
+        report(f"{suffix} cmd {data['cmd']}", seconds, args.number)
+
+    simulator = ESP32Simulator(client=NullClient())
+    number = max(1, args.number // 10)
+    print("📋 Full on_message (decode + dispatch + handler):")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = []
+        for suffix, data in MESSAGES:
+            msg = Message(f"MPS/global/{simulator.device_id}/{suffix}", json.dumps(data).encode())
+            seconds = timeit.timeit(lambda: simulator.on_message(None, None, msg), number=number)
+            results.append((f"{suffix} cmd {data['cmd']}", seconds))
+    for name, seconds in results:
+        report(name, seconds, number)
+
+
+if __name__ == "__main__":
+    main()
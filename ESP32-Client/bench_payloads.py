@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark for pre-serialized payload templates
+Compares json.dumps() of the simulator's outbound dicts with PayloadTemplates
+for each message kind, after checking that both produce identical bytes
+"""
+
+import argparse
+import json
+import sys
+import timeit
+
+from payload_templates import PayloadTemplates
+
+DEVICE_ID = "123456"
+
+
+def cases(templates):
+    """(name, json.dumps callable, template callable) per outbound message kind"""
+    return [
+        ("status update",
+         lambda: json.dumps({"device_id": DEVICE_ID, "ch_t": "LED", "ch_addr": "LED6", "status": "75%"}),
+         lambda: templates.status_update("LED", "LED6", "75%")),
+        ("scene status",
+         lambda: json.dumps({"device_id": DEVICE_ID, "ch_t": "LED", "ch_addr": [2, 7, 8, 11], "status": "on"}),
+         lambda: templates.scene_status([2, 7, 8, 11], "on")),
+        ("PIR status",
+         lambda: json.dumps({"ch_t": "PIR", "ch_addr": "Port-1_2", "cmd": 115, "cmd_m": "PIR State = 1"}),
+         lambda: templates.pir_status(1, 2, True)),
+        ("ping",
+         lambda: json.dumps({"device_id": DEVICE_ID, "status": "online", "uptime": 1760668800,
+                             "rssi": -50, "pir_motion": False}),
+         lambda: templates.ping(1760668800, False)),
+        ("timer set (201)",
+         lambda: json.dumps({"device_id": DEVICE_ID, "ch_t": "TIMER", "ch_addr": "TIMER_CONFIG", "cmd": 201,
+                             "sensor_id": 1, "port": 2, "timer_value": 90, "status": "success"}),
+         lambda: templates.timer_set(1, 2, 90)),
+        ("timer error (201)",
+         lambda: json.dumps({"device_id": DEVICE_ID, "ch_t": "TIMER", "ch_addr": "TIMER_CONFIG", "cmd": 201,
+                             "sensor_id": 1, "port": 2, "timer_value": 30.0, "status": "error",
+                             "error": "Invalid timer value. Must be 5-3600 seconds"}),
+         lambda: templates.timer_error(1, 2, 30.0, "Invalid timer value. Must be 5-3600 seconds")),
+        ("timer current (203)",
+         lambda: json.dumps({"device_id": DEVICE_ID, "ch_t": "TIMER", "ch_addr": "TIMER_STATUS", "cmd": 203,
+                             "sensor_id": 1, "port": 1, "timer_value": 60.0, "status": "current"}),
+         lambda: templates.timer_current(1, 1, 60.0)),
+        ("all timers (204)",
+         lambda: json.dumps({"device_id": DEVICE_ID, "ch_t": "TIMER", "ch_addr": "ALL_SENSORS", "cmd": 204,
+                             "sensors": [{"sensor_id": 2, "port": 1, "timer_value": 30.0, "active": True}]}),
+         lambda: templates.all_timers([(2, 1, 30.0, True)])),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark payload templates against json.dumps")
+    parser.add_argument("-n", "--number", type=int, default=200000, help="messages per case")
+    args = parser.parse_args()
+
+    print("🧪 Payload template benchmark")
+    print("=" * 64)
+    print(f"   {'kind':<22}{'json.dumps':>12}{'template':>12}{'speedup':>10}")
+
+    templates = PayloadTemplates(DEVICE_ID)
+    mismatches = 0
+    for name, dumps, template in cases(templates):
+        if dumps() != template():
+            print(f"❌ {name}: template output differs")
+            print(f"   json.dumps: {dumps()}")
+            print(f"   template:   {template()}")
+            mismatches += 1
+            continue
+        baseline = timeit.timeit(dumps, number=args.number) / args.number
+        fast = timeit.timeit(template, number=args.number) / args.number
+        print(f"   {name:<22}{baseline * 1e9:>9.0f} ns{fast * 1e9:>9.0f} ns{baseline / fast:>9.1f}x")
+
+    if mismatches:
+        sys.exit(1)
+    print("✅ All templates byte-identical to json.dumps")
+
+
+if __name__ == "__main__":
+    main()
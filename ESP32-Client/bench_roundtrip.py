@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency benchmark for command -> status round trips
+Fires LED, shade and timer commands at a controlled rate, matches each reply on
+MPS/global/UP/<id>/status to its request, and reports p50/p99/p999 latency and
+throughput per command type. Runs against the in-process broker ("memory") or a
+real broker through paho; results can be saved as JSON for comparison
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from collections import deque
+
+from esp32_fleet import FIRST_DEVICE_ID, MQTT_BROKER, MQTT_PORT, FleetRunner
+from mqtt_transport import AsyncioHelper, create_client, is_memory_broker
+from payload_codec import decode_payload
+from sim_logging import configure_logging
+
+STATUS_FILTER = "MPS/global/UP/+/status"
+
+
+def led_power(i):
+    channel = 1 + i % 12
+    return "control", {"ch_t": "LED", "ch_addr": f"LED{channel}", "cmd": 104,
+                       "cmd_m": "LED_ON" if i % 2 else "LED_OFF"}, f"LED{channel}"
+
+
+def led_brightness(i):
+    channel = 1 + i % 12
+    return "control", {"ch_t": "LED", "ch_addr": f"LED{channel}", "cmd": 102,
+                       "cmd_m": str(i % 101)}, f"LED{channel}"
+
+
+def shade(i):
+    channel = 1 + i % 4
+    return "control", {"ch_t": "SHADE", "ch_addr": f"SHADE{channel}", "cmd": 113 if i % 2 else 114,
+                       "cmd_m": "open" if i % 2 else "close"}, f"SHADE{channel}"
+
+
+def timer_set(i):
+    port = 1 + i % 4
+    return "timer", {"cmd": 200, "sensor_id": 1, "port": port, "timer_value": 5 + i % 3596}, (201, 1, port)
+
+
+def timer_get(i):
+    port = 1 + i % 4
+    return "timer", {"cmd": 202, "sensor_id": 1, "port": port}, (203, 1, port)
+
+
+def all_timers(i):
+    return "timer", {"cmd": 203}, (204,)
+
+
+# command type -> builder(i) returning (topic suffix, payload, reply key)
+COMMANDS = {
+    "led_power (104)": led_power,
+    "led_brightness (102)": led_brightness,
+    "shade (113/114)": shade,
+    "timer_set (200)": timer_set,
+    "timer_get (202)": timer_get,
+    "all_timers (203)": all_timers,
+}
+
+
+def reply_key(data):
+    """Key a status message the same way its request was keyed"""
+    cmd = data.get("cmd")
+    if cmd in (201, 203):
+        return data.get("device_id"), (cmd, data.get("sensor_id"), data.get("port"))
+    if cmd == 204:
+        return data.get("device_id"), (204,)
+    return data.get("device_id"), data.get("ch_addr")
+
+
+class RoundTripTracker:
+    """Matches replies to requests FIFO per (device, reply key)"""
+
+    def __init__(self):
+        self.pending = {}  # (device_id, key) -> deque of send times
+        self.samples = []
+        self.unmatched = 0
+        self.last_reply = 0.0
+
+    def sent(self, device_id, key):
+        self.pending.setdefault((device_id, key), deque()).append(time.perf_counter())
+
+    def on_message(self, client, userdata, msg):
+        now = time.perf_counter()
+        try:
+            data = decode_payload(msg.payload)
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        waiting = self.pending.get(reply_key(data))
+        if not waiting:
+            self.unmatched += 1
+            return
+        self.samples.append(now - waiting.popleft())
+        self.last_reply = now
+
+    def outstanding(self):
+        return sum(len(waiting) for waiting in self.pending.values())
+
+    def reset(self):
+        self.pending.clear()
+        self.samples = []
+        self.unmatched = 0
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(tracker, sent, started):
+    ordered = sorted(tracker.samples)
+    ms = lambda value: None if value is None else round(value * 1000, 4)
+    received = len(ordered)
+    elapsed = tracker.last_reply - started if received else 0.0
+    return {
+        "sent": sent,
+        "received": received,
+        "lost": sent - received,
+        "unmatched": tracker.unmatched,
+        "p50_ms": ms(percentile(ordered, 0.50)),
+        "p99_ms": ms(percentile(ordered, 0.99)),
+        "p999_ms": ms(percentile(ordered, 0.999)),
+        "max_ms": ms(ordered[-1] if ordered else None),
+        "mean_ms": ms(sum(ordered) / received if received else None),
+        "throughput": round(received / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+async def connect_bench_client(host, port, tracker):
+    """Status-topic subscriber + command publisher, driven by the running loop"""
+    loop = asyncio.get_running_loop()
+    subscribed = asyncio.Event()
+    client = create_client(f"esp32-bench-{os.getpid()}", host)
+    client.username_pw_set("mps-bam100", "bam100")
+    client.on_message = tracker.on_message
+    client.on_connect = lambda c, userdata, flags, rc: c.subscribe(STATUS_FILTER) if rc == 0 else None
+    client.on_subscribe = lambda c, userdata, mid, qos: subscribed.set()
+    helper = None if is_memory_broker(host) else AsyncioHelper(loop, client)
+    client.connect(host, port, 60)
+    await asyncio.wait_for(subscribed.wait(), 30)
+    return client, helper
+
+
+async def run_command(client, tracker, device_ids, builder, count, rate, drain_timeout):
+    """Send count commands at rate/s round-robin over devices and wait for the replies"""
+    loop = asyncio.get_running_loop()
+    tracker.reset()
+    interval = 1.0 / rate if rate else 0.0
+    started = time.perf_counter()
+    begin = loop.time()
+    for i in range(count):
+        if interval:
+            ahead = begin + i * interval - loop.time()
+            if ahead > 0.001:
+                await asyncio.sleep(ahead)
+        elif i % 500 == 499:
+            await asyncio.sleep(0)  # let paho's writer and reader run
+        device_id = device_ids[i % len(device_ids)]
+        suffix, payload, key = builder(i)
+        tracker.sent(device_id, key)  # before publish: in-process replies arrive synchronously
+        client.publish(f"MPS/global/{device_id}/{suffix}", json.dumps(payload))
+    deadline = loop.time() + drain_timeout
+    while tracker.outstanding() and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+    return summarize(tracker, count, started)
+
+
+async def run_benchmark(args):
+    tracker = RoundTripTracker()
+    fleet = None
+    if args.device_id:
+        device_ids = args.device_id  # an already running simulator or real device
+    else:
+        fleet = FleetRunner(args.devices, args.host, args.port, args.connections, args.first_id,
+                            ping_interval=3600)
+        await fleet.start()
+        device_ids = [device.device_id for device in fleet.devices]
+    client, helper = await connect_bench_client(args.host, args.port, tracker)
+
+    results = {}
+    try:
+        for name, builder in COMMANDS.items():
+            if args.only and not any(part in name for part in args.only):
+                continue
+            await run_command(client, tracker, device_ids, builder, min(args.count, 1000), args.rate,
+                              args.drain_timeout)  # warm-up
+            result = await run_command(client, tracker, device_ids, builder, args.count, args.rate,
+                                       args.drain_timeout)
+            results[name] = result
+            print_result(name, result)
+    finally:
+        client.disconnect()
+        if fleet is not None:
+            fleet.stop()
+    return results
+
+
+def print_result(name, result):
+    fmt = lambda value: "-" if value is None else f"{value:.3f}"
+    print(f"   {name:<22}{fmt(result['p50_ms']):>9}{fmt(result['p99_ms']):>9}{fmt(result['p999_ms']):>9}"
+          f"{fmt(result['max_ms']):>10}{result['throughput'] or 0:>11.0f}{result['lost']:>7}")
+
+
+def compare(results, baseline_path):
+    """Print p50/p99 change against a previously saved results file"""
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    print(f"📊 Compared with {baseline_path}")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        changes = []
+        for field in ("p50_ms", "p99_ms"):
+            if old.get(field) and result.get(field) is not None:
+                changes.append(f"{field[:-3]} {(result[field] / old[field] - 1) * 100:+.1f}%")
+        print(f"   {name:<22}{', '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark command -> status round-trip latency")
+    parser.add_argument("--host", default=MQTT_BROKER, help='MQTT broker host ("memory" = in-process)')
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--devices", type=int, default=10, help="simulated devices to start")
+    parser.add_argument("--connections", type=int, default=2, help="broker connections for the devices")
+    parser.add_argument("--first-id", type=int, default=FIRST_DEVICE_ID)
+    parser.add_argument("--device-id", action="append",
+                        help="benchmark an already running device instead of starting a fleet (repeatable)")
+    parser.add_argument("-n", "--count", type=int, default=10000, help="commands per command type")
+    parser.add_argument("--rate", type=float, default=2000, help="commands/s (0 = as fast as possible)")
+    parser.add_argument("--only", action="append", help="only command types containing this text")
+    parser.add_argument("--drain-timeout", type=float, default=5.0, help="seconds to wait for late replies")
+    parser.add_argument("--output", help="save results as JSON to this file")
+    parser.add_argument("--baseline", help="compare with results saved by an earlier --output")
+    args = parser.parse_args()
+    configure_logging(logging.WARNING)
+
+    print("🧪 Command round-trip benchmark")
+    print("=" * 78)
+    print(f"   transport: {'in-process' if is_memory_broker(args.host) else 'paho'} ({args.host}), "
+          f"rate: {args.rate or 'max'}/s, {args.count} commands per type")
+    print(f"   {'command':<22}{'p50 ms':>9}{'p99 ms':>9}{'p999 ms':>9}{'max ms':>10}{'replies/s':>11}{'lost':>7}")
+    results = asyncio.run(run_benchmark(args))
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "transport": "memory" if is_memory_broker(args.host) else "paho",
+            "host": args.host,
+            "devices": len(args.device_id) if args.device_id else args.devices,
+            "rate": args.rate,
+            "count": args.count,
+            "results": results,
+        }
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"💾 Results saved to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+    if any(result["lost"] for result in results.values()):
+        print("⚠️ Some commands got no reply")
+        sys.exit(1)
+    print("✅ Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,122 +3,61 @@
 Simple example to change ESP32 timer configuration via MQTT
 """
 
-import paho.mqtt.client as mqtt
-import json
-import time
+import asyncio
+
+from mqtt_transport import DEFAULT_BROKER_HOST
+from timer_client import AsyncTimerClient, TimerError
 
 # Configuration
-MQTT_BROKER = "192.168.29.128"  # Your MQTT broker IP
+MQTT_BROKER = DEFAULT_BROKER_HOST  # Your MQTT broker IP (MQTT_BROKER env var overrides)
 MQTT_PORT = 1883
 DEVICE_ID = "123456"
 
-def change_timer_value(timer_seconds):
+async def change_timer_value(timers, timer_seconds):
     """Change timer value via MQTT"""
-    
-    # Create MQTT client
-    client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1)
+    print(f"📤 Sending timer configuration:")
+    print(f"   Topic: {timers.timer_topic}")
+    print(f"   New timer value: {timer_seconds} seconds")
     
     try:
-        # Connect to broker
-        print(f"🔌 Connecting to MQTT broker: {MQTT_BROKER}:{MQTT_PORT}")
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        
-        # Create timer configuration message
-        timer_config = {
-            "cmd": 200,
-            "timer_value": timer_seconds
-        }
-        
-        # Publish to timer topic
-        topic = f"MPS/global/{DEVICE_ID}/timer"
-        payload = json.dumps(timer_config)
-        
-        print(f"📤 Sending timer configuration:")
-        print(f"   Topic: {topic}")
-        print(f"   Message: {payload}")
-        
-        result = client.publish(topic, payload)
-        
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print(f"✅ Timer configuration sent successfully!")
-            print(f"   New timer value: {timer_seconds} seconds")
-        else:
-            print(f"❌ Failed to send timer configuration")
-            
-    except Exception as e:
-        print(f"❌ Error: {e}")
-    finally:
-        client.disconnect()
-        print("👋 Disconnected from MQTT broker")
+        value = await timers.set_timer(timer_seconds)
+        print(f"✅ Timer configuration confirmed by device: {value} seconds")
+    except TimerError as e:
+        print(f"❌ Device rejected timer configuration: {e}")
+    except asyncio.TimeoutError:
+        print(f"❌ No confirmation from device")
 
-def get_current_timer():
+async def get_current_timer(timers):
     """Get current timer value via MQTT"""
+    print(f"📤 Requesting current timer value:")
+    print(f"   Topic: {timers.timer_topic}")
+    print(f"⏳ Waiting for response...")
     
-    # Create MQTT client
-    client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1)
-    
-    def on_message(client, userdata, message):
-        try:
-            data = json.loads(message.payload.decode())
-            if data.get("ch_t") == "TIMER":
-                print(f"📩 Timer Response: {data}")
-        except json.JSONDecodeError:
-            print(f"❌ Invalid JSON received")
-    
     try:
-        # Connect to broker
-        print(f"🔌 Connecting to MQTT broker: {MQTT_BROKER}:{MQTT_PORT}")
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        client.on_message = on_message
-        
-        # Subscribe to status topic to receive response
-        status_topic = f"MPS/global/UP/{DEVICE_ID}/status"
-        client.subscribe(status_topic)
-        print(f"📡 Subscribed to: {status_topic}")
-        
-        # Start loop to receive messages
-        client.loop_start()
-        
-        # Create timer request message
-        timer_request = {
-            "cmd": 202
-        }
-        
-        # Publish to timer topic
-        topic = f"MPS/global/{DEVICE_ID}/timer"
-        payload = json.dumps(timer_request)
-        
-        print(f"📤 Requesting current timer value:")
-        print(f"   Topic: {topic}")
-        print(f"   Message: {payload}")
-        
-        result = client.publish(topic, payload)
-        
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print(f"✅ Timer request sent successfully!")
-            print(f"⏳ Waiting for response...")
+        value = await timers.get_timer()
+        print(f"📩 Current timer value: {value} seconds")
+    except asyncio.TimeoutError:
+        print(f"❌ No response from device")
+
+async def main():
+    # One connection for all three steps; each returns as soon as the device replies
+    print(f"🔌 Connecting to MQTT broker: {MQTT_BROKER}:{MQTT_PORT}")
+    try:
+        async with AsyncTimerClient(DEVICE_ID, MQTT_BROKER, MQTT_PORT) as timers:
+            print("\n1. Setting timer to 90 seconds...")
+            await change_timer_value(timers, 90)
             
-            # Wait for response
-            time.sleep(3)
-        else:
-            print(f"❌ Failed to send timer request")
+            print("\n2. Getting current timer value...")
+            await get_current_timer(timers)
             
+            print("\n3. Setting timer to 30 seconds...")
+            await change_timer_value(timers, 30)
     except Exception as e:
         print(f"❌ Error: {e}")
-    finally:
-        client.loop_stop()
-        client.disconnect()
-        print("👋 Disconnected from MQTT broker")
+    print("👋 Disconnected from MQTT broker")
 
 if __name__ == "__main__":
     print("🧪 ESP32 Timer Configuration Example")
     print("=" * 50)
     
-    print("\n1. Setting timer to 90 seconds...")
-    change_timer_value(90)
-    
-    print("\n2. Getting current timer value...")
-    get_current_timer()
-    
-    print("\n3. Setting timer to 30 seconds...")
-    change_timer_value(30)
+    asyncio.run(main())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Packed LED/shade channel state for the ESP32 simulator
+All channel state of a device lives in one 31-byte bytearray indexed by
+channel number; led_states / shade_states remain available as dict-like views
+"""
+
+from collections.abc import MutableMapping
+
+LED_COUNT = 13   # LED0 (built-in) + LED1-LED12
+SHADE_COUNT = 5  # SHADE1-SHADE4 (index 0 unused)
+
+# Channel index -> address
+LED_NAMES = [f"LED{i}" for i in range(LED_COUNT)]
+SHADE_NAMES = [None] + [f"SHADE{i}" for i in range(1, SHADE_COUNT)]
+LED_INDEX = {name: i for i, name in enumerate(LED_NAMES)}
+SHADE_INDEX = {name: i for i, name in enumerate(SHADE_NAMES) if name}
+
+# Shade state enum byte
+SHADE_CLOSED = 0
+SHADE_OPEN = 1
+SHADE_STOPPED = 2
+SHADE_STATE_NAMES = ("closed", "open", "stopped")
+SHADE_STATE_CODES = {name: code for code, name in enumerate(SHADE_STATE_NAMES)}
+
+# Offsets into the packed buffer
+LED_ON = 0
+LED_BRIGHTNESS = LED_ON + LED_COUNT
+SHADE_STATE = LED_BRIGHTNESS + LED_COUNT
+STATE_SIZE = SHADE_STATE + SHADE_COUNT
+
+# Every byte of an LED row set to 0x01, for broadcasting a value across a row
+LED_ROW_ONES = int.from_bytes(b"\x01" * LED_COUNT, "little")
+MAX_BRIGHTNESS = 100  # brightness is a percentage (firmware maps 0-100 onto the 0-255 PWM range)
+_row_selectors = {}  # channel bitmask -> row selector with 0xFF in each selected byte
+
+
+def led_mask(channels, first=1, last=LED_COUNT - 1):
+    """Bitmask of the valid LED channel numbers in a scene's ch_addr list"""
+    mask = 0
+    for ch in channels:
+        if type(ch) is int and first <= ch <= last:
+            mask |= 1 << ch
+    return mask
+
+
+def clamp_brightness(brightness):
+    """Brightness as stored and reported in "N%" statuses: an int percentage in 0..MAX_BRIGHTNESS"""
+    return max(0, min(MAX_BRIGHTNESS, int(brightness)))
+
+
+def mask_channels(mask):
+    """Channel numbers set in a bitmask, in ascending order"""
+    return [i for i in range(LED_COUNT) if mask >> i & 1]
+
+
+def _row_selector(mask):
+    selector = _row_selectors.get(mask)
+    if selector is None:
+        selector = 0
+        for i in mask_channels(mask):
+            selector |= 0xFF << (8 * i)
+        _row_selectors[mask] = selector
+    return selector
+
+
+class ChannelState:
+    """On/off + brightness per LED and an enum byte per shade, in one bytearray"""
+
+    __slots__ = ("data",)
+
+    def __init__(self):
+        self.data = bytearray(STATE_SIZE)
+
+    def led_on(self, index):
+        return self.data[LED_ON + index] != 0
+
+    def brightness(self, index):
+        return self.data[LED_BRIGHTNESS + index]
+
+    def set_led(self, index, on, brightness):
+        data = self.data
+        data[LED_ON + index] = 1 if on else 0
+        data[LED_BRIGHTNESS + index] = clamp_brightness(brightness)
+
+    def set_leds(self, mask, on, brightness):
+        """Set every LED in a channel bitmask at once with whole-row masked writes"""
+        selector = _row_selector(mask)
+        keep = ~selector
+        data = self.data
+        for offset, value in ((LED_ON, 1 if on else 0), (LED_BRIGHTNESS, clamp_brightness(brightness))):
+            row = int.from_bytes(data[offset:offset + LED_COUNT], "little")
+            row = (row & keep) | (value * LED_ROW_ONES & selector)
+            data[offset:offset + LED_COUNT] = row.to_bytes(LED_COUNT, "little")
+
+    def shade(self, index):
+        return self.data[SHADE_STATE + index]
+
+    def set_shade(self, index, state):
+        self.data[SHADE_STATE + index] = state
+
+
+class LedStatesView(MutableMapping):
+    """led_states as {"LED1": {"state": "on", "brightness": 100}, ...} on top of ChannelState"""
+
+    __slots__ = ("channels",)
+
+    def __init__(self, channels):
+        self.channels = channels
+
+    def __getitem__(self, name):
+        index = LED_INDEX[name]
+        channels = self.channels
+        return {"state": "on" if channels.led_on(index) else "off", "brightness": channels.brightness(index)}
+
+    def __setitem__(self, name, state):
+        self.channels.set_led(LED_INDEX[name], state["state"] == "on", state.get("brightness", 0))
+
+    def __delitem__(self, name):
+        raise TypeError("LED channels are fixed")
+
+    def __iter__(self):
+        return iter(LED_NAMES)
+
+    def __len__(self):
+        return LED_COUNT
+
+
+class ShadeStatesView(MutableMapping):
+    """shade_states as {"SHADE1": {"state": "closed"}, ...} on top of ChannelState"""
+
+    __slots__ = ("channels",)
+
+    def __init__(self, channels):
+        self.channels = channels
+
+    def __getitem__(self, name):
+        return {"state": SHADE_STATE_NAMES[self.channels.shade(SHADE_INDEX[name])]}
+
+    def __setitem__(self, name, state):
+        self.channels.set_shade(SHADE_INDEX[name], SHADE_STATE_CODES[state["state"]])
+
+    def __delitem__(self, name):
+        raise TypeError("Shade channels are fixed")
+
+    def __iter__(self):
+        return iter(SHADE_INDEX)
+
+    def __len__(self):
+        return len(SHADE_INDEX)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Table-driven command dispatch for the ESP32 simulator
+Handlers are registered once against (topic suffix, ch_t, cmd); each inbound
+message then costs at most a few dict lookups instead of a chain of
+endswith()/ch_t/cmd comparisons and channel-address string slicing
+"""
+
+from sim_logging import get_logger
+
+ANY = None  # wildcard for ch_t / cmd when registering
+OTHER = "other"  # metric label for commands no handler is registered for
+
+log = get_logger("dispatch")
+
+
+class CommandDispatcher:
+    """Maps (topic suffix, ch_t, cmd) to handler(device, data, channel)"""
+
+    def __init__(self):
+        self._handlers = {}  # (suffix, ch_t, cmd) -> (handler, channel_type)
+        self._channels = {}  # ch_t -> {ch_addr: index}
+        self._commands = set()  # cmd codes with a handler, for bounded metric labels
+
+    def register_channels(self, ch_t, addresses):
+        """Precompute channel address -> index for a channel type, e.g. {"LED1": 1}"""
+        self._channels.setdefault(ch_t, {}).update(addresses)
+
+    def register(self, suffix, handler, ch_t=ANY, cmd=ANY, channel=False):
+        """Register handler(device, data, channel) for a topic suffix
+
+        With channel=True the message's ch_addr is resolved against the
+        registered addresses for ch_t, and the handler receives the index.
+        """
+        self._handlers[(suffix, ch_t, cmd)] = (handler, ch_t if channel else None)
+        if cmd is not ANY:
+            self._commands.add(cmd)
+
+    def declare_commands(self, *codes):
+        """cmd codes a wildcard-cmd handler deals with itself, so they keep their own metric label"""
+        self._commands.update(codes)
+
+    def handler(self, suffix, ch_t=ANY, cmd=ANY, channel=False):
+        """Decorator form of register()"""
+        def decorate(func):
+            self.register(suffix, func, ch_t, cmd, channel)
+            return func
+        return decorate
+
+    def copy(self):
+        """Independent copy, so one device can add commands without affecting others"""
+        other = CommandDispatcher()
+        other._handlers = dict(self._handlers)
+        other._commands = set(self._commands)
+        other._channels = {ch_t: dict(addresses) for ch_t, addresses in self._channels.items()}
+        return other
+
+    def command_label(self, cmd):
+        """cmd as a metric label: registered codes as is, anything else from a payload as "other" """
+        return cmd if cmd is None or cmd in self._commands else OTHER
+
+    def resolve(self, suffix, ch_t, cmd):
+        """Most specific registered entry for the key, or None"""
+        handlers = self._handlers
+        return (handlers.get((suffix, ch_t, cmd))
+                or handlers.get((suffix, ch_t, ANY))
+                or handlers.get((suffix, ANY, cmd))
+                or handlers.get((suffix, ANY, ANY)))
+
+    def dispatch(self, device, suffix, data):
+        """Run the matching handler; returns False when nothing handled the message"""
+        ch_t = data.get("ch_t")
+        if not isinstance(ch_t, str):
+            ch_t = ANY
+        cmd = data.get("cmd")
+        if not isinstance(cmd, int):
+            cmd = ANY
+
+        entry = self.resolve(suffix, ch_t, cmd)
+        if entry is None:
+            return False
+        handler, channel_type = entry
+        channel = None
+        if channel_type is not None:
+            ch_addr = data.get("ch_addr")
+            if isinstance(ch_addr, str):
+                channel = self._channels.get(channel_type, {}).get(ch_addr)
+            if channel is None:
+                log.warning("❌ Invalid %s address: %s", channel_type, ch_addr)
+                return False
+        handler(device, data, channel)
+        return True
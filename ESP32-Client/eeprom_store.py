@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Persistent EEPROM emulation for simulated ESP32 devices
+Each device gets a 1024-byte image laid out like the firmware's EEPROM
+(src/main.cpp: credentials, config flag, TIMER_VALUE_ADDR, per-sensor timers at
+SENSOR_TIMER_BASE_ADDR + (sensor_id * 10 + port) * 4, big-endian milliseconds).
+Images live in one memory-mapped file - a single device or a whole fleet - and
+are read and written in place, so restoring a fleet is one mmap
+"""
+
+import mmap
+import os
+import struct
+
+# Firmware EEPROM layout (src/main.cpp)
+EEPROM_SIZE = 1024
+SSID_ADDR = 0
+PASSWORD_ADDR = 64
+MQTT_SERVER_ADDR = 128
+CONFIG_FLAG_ADDR = 192
+TIMER_VALUE_ADDR = 256
+SENSOR_TIMER_BASE_ADDR = 320  # 4 bytes per sensor, index = sensor_id * 10 + port
+STRING_SIZE = 64
+DEFAULT_TIMER_MS = 30 * 1000
+MAX_TIMER_MS = 3600 * 1000
+# The firmware's MAX_SENSORS (10) check rejects every sensor_id above 0, including
+# the default sensor 2 / port 1; the emulation accepts any index that fits the image.
+SENSOR_SLOTS = (EEPROM_SIZE - SENSOR_TIMER_BASE_ADDR) // 4
+
+# File layout: records of a device_id tag followed by the device's EEPROM image
+TAG_SIZE = 32
+RECORD_SIZE = TAG_SIZE + EEPROM_SIZE
+GROW_RECORDS = 1024  # records added each time a fleet file fills up
+
+_U32 = struct.Struct(">I")
+
+
+def sensor_slot(sensor_id, port):
+    """Firmware sensor index for a sensor/port, or None if it does not fit the image"""
+    index = sensor_id * 10 + port
+    return index if 0 <= port < 10 and 0 <= index < SENSOR_SLOTS else None
+
+
+def _valid_timer(timer_ms):
+    """The firmware's load rule: 0 or more than an hour means "not set" """
+    return 0 < timer_ms <= MAX_TIMER_MS
+
+
+class EepromImage:
+    """One device's EEPROM inside an EepromStore, read and written in place"""
+
+    __slots__ = ("store", "offset")
+
+    def __init__(self, store, offset):
+        self.store = store
+        self.offset = offset  # file offset of EEPROM address 0
+
+    def read_u32(self, addr):
+        return _U32.unpack_from(self.store.map, self.offset + addr)[0]
+
+    def write_u32(self, addr, value):
+        _U32.pack_into(self.store.map, self.offset + addr, value)
+
+    def load_timer_value(self):
+        timer_ms = self.read_u32(TIMER_VALUE_ADDR)
+        return timer_ms if _valid_timer(timer_ms) else DEFAULT_TIMER_MS
+
+    def save_timer_value(self, timer_ms):
+        self.write_u32(TIMER_VALUE_ADDR, timer_ms)
+
+    def load_sensor_timer(self, sensor_id, port):
+        slot = sensor_slot(sensor_id, port)
+        if slot is None:
+            return DEFAULT_TIMER_MS
+        timer_ms = self.read_u32(SENSOR_TIMER_BASE_ADDR + slot * 4)
+        return timer_ms if _valid_timer(timer_ms) else DEFAULT_TIMER_MS
+
+    def save_sensor_timer(self, sensor_id, port, timer_ms):
+        """Returns False when the sensor/port has no EEPROM slot"""
+        slot = sensor_slot(sensor_id, port)
+        if slot is None:
+            return False
+        self.write_u32(SENSOR_TIMER_BASE_ADDR + slot * 4, timer_ms)
+        return True
+
+    def sensor_timers(self):
+        """{(sensor_id, port): timer_ms} for every sensor with a saved timer"""
+        values = struct.unpack_from(f">{SENSOR_SLOTS}I", self.store.map, self.offset + SENSOR_TIMER_BASE_ADDR)
+        return {divmod(slot, 10): timer_ms for slot, timer_ms in enumerate(values) if _valid_timer(timer_ms)}
+
+    def save_credentials(self, ssid, password, mqtt_server):
+        eeprom = self.store.map
+        for addr, value in ((SSID_ADDR, ssid), (PASSWORD_ADDR, password), (MQTT_SERVER_ADDR, mqtt_server)):
+            data = value.encode("utf-8")[:STRING_SIZE - 1]
+            start = self.offset + addr
+            eeprom[start:start + STRING_SIZE] = data + bytes(STRING_SIZE - len(data))
+        eeprom[self.offset + CONFIG_FLAG_ADDR] = 1
+
+    def load_credentials(self):
+        """(ssid, password, mqtt_server), or None if no config is saved"""
+        eeprom = self.store.map
+        if eeprom[self.offset + CONFIG_FLAG_ADDR] != 1:
+            return None
+        values = []
+        for addr in (SSID_ADDR, PASSWORD_ADDR, MQTT_SERVER_ADDR):
+            start = self.offset + addr
+            values.append(eeprom[start:start + STRING_SIZE].split(b"\0", 1)[0].decode("utf-8", "replace"))
+        return tuple(values)
+
+    def clear_credentials(self):
+        eeprom = self.store.map
+        for addr in (SSID_ADDR, PASSWORD_ADDR, MQTT_SERVER_ADDR):
+            start = self.offset + addr
+            eeprom[start:start + STRING_SIZE] = bytes(STRING_SIZE)
+        eeprom[self.offset + CONFIG_FLAG_ADDR] = 0
+
+
+class EepromStore:
+    """Memory-mapped file of device EEPROM images (one device or a whole fleet)"""
+
+    def __init__(self, path, capacity=1):
+        self.path = path
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        size = os.fstat(self._file.fileno()).st_size
+        records = max(size // RECORD_SIZE, capacity, 1)
+        if size < records * RECORD_SIZE:
+            self._file.truncate(records * RECORD_SIZE)
+        self.map = mmap.mmap(self._file.fileno(), records * RECORD_SIZE)
+        self.capacity = records
+        self.slots = {}  # device_id -> record index
+        for index in range(records):
+            start = index * RECORD_SIZE
+            tag = self.map[start:start + TAG_SIZE].split(b"\0", 1)[0]
+            if tag:
+                self.slots[tag.decode("ascii")] = index
+        self._next_free = max(self.slots.values(), default=-1) + 1
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, device_id):
+        return str(device_id) in self.slots
+
+    def image(self, device_id):
+        """The device's EEPROM image, allocated (blank) on first use"""
+        device_id = str(device_id)
+        index = self.slots.get(device_id)
+        if index is None:
+            tag = device_id.encode("ascii")
+            if len(tag) >= TAG_SIZE:
+                raise ValueError(f"device_id too long for the EEPROM file: {device_id}")
+            index = self._next_free
+            if index >= self.capacity:
+                self._grow(index + GROW_RECORDS)
+            start = index * RECORD_SIZE
+            self.map[start:start + TAG_SIZE] = tag + bytes(TAG_SIZE - len(tag))
+            self.slots[device_id] = index
+            self._next_free = index + 1
+        return EepromImage(self, index * RECORD_SIZE + TAG_SIZE)
+
+    def _grow(self, records):
+        self.map.resize(records * RECORD_SIZE)
+        self.capacity = records
+
+    def flush(self):
+        """Write dirty pages back to the file (EEPROM.commit)"""
+        self.map.flush()
+
+    def close(self):
+        if not self.map.closed:
+            self.map.flush()
+            self.map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+ESP32 Fleet Runner
+Hosts many simulated ESP32 devices on a single asyncio event loop, multiplexed
+over a small pool of MQTT broker connections (no per-device threads or sockets)
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from eeprom_store import EepromStore
+from esp32_simulator_complete import CONNECTS, DISCONNECTS, RECONNECTS, ESP32Simulator
+from mqtt_transport import DEFAULT_BROKER_HOST, MQTT_ERR_SUCCESS, AsyncioHelper, create_client, is_memory_broker
+from payload_codec import CODECS
+from ping_schedule import MAX_PING_GAP, PingSchedule
+from reconnect import Backoff
+from sim_logging import configure_logging, get_logger
+from sim_metrics import METRICS, MetricsServer, SnapshotWriter, client_queue_depth
+from status_coalescer import STATUS_MAX_DELAY
+from timer_scheduler import TimerScheduler
+from topic_router import TopicRouter
+from traffic_capture import TrafficRecorder
+
+# MQTT Configuration
+MQTT_BROKER = DEFAULT_BROKER_HOST  # "memory" runs the fleet against the in-process broker
+MQTT_PORT = 1883
+FIRST_DEVICE_ID = 200000
+SUBSCRIBE_BATCH = 100  # topics per SUBSCRIBE packet
+MAX_INFLIGHT = 1000  # unacknowledged QoS 1 publishes per connection (paho default is 20)
+RESUBSCRIBE_RATE = 20000  # topics/s re-subscribed after a reconnect
+FLUSH_RATE = 5000  # devices/s sending their offline queues after a reconnect
+# Per-device topics as one wildcard filter each, for the "wildcard" and "shared" subscription modes
+DEVICE_FILTERS = tuple(f"MPS/global/+/{suffix}" for suffix in ("config", "control", "reboot", "scene", "timer"))
+SUBSCRIPTION_MODES = ("device", "wildcard", "shared")
+
+log = get_logger("fleet")
+
+PUBLISH_QUEUE_DEPTH = METRICS.gauge("publish_queue_depth", "Packets queued or unacknowledged per broker connection",
+                                    ("connection",))
+TIMERS_PENDING = METRICS.gauge("timers_pending", "Timers armed on the fleet scheduler")
+FLEET_DEVICES = METRICS.gauge("fleet_devices", "Simulated devices in this process")
+PROCESS_CPU = METRICS.gauge("process_cpu_seconds", "CPU time used by this process")
+UNROUTED = METRICS.counter("unrouted_messages_total", "Inbound messages no device or handler matched")
+
+
+class FleetConnection:
+    """One broker connection shared by a group of simulated devices
+
+    subscriptions picks what the connection subscribes to:
+    - "device": each attached device's own topics (five per device)
+    - "wildcard": DEVICE_FILTERS, on connection 0 only, for the whole fleet
+    - "shared": DEVICE_FILTERS as $share/ subscriptions on every connection,
+      so the broker spreads the fleet's inbound traffic over them
+    Whichever connection a message arrives on, the fleet's router hands it to
+    the device it is for.
+    """
+
+    def __init__(self, index, broker_host, broker_port, router=None, subscriptions="device"):
+        self.index = index
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.router = router if router is not None else TopicRouter()
+        self.subscriptions = subscriptions
+        self.devices = {}  # device_id -> ESP32Simulator
+        self.connected = None  # set once every subscription is acknowledged
+        self.helper = None
+        self.unacked = {}  # mid -> future resolved by the broker's PUBACK
+        self.received = 0
+        self.published = 0
+        self._suback_pending = 0
+        self._was_connected = False
+        self.loop = None
+        self.closing = False
+        self.backoff = Backoff(initial=1.0, maximum=60.0)
+        self._reconnect_handle = None
+        self._resume_task = None
+
+        self.client = create_client(f"esp32-fleet-{os.getpid()}-{index}", broker_host, reconnect_on_failure=False)
+        self.client.username_pw_set("mps-bam100", "bam100")
+        self.client.on_connect = self.on_connect
+        self.client.on_subscribe = self.on_subscribe
+        self.client.on_publish = self.on_publish
+        self.client.on_message = self.on_message
+        self.client.on_disconnect = self.on_disconnect
+
+    def attach(self, device):
+        """Assign a device to this connection (subscribing its topics if already connected)"""
+        self.devices[device.device_id] = device
+        for topic in device.subscribe_topics:
+            self.router.add(topic, device.on_message)
+        if self.subscriptions == "device" and self.connected is not None and self.connected.is_set():
+            self.client.subscribe([(topic, 0) for topic in device.subscribe_topics])
+
+    def detach(self, device):
+        """Take a device off this connection"""
+        if self.devices.pop(device.device_id, None) is None:
+            return
+        for topic in device.subscribe_topics:
+            self.router.remove(topic, device.on_message)
+        if self.subscriptions == "device" and self.connected is not None and self.connected.is_set():
+            self.client.unsubscribe(list(device.subscribe_topics))
+
+    def subscription_topics(self):
+        if self.subscriptions == "wildcard":
+            return [(topic_filter, 0) for topic_filter in DEVICE_FILTERS] if self.index == 0 else []
+        if self.subscriptions == "shared":
+            group = f"esp32-fleet-{os.getpid()}"
+            return [(f"$share/{group}/{topic_filter}", 0) for topic_filter in DEVICE_FILTERS]
+        return [(topic, 0) for device in self.devices.values() for topic in device.subscribe_topics]
+
+    def open(self, loop):
+        """Connect using the running event loop for all socket I/O"""
+        self.connected = asyncio.Event()
+        self.loop = loop
+        if not is_memory_broker(self.broker_host):
+            self.helper = AsyncioHelper(loop, self.client)
+            self.client.max_inflight_messages_set(MAX_INFLIGHT)
+        self.client.connect(self.broker_host, self.broker_port, 60)
+
+    def on_connect(self, client, userdata, flags, rc):
+        CONNECTS.inc((rc,))
+        if rc != 0:
+            log.error("❌ Connection %s failed, return code %s", self.index, rc)
+            return
+        self.backoff.reset()
+        if self._was_connected:
+            RECONNECTS.inc()
+            log.info("✅ Connection %s back - resubscribing %s devices", self.index, len(self.devices))
+            self._resume_task = self.loop.create_task(self.resume())
+            return
+        self._was_connected = True
+        topics = self.subscription_topics()
+        batches = [topics[start:start + SUBSCRIBE_BATCH] for start in range(0, len(topics), SUBSCRIBE_BATCH)]
+        self._suback_pending = len(batches)
+        for batch in batches:
+            client.subscribe(batch)
+        log.info("✅ Connection %s up - %s devices, %s topics", self.index, len(self.devices), len(topics))
+        if not batches:
+            self.connected.set()
+
+    def on_subscribe(self, client, userdata, mid, granted_qos):
+        if self._suback_pending > 0:  # initial subscriptions; resume() tracks its own
+            self._suback_pending -= 1
+            if self._suback_pending == 0:
+                self.connected.set()
+
+    def on_disconnect(self, client, userdata, rc):
+        DISCONNECTS.inc()
+        if self._resume_task is not None:
+            self._resume_task.cancel()
+            self._resume_task = None
+        if rc != 0 and not self.closing:
+            log.warning("⚠️ Connection %s lost (rc %s)", self.index, rc)
+            self.connected.clear()
+            self.schedule_reconnect()
+
+    def schedule_reconnect(self):
+        """Next reconnect attempt after a jittered backoff, so connections do not return in lockstep"""
+        delay = self.backoff.next_delay()
+        log.info("🔄 Connection %s reconnecting in %.1fs (attempt %s)", self.index, delay, self.backoff.attempts)
+        self._reconnect_handle = self.loop.call_later(delay, self.reconnect)
+
+    def reconnect(self):
+        self._reconnect_handle = None
+        if self.closing:
+            return
+        try:
+            self.client.reconnect()
+        except OSError as e:
+            log.warning("❌ Connection %s reconnect failed: %s", self.index, e)
+            self.schedule_reconnect()
+
+    async def resume(self):
+        """After a reconnect: resubscribe in paced batches, then let devices send their offline queues
+
+        Spreading both over time keeps a broker that just restarted from taking
+        every subscription and every buffered status of the fleet at once.
+        """
+        topics = self.subscription_topics()
+        interval = SUBSCRIBE_BATCH / RESUBSCRIBE_RATE
+        for start in range(0, len(topics), SUBSCRIBE_BATCH):
+            self.client.subscribe(topics[start:start + SUBSCRIBE_BATCH])
+            await asyncio.sleep(interval)
+        self.connected.set()
+
+        flushed = 0
+        batch = max(1, FLUSH_RATE // 100)
+        for i, device in enumerate(list(self.devices.values()), start=1):
+            flushed += device.flush_offline()
+            if i % batch == 0:
+                await asyncio.sleep(batch / FLUSH_RATE)
+        self._resume_task = None
+        log.info("📤 Connection %s resumed - %s offline messages sent", self.index, flushed)
+
+    def on_publish(self, client, userdata, mid):
+        self.published += 1
+        future = self.unacked.pop(mid, None)
+        if future is not None and not future.done():
+            future.set_result(mid)
+
+    def wait_for_ack(self, info):
+        """Future resolved when the publish behind info (a MessageInfo) is acknowledged"""
+        future = asyncio.get_running_loop().create_future()
+        if info.rc != MQTT_ERR_SUCCESS:
+            future.set_exception(ConnectionError(f"publish failed, return code {info.rc}"))
+        elif info.is_published():
+            future.set_result(info.mid)
+        else:
+            self.unacked[info.mid] = future
+        return future
+
+    def on_message(self, client, userdata, msg):
+        self.received += 1
+        if not self.router.route(msg.topic, client, userdata, msg):
+            UNROUTED.inc()
+
+    def close(self):
+        self.closing = True
+        if self._reconnect_handle is not None:
+            self._reconnect_handle.cancel()
+            self._reconnect_handle = None
+        if self._resume_task is not None:
+            self._resume_task.cancel()
+            self._resume_task = None
+        self.client.disconnect()
+
+
+class FleetRunner:
+    """Runs N simulated devices over a small pool of shared broker connections"""
+
+    def __init__(self, device_count, broker_host=MQTT_BROKER, broker_port=MQTT_PORT,
+                 connections=4, first_device_id=FIRST_DEVICE_ID, ping_interval=30,
+                 per_channel_scene_status=True, boot_rate=None, eeprom_path=None, capture_path=None,
+                 ping_jitter=0.1, ping_adaptive=False, ping_max_gap=MAX_PING_GAP, ping_spread=True,
+                 subscriptions="device", codecs=(), status_window=0.0, status_max_delay=STATUS_MAX_DELAY):
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.ping_interval = ping_interval
+        # Pings are spread over the interval by device index instead of all firing together after boot
+        self.ping_schedule = PingSchedule(ping_interval, ping_jitter, ping_adaptive, ping_max_gap)
+        self.ping_spread = ping_spread
+        self.boot_rate = boot_rate  # devices announced per second (None = as fast as the broker acks)
+        self.boot_time = None
+        # One shared mmap'd EEPROM file restores every device's saved timers at once
+        self.eeprom = EepromStore(eeprom_path, capacity=device_count) if eeprom_path else None
+        self.capture = TrafficRecorder(capture_path) if capture_path else None
+        self.scheduler = TimerScheduler()
+        self.per_channel_scene_status = per_channel_scene_status
+        self.codecs = tuple(codecs)  # payload codecs each device offers besides JSON
+        self.status_window = status_window  # seconds; 0 sends every status update as it happens
+        self.status_max_delay = status_max_delay
+        # One router for the fleet: with shared subscriptions a message can arrive on any connection
+        self.router = TopicRouter()
+        self.connections = [FleetConnection(i, broker_host, broker_port, self.router, subscriptions)
+                            for i in range(max(1, connections))]
+        self.devices = []
+        self.next_device_id = first_device_id
+        for i in range(device_count):
+            self._attach_device(self.connections[i % len(self.connections)])
+        self.running = False
+        PUBLISH_QUEUE_DEPTH.set_function(
+            lambda: {(c.index,): client_queue_depth(c.client) for c in self.connections})
+        TIMERS_PENDING.set_function(lambda: {(): len(self.scheduler)})
+        FLEET_DEVICES.set_function(lambda: {(): len(self.devices)})
+        PROCESS_CPU.set_function(lambda: {(): time.process_time()})
+
+    def _attach_device(self, connection):
+        device_id = self.next_device_id
+        self.next_device_id += 1
+        device = ESP32Simulator(self.broker_host, self.broker_port,
+                                device_id=str(device_id),
+                                client=connection.client,
+                                scheduler=self.scheduler,
+                                eeprom=self.eeprom.image(device_id) if self.eeprom is not None else None,
+                                capture=self.capture)
+        device.ping_schedule = self.ping_schedule
+        device.per_channel_scene_status = self.per_channel_scene_status
+        if self.codecs:
+            device.offer_codecs(self.codecs)
+        if self.status_window:
+            device.coalesce_status(self.status_window, self.status_max_delay)
+        connection.attach(device)
+        self.devices.append(device)
+        return device
+
+    def add_device(self):
+        """Add a device to the least loaded connection; a running fleet announces it right away"""
+        connection = min(self.connections, key=lambda c: len(c.devices))
+        device = self._attach_device(connection)
+        if self.running:
+            self._announce(connection, device)
+            device.start_pings(self.ping_schedule.phase() if self.ping_spread else 0)
+        return device
+
+    def remove_device(self, device_id):
+        """Stop a device and take it off its connection; returns it (None if unknown)"""
+        device_id = str(device_id)
+        for connection in self.connections:
+            device = connection.devices.get(device_id)
+            if device is not None:
+                device.stop_timers()
+                connection.detach(device)
+                self.devices.remove(device)
+                return device
+        return None
+
+    def _announce(self, connection, device):
+        """Publish a device's discovery; the future resolves on its PUBACK, which sets discovery_sent"""
+        def acked(ack):
+            if not ack.cancelled() and ack.exception() is None:
+                device.discovery_sent = True
+        ack = connection.wait_for_ack(device.publish_discovery(qos=1))
+        ack.add_done_callback(acked)
+        return ack
+
+    async def start(self, connect_timeout=30, ack_timeout=30):
+        """Open every connection, then announce each device and wait for the discovery PUBACKs"""
+        loop = asyncio.get_running_loop()
+        log.info("🔌 Connecting %s connections to %s:%s", len(self.connections), self.broker_host, self.broker_port)
+        for connection in self.connections:
+            connection.open(loop)
+        await asyncio.wait_for(
+            asyncio.gather(*(connection.connected.wait() for connection in self.connections)),
+            connect_timeout,
+        )
+
+        log.info("📢 Sending discovery for %s devices...", len(self.devices))
+        started = loop.time()
+        acks = []
+        connection_of = {id(connection.client): connection for connection in self.connections}
+        for i, device in enumerate(self.devices):
+            if self.boot_rate:
+                ahead = started + i / self.boot_rate - loop.time()
+                if ahead > 0:
+                    await asyncio.sleep(ahead)  # ramp: spread announcements over time
+            elif i % 500 == 499:
+                await asyncio.sleep(0)  # let the writers drain
+            acks.append(self._announce(connection_of[id(device.client)], device))
+        if acks:
+            done, pending = await asyncio.wait(acks, timeout=ack_timeout)
+            failed = len(pending) + sum(1 for ack in done if ack.exception() is not None)
+            if failed:
+                log.warning("⚠️ %s of %s discovery messages were not acknowledged", failed, len(acks))
+        self.boot_time = loop.time() - started
+        log.info("✅ %s devices booted in %.2fs", len(self.devices), self.boot_time)
+
+        # One shared scheduler replaces every device's timer thread
+        self.scheduler.attach_loop(loop)
+        count = len(self.devices)
+        for i, device in enumerate(self.devices):
+            device.start_pings(self.ping_schedule.phase(i, count) if self.ping_spread else 0)
+        self.running = True
+
+    async def run(self, duration=None):
+        """Start the fleet and keep it running for duration seconds (forever if None)"""
+        await self.start()
+        try:
+            if duration is None:
+                await asyncio.Event().wait()
+            else:
+                await asyncio.sleep(duration)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        self.scheduler.stop()
+        for connection in self.connections:
+            connection.close()
+        if self.eeprom is not None:
+            self.eeprom.flush()
+        if self.capture is not None:
+            self.capture.close()
+            log.info("📼 %s messages captured to %s", self.capture.messages, self.capture.path)
+        log.info("🔌 Fleet stopped (%s devices)", len(self.devices))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fleet of simulated ESP32 devices")
+    parser.add_argument("--devices", type=int, default=100, help="number of simulated devices")
+    parser.add_argument("--connections", type=int, default=4, help="broker connections shared by the fleet")
+    parser.add_argument("--host", default=MQTT_BROKER, help="MQTT broker host")
+    parser.add_argument("--port", type=int, default=MQTT_PORT, help="MQTT broker port")
+    parser.add_argument("--first-id", type=int, default=FIRST_DEVICE_ID, help="device_id of the first device")
+    parser.add_argument("--aggregate-scene-status", action="store_true",
+                        help="send one aggregated scene status instead of one status per scene channel")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG logs every message; WARNING keeps hot paths silent")
+    parser.add_argument("--log-json", default=None, help="also write JSON-lines logs to this file")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run (default: forever)")
+    parser.add_argument("--boot-rate", type=float, default=None,
+                        help="devices booted per second (default: as fast as the broker acknowledges)")
+    parser.add_argument("--eeprom", default=None, help="persist device timers in this shared EEPROM image file")
+    parser.add_argument("--capture", default=None, help="record every message in and out to this capture file")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics (and /metrics.json)")
+    parser.add_argument("--metrics-json", default=None, help="append a JSON metrics snapshot to this file periodically")
+    parser.add_argument("--subscriptions", choices=SUBSCRIPTION_MODES, default="device",
+                        help="per-device topics, fleet-wide wildcards on one connection, or $share/ wildcards on all")
+    parser.add_argument("--offer-codec", dest="codecs", action="append", default=[],
+                        choices=[name for name in CODECS if name != "json"],
+                        help="offer this binary payload codec in discovery (used if the backend accepts it)")
+    parser.add_argument("--status-window", type=float, default=0.0,
+                        help="seconds to collapse brightness status bursts per channel, e.g. 0.05 (0 = off)")
+    parser.add_argument("--status-max-delay", type=float, default=STATUS_MAX_DELAY,
+                        help="longest a status is held while a burst goes on")
+    parser.add_argument("--ping-interval", type=float, default=30, help="seconds between session pings")
+    parser.add_argument("--ping-jitter", type=float, default=0.1, help="random +/- fraction of the ping interval")
+    parser.add_argument("--ping-adaptive", action="store_true",
+                        help="put pings off (up to --ping-max-gap) while a device is sending status")
+    parser.add_argument("--ping-max-gap", type=float, default=MAX_PING_GAP,
+                        help="longest time between two pings of a device (keep under the backend's 60s timeout)")
+    parser.add_argument("--no-ping-spread", dest="ping_spread", action="store_false",
+                        help="send every device's first ping right after boot instead of spreading them")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="seconds between JSON snapshots")
+    args = parser.parse_args()
+    configure_logging(getattr(logging, args.log_level.upper()), json_path=args.log_json)
+
+    print("🧪 ESP32 Fleet Simulator")
+    print("=" * 50)
+    fleet = FleetRunner(args.devices, args.host, args.port, args.connections, args.first_id,
+                        per_channel_scene_status=not args.aggregate_scene_status, boot_rate=args.boot_rate,
+                        eeprom_path=args.eeprom, capture_path=args.capture, ping_interval=args.ping_interval,
+                        ping_jitter=args.ping_jitter, ping_adaptive=args.ping_adaptive,
+                        ping_max_gap=args.ping_max_gap, ping_spread=args.ping_spread,
+                        subscriptions=args.subscriptions, codecs=args.codecs,
+                        status_window=args.status_window, status_max_delay=args.status_max_delay)
+    server = MetricsServer(port=args.metrics_port).start() if args.metrics_port is not None else None
+    if server is not None:
+        print(f"📊 Metrics on http://{server.host}:{server.port}/metrics")
+    snapshots = SnapshotWriter(args.metrics_json, args.metrics_interval).start() if args.metrics_json else None
+    try:
+        asyncio.run(fleet.run(args.duration))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if snapshots is not None:
+            snapshots.stop()
+        if server is not None:
+            server.stop()
+    print("👋 Goodbye!")
+
+
+if __name__ == "__main__":
+    main()
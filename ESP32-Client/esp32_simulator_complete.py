@@ -4,38 +4,112 @@ Complete ESP32 PIR Motion Detection Simulator
 This simulates the full ESP32 behavior including boot, discovery, and interactive control
 """
 
-import paho.mqtt.client as mqtt
-import json
-import time
+import logging
+import os
 import threading
-from datetime import datetime
+
+from channel_state import (
+    LED_INDEX, LED_NAMES, SHADE_CLOSED, SHADE_INDEX, SHADE_NAMES, SHADE_OPEN,
+    SHADE_STATE_NAMES, SHADE_STOPPED, ChannelState, LedStatesView, ShadeStatesView,
+    clamp_brightness, led_mask, mask_channels,
+)
+from command_dispatcher import CommandDispatcher
+from eeprom_store import EepromStore
+from mqtt_transport import DEFAULT_BROKER_HOST, MQTT_ERR_NO_CONN, create_client
+from payload_codec import CODECS, JSON, decode_payload
+from payload_templates import PayloadTemplates
+from ping_schedule import PingSchedule
+from pir_sensor import PirSensor
+from reconnect import Backoff, OfflineQueue
+from sim_clock import REAL_CLOCK
+from sim_logging import configure_logging, device_logger
+from sim_metrics import METRICS, MetricsServer, perf_counter
+from status_coalescer import STATUS_MAX_DELAY, StatusCoalescer
+from traffic_capture import INBOUND, OUTBOUND, TrafficRecorder
+
+SHADE_COMMANDS = {
+    113: (SHADE_OPEN, "OPENED"),
+    114: (SHADE_CLOSED, "CLOSED"),
+    111: (SHADE_STOPPED, "STOPPED"),
+}
+
+# Instrumentation (sim_metrics); labelled by topic suffix, not full topic, so a fleet stays low-cardinality
+MESSAGES_RECEIVED = METRICS.counter("messages_received_total", "Inbound messages by topic suffix and cmd", ("topic", "cmd"))
+MESSAGES_PUBLISHED = METRICS.counter("messages_published_total", "Outbound messages by topic suffix and cmd", ("topic", "cmd"))
+DISPATCH_SECONDS = METRICS.histogram("dispatch_seconds", "Inbound message decode + handler time", ("topic", "cmd"))
+PUBLISH_SECONDS = METRICS.histogram("publish_seconds", "Time spent inside client.publish", ("topic",))
+CONNECTS = METRICS.counter("connects_total", "CONNACKs received (by return code)", ("rc",))
+RECONNECTS = METRICS.counter("reconnects_total", "Successful connects after an earlier one")
+DISCONNECTS = METRICS.counter("disconnects_total", "Broker connections lost or closed")
+OFFLINE_QUEUED = METRICS.counter("offline_queued_total", "Publishes queued while disconnected")
+OFFLINE_DISCARDED = METRICS.counter("offline_discarded_total", "Queued publishes superseded or dropped", ("reason",))
+OFFLINE_FLUSHED = METRICS.counter("offline_flushed_total", "Queued publishes sent after reconnecting")
+PINGS_DEFERRED = METRICS.counter("pings_deferred_total", "Session pings put off because a status went out recently")
+
+def sensor_address_ok(sensor_id, port):
+    """Payload sensor_id/port usable as a sensor key (ints only, as the firmware's uint8_t fields)"""
+    return type(sensor_id) is int and type(port) is int
+
 
 class ESP32Simulator:
-    def __init__(self, broker_host="192.168.29.128", broker_port=1883):
+    def __init__(self, broker_host=DEFAULT_BROKER_HOST, broker_port=1883, device_id="123456", client=None, scheduler=None, clock=None, eeprom=None, capture=None):
         self.broker_host = broker_host
         self.broker_port = broker_port
-        self.device_id = "123456"
+        self.device_id = device_id
+        self.clock = clock if clock is not None else REAL_CLOCK
+        self.log = device_logger(device_id)
         self.sensor_id = 2
         self.port = 1
-        self.sense_timeout = 30 * 1000  # 30 seconds
-        self.timer_active = False
-        self.first_motion_sent = False
-        self.timer_start = 0
-        self.motion_detected = False
+        self.ping_schedule = PingSchedule()  # 30 s pings; a fleet shares one with phase spread and jitter
+        self.last_ping = None  # clock time of the last session ping
+        self.last_status = None  # clock time of the last status publish
         self.discovery_sent = False
         self.config_received = False
-        
-        # Multi-sensor support
-        self.sensor_timers = {}  # Store timers for different sensors
+        self.boot_timeout = 10  # seconds to wait for CONNACK / discovery PUBACK
+        self.connected = threading.Event()
+        self.connect_rc = None
+        self.connect_attempts = 6  # boot connect attempts before giving up
+        self.discovery_attempts = 3  # boot discovery publishes before carrying on without a PUBACK
+        self.auto_reconnect = True  # reconnect with jittered backoff after losing the broker
+        self.backoff = Backoff(initial=1.0, maximum=60.0)
+        self.reconnect_timer = None
+        
+        # QoS 0 publishes made while disconnected wait here, latest state per channel
+        self.offline = None  # OfflineQueue, created on first use
+        self.offline_limit = 64
+        self._offline_lock = threading.Lock()
+        
+        # Multi-sensor support: one PIR state machine per (sensor_id, port)
         self.current_sensor_id = 2  # Default sensor ID
         self.current_port = 1      # Default port
-        
-        # MQTT client setup
-        self.client = mqtt.Client(client_id=self.device_id)
-        self.client.username_pw_set("mps-bam100", "bam100")
-        self.client.on_connect = self.on_connect
-        self.client.on_publish = self.on_publish
-        self.client.on_message = self.on_message
+        self.sensors = {}
+        self.pir = self.sensor(self.current_sensor_id, self.current_port)
+        
+        # Emulated EEPROM (eeprom_store.EepromImage) keeps timers across restarts
+        self.eeprom = eeprom
+        if eeprom is not None:
+            self.restore_from_eeprom()
+        
+        # Traffic capture (traffic_capture.TrafficRecorder, shared by a fleet)
+        self.capture = capture
+        
+        # Timers (a fleet shares one scheduler across all its devices)
+        self.scheduler = scheduler if scheduler is not None else self.clock.make_scheduler()
+        self.ping_timer = None
+        
+        # Command dispatch table (shared until a device registers its own commands)
+        self.dispatcher = DEFAULT_DISPATCHER
+        
+        # MQTT client setup (a fleet passes in a shared connection and routes messages itself)
+        self.shared_client = client is not None
+        if client is None:
+            client = create_client(self.device_id, broker_host, reconnect_on_failure=False)
+            client.username_pw_set("mps-bam100", "bam100")
+            client.on_connect = self.on_connect
+            client.on_publish = self.on_publish
+            client.on_message = self.on_message
+            client.on_disconnect = self.on_disconnect
+        self.client = client
         
         # Topics
         self.discovery_topic = "MPS/global/discovery"
@@ -46,469 +120,560 @@ class ESP32Simulator:
         self.timer_topic = f"MPS/global/{self.device_id}/timer"
         self.status_topic = f"MPS/global/UP/{self.device_id}/status"
         self.ping_topic = "MPS/global/sessionPing"
-        
-        # LED and Shade states (simulating hardware)
-        self.led_states = {}
-        self.shade_states = {}
-        for i in range(12):
-            self.led_states[f"LED{i+1}"] = {"state": "off", "brightness": 0}
-        for i in range(4):
-            self.shade_states[f"SHADE{i+1}"] = {"state": "closed"}
-        
+        self.payloads = PayloadTemplates(self.device_id)
+        self.codec = JSON  # outbound encoding; inbound payloads are recognised either way
+        self.codecs_offered = ()
+        self.subscribe_topics = [
+            self.config_topic,
+            self.control_topic,
+            self.reboot_topic,
+            self.scene_topic,
+            self.timer_topic,
+        ]
+        
+        # LED and Shade states (simulating hardware), packed by channel index
+        self.channels = ChannelState()
+        self.per_channel_scene_status = True  # False: one aggregated scene status (backends must opt in)
+        self.status_coalescer = None  # StatusCoalescer once coalesce_status() enables it
+        
+    ping_interval = property(lambda self: self.ping_schedule.interval,
+                             lambda self, seconds: setattr(self.ping_schedule, "interval", seconds))
+    
+    @property
+    def led_states(self):
+        """Dict-style view of the LED channels, e.g. led_states["LED1"]["state"]"""
+        return LedStatesView(self.channels)
+    
+    # The default sensor's state, as single-sensor code expects to find it
+    sense_timeout = property(lambda self: self.pir.sense_timeout)
+    timer_active = property(lambda self: self.pir.timer_active)
+    first_motion_sent = property(lambda self: self.pir.first_motion_sent)
+    timer_start = property(lambda self: self.pir.timer_start)
+    pir_timer = property(lambda self: self.pir.timer)
+    
+    @property
+    def motion_detected(self):
+        """Motion on any sensor"""
+        return any(sensor.motion_detected for sensor in self.sensors.values())
+    
+    @property
+    def sensor_timers(self):
+        """Timer per "sensor_port" key in ms, e.g. sensor_timers["2_1"]"""
+        return {f"{sensor_id}_{port}": sensor.sense_timeout for (sensor_id, port), sensor in self.sensors.items()}
+    
+    def sensor(self, sensor_id, port):
+        """The PIR sensor on sensor_id/port, added on first use"""
+        sensor = self.sensors.get((sensor_id, port))
+        if sensor is None:
+            sensor = self.sensors[(sensor_id, port)] = PirSensor(self, sensor_id, port)
+        return sensor
+    
+    @property
+    def shade_states(self):
+        """Dict-style view of the shade channels, e.g. shade_states["SHADE1"]["state"]"""
+        return ShadeStatesView(self.channels)
+    
     def on_connect(self, client, userdata, flags, rc):
+        CONNECTS.inc((rc,))
+        reconnected = rc == 0 and self.connect_rc == 0
+        if reconnected:
+            RECONNECTS.inc()
+        self.connect_rc = rc
         if rc == 0:
-            print("✅ Connected to MQTT broker")
-            # Subscribe to topics
-            self.client.subscribe(self.config_topic)
-            self.client.subscribe(self.control_topic)
-            self.client.subscribe(self.reboot_topic)
-            self.client.subscribe(self.scene_topic)
-            self.client.subscribe(self.timer_topic)
-            print(f"📡 Subscribed to: {self.config_topic}")
-            print(f"📡 Subscribed to: {self.control_topic}")
-            print(f"📡 Subscribed to: {self.reboot_topic}")
-            print(f"📡 Subscribed to: {self.scene_topic}")
-            print(f"📡 Subscribed to: {self.timer_topic}")
+            self.log.info("✅ Connected to MQTT broker")
+            self.backoff.reset()
+            # Subscribe to all topics in one SUBSCRIBE packet
+            self.client.subscribe([(topic, 0) for topic in self.subscribe_topics])
+            self.log.debug("📡 Subscribed to: %s", ", ".join(self.subscribe_topics))
+            if reconnected:
+                sent = self.flush_offline()
+                if sent:
+                    self.log.info("📤 Sent %s messages queued while offline", sent)
         else:
-            print(f"❌ Failed to connect, return code {rc}")
+            self.log.error("❌ Failed to connect, return code %s", rc)
+        self.connected.set()  # CONNACK received, boot can continue
     
     def on_publish(self, client, userdata, mid):
-        print(f"📤 Message published (mid: {mid})")
+        self.log.debug("📤 Message published (mid: %s)", mid)
+    
+    def on_disconnect(self, client, userdata, rc):
+        DISCONNECTS.inc()
+        self.connected.clear()
+        if rc == 0 or not self.auto_reconnect:
+            self.log.info("🔌 Disconnected from MQTT broker (rc %s)", rc)
+            return
+        self.log.warning("⚠️ Lost connection to MQTT broker (rc %s)", rc)
+        self.schedule_reconnect()
+    
+    def schedule_reconnect(self):
+        """Arm the next reconnect attempt after a jittered backoff delay"""
+        delay = self.backoff.next_delay()
+        self.log.info("🔄 Reconnecting in %.1fs (attempt %s)", delay, self.backoff.attempts)
+        if self.reconnect_timer is not None:
+            self.reconnect_timer.cancel()
+        self.reconnect_timer = self.scheduler.call_later(delay, self.reconnect)
+    
+    def reconnect(self):
+        """Scheduler callback: one reconnect attempt, rescheduled with a longer backoff on failure"""
+        self.reconnect_timer = None
+        if not self.auto_reconnect:
+            return
+        try:
+            self.client.loop_stop()  # the old network thread ends once the connection is lost
+            self.client.reconnect()
+            self.client.loop_start()
+        except OSError as e:
+            self.log.warning("❌ Reconnect failed: %s", e)
+            self.schedule_reconnect()
     
     def on_message(self, client, userdata, msg):
+        started = perf_counter()
         topic = msg.topic
-        payload = msg.payload.decode()
-        print(f"📩 Received on {topic}: {payload}")
+        if self.capture is not None:
+            self.capture.record(INBOUND, topic, msg.payload)
+        suffix = topic.rpartition("/")[2]
         
         try:
-            data = json.loads(payload)
-            
-            if topic.endswith("/config"):
-                self.handle_config_message(data)
-            elif topic.endswith("/control"):
-                self.handle_control_message(data)
-            elif topic.endswith("/scene"):
-                print("🎨 Received scene command")
-                self.process_scene_command(data)
-            elif topic.endswith("/reboot"):
-                print("🔄 Received reboot command")
-                self.handle_reboot_command(data)
-            elif topic.endswith("/timer"):
-                print("⏰ Received timer configuration")
-                self.handle_timer_command(data)
-                
-        except json.JSONDecodeError:
-            print("❌ Invalid JSON received")
+            data = decode_payload(msg.payload)
+        except ValueError:
+            self.log.warning("❌ Invalid payload received")
+            MESSAGES_RECEIVED.inc((suffix, "invalid"))
+            return
+        self.log.debug("📩 Received on %s: %s", topic, data)
+        
+        cmd = None
+        if isinstance(data, dict):
+            cmd = data.get("cmd")
+            if not isinstance(cmd, int):
+                cmd = None
+            self.dispatcher.dispatch(self, suffix, data)
+        labels = (suffix, self.dispatcher.command_label(cmd))
+        MESSAGES_RECEIVED.inc(labels)
+        DISPATCH_SECONDS.observe(perf_counter() - started, labels)
+    
+    def publish(self, topic, payload, cmd=None, qos=0, retain=False, key=None):
+        """client.publish, counted per topic suffix/cmd and timed
+
+        A QoS 0 publish made while disconnected is queued for the reconnect;
+        a later publish with the same key (e.g. the same channel) replaces it.
+        QoS 1 messages are kept and resent by the MQTT client itself.
+        """
+        suffix = topic.rpartition("/")[2]
+        started = perf_counter()
+        result = self.client.publish(topic, payload, qos=qos, retain=retain)
+        PUBLISH_SECONDS.observe(perf_counter() - started, (suffix,))
+        MESSAGES_PUBLISHED.inc((suffix, cmd))
+        if self.capture is not None:
+            self.capture.record(OUTBOUND, topic, payload)
+        if topic == self.status_topic:
+            self.last_status = self.clock.time()
+        if result.rc == MQTT_ERR_NO_CONN and qos == 0:
+            self.queue_offline(topic, payload, qos, retain, key)
+        return result
+    
+    def queue_offline(self, topic, payload, qos=0, retain=False, key=None):
+        with self._offline_lock:
+            if self.offline is None:
+                self.offline = OfflineQueue(self.offline_limit)
+            coalesced, dropped = self.offline.coalesced, self.offline.dropped
+            self.offline.put(topic, payload, qos, retain, key)
+            OFFLINE_QUEUED.inc()
+            if self.offline.coalesced != coalesced:
+                OFFLINE_DISCARDED.inc(("superseded",))
+            if self.offline.dropped != dropped:
+                OFFLINE_DISCARDED.inc(("overflow",))
+    
+    def flush_offline(self):
+        """Send what was queued while disconnected, oldest first; returns how many were sent"""
+        sent = 0
+        with self._offline_lock:
+            queue = self.offline
+            while queue:
+                topic, payload, qos, retain = queue.peek()
+                if self.client.publish(topic, payload, qos=qos, retain=retain).rc == MQTT_ERR_NO_CONN:
+                    break  # lost the connection again; the rest waits for the next reconnect
+                queue.pop()
+                sent += 1
+        if sent:
+            OFFLINE_FLUSHED.inc(amount=sent)
+        return sent
+    
+    def register_command(self, suffix, handler, ch_t=None, cmd=None, channel=False):
+        """Add a command handler(device, data, channel) for this device only"""
+        if self.dispatcher is DEFAULT_DISPATCHER:
+            self.dispatcher = DEFAULT_DISPATCHER.copy()
+        self.dispatcher.register(suffix, handler, ch_t, cmd, channel)
     
-    def handle_config_message(self, data):
+    def handle_config_message(self, data, channel=None):
         """Handle config request from MQTT"""
-        print("⚙️ Config request received")
+        self.log.debug("⚙️ Config request received")
         if data.get("cmd") == 106 and data.get("cmd_m") == "config":
             self.send_config_response()
             self.config_received = True
-            print("✅ Config response sent - device ready for motion detection")
-    
-    def handle_control_message(self, data):
-        """Handle control commands"""
-        print(f"🎮 Control command: {data}")
-        
-        ch_type = data.get("ch_t", "")
-        ch_addr = data.get("ch_addr", "")
-        cmd = data.get("cmd", 0)
-        cmd_m = data.get("cmd_m", "")
-        
-        print(f"📋 Type: {ch_type}, Address: {ch_addr}, Cmd: {cmd}")
-        
-        if ch_type == "LED":
-            print("💡 Processing LED command...")
-            self.process_led_command(data)
-        elif ch_type == "SHADE":
-            print("🪟 Processing Shade command...")
-            self.process_shade_command(data)
-    
-    def process_led_command(self, command):
-        """Process LED control commands"""
-        led_addr = command.get("ch_addr", "")
-        cmd = command.get("cmd", 0)
+            self.log.info("✅ Config response sent - device ready for motion detection")
+            codec = data.get("codec")
+            if codec in self.codecs_offered and codec != self.codec.name:
+                self.use_codec(codec)
+    
+    def offer_codecs(self, names):
+        """Advertise payload codecs (payload_codec.CODECS) in the discovery message"""
+        self.codecs_offered = tuple(name for name in names if name in CODECS)
+        self.payloads = self.codec.templates(self.device_id, codecs=self.codecs_offered)
+    
+    def use_codec(self, name):
+        """Encode outbound payloads with the codec the backend picked"""
+        self.codec = CODECS[name]
+        self.payloads = self.codec.templates(self.device_id, codecs=self.codecs_offered)
+        self.log.info("🗜️ Payload codec: %s", name)
+    
+    def set_led_power(self, command, channel):
+        """LED cmd 104: LED_ON / LED_OFF"""
+        led_addr = LED_NAMES[channel]
+        on = command.get("cmd_m") == "LED_ON"
+        state = "on" if on else "off"
+        self.channels.set_led(channel, on, 100 if on else 0)
+        self.send_status_update(led_addr, state)
+        self.log.info("💡 %s: %s", led_addr, state.upper())
+    
+    def set_led_brightness(self, command, channel):
+        """LED cmd 102: brightness 0-100"""
+        led_addr = LED_NAMES[channel]
         cmd_m = command.get("cmd_m", "")
-        
-        print(f"🔍 LED Command Details:")
-        print(f"   Address: {led_addr}")
-        print(f"   Command: {cmd}")
-        print(f"   Action: {cmd_m}")
-        
-        if led_addr == "LED0":
-            # Built-in LED
-            if cmd == 104:
-                state = "on" if cmd_m == "LED_ON" else "off"
-                self.led_states["LED0"] = {"state": state, "brightness": 100 if state == "on" else 0}
-                self.send_status_update("LED0", state)
-                print(f"💡 LED0: {state.upper()}")
-            elif cmd == 102:
-                brightness = int(cmd_m) if isinstance(cmd_m, (int, str)) and str(cmd_m).isdigit() else 0
-                self.led_states["LED0"] = {"state": "on" if brightness > 0 else "off", "brightness": brightness}
-                self.send_status_update("LED0", f"{brightness}%")
-                print(f"💡 LED0: Brightness {brightness}%")
-        else:
-            # Regular LEDs (LED1-LED12)
-            if led_addr.startswith("LED"):
-                led_num = led_addr[3:]
-                if led_num.isdigit():
-                    led_index = int(led_num)
-                    if 1 <= led_index <= 12:
-                        if cmd == 104:
-                            state = "on" if cmd_m == "LED_ON" else "off"
-                            self.led_states[led_addr] = {"state": state, "brightness": 100 if state == "on" else 0}
-                            self.send_status_update(led_addr, state)
-                            print(f"💡 {led_addr}: {state.upper()}")
-                        elif cmd == 102:
-                            brightness = int(cmd_m) if isinstance(cmd_m, (int, str)) and str(cmd_m).isdigit() else 0
-                            self.led_states[led_addr] = {"state": "on" if brightness > 0 else "off", "brightness": brightness}
-                            self.send_status_update(led_addr, f"{brightness}%")
-                            print(f"💡 {led_addr}: Brightness {brightness}%")
-                    else:
-                        print(f"❌ Invalid LED index: {led_index}")
-    
-    def process_shade_command(self, command):
-        """Process Shade control commands"""
-        shade_addr = command.get("ch_addr", "")
-        cmd = command.get("cmd", 0)
-        
-        print(f"🔍 Shade Command Details:")
-        print(f"   Address: {shade_addr}")
-        print(f"   Command: {cmd}")
-        
-        if shade_addr.startswith("SHADE"):
-            shade_num = shade_addr[5:]
-            if shade_num.isdigit():
-                shade_index = int(shade_num)
-                if 1 <= shade_index <= 4:
-                    if cmd == 113:  # Open
-                        self.shade_states[shade_addr] = {"state": "open"}
-                        self.send_status_update(shade_addr, "open")
-                        print(f"🪟 {shade_addr}: OPENED")
-                    elif cmd == 114:  # Close
-                        self.shade_states[shade_addr] = {"state": "closed"}
-                        self.send_status_update(shade_addr, "closed")
-                        print(f"🪟 {shade_addr}: CLOSED")
-                    elif cmd == 111:  # Stop
-                        self.shade_states[shade_addr] = {"state": "stopped"}
-                        self.send_status_update(shade_addr, "stopped")
-                        print(f"🪟 {shade_addr}: STOPPED")
-    
-    def process_scene_command(self, command):
-        """Process scene commands"""
-        print("🎨 Processing Scene Command...")
+        brightness = clamp_brightness(cmd_m) if isinstance(cmd_m, (int, str)) and str(cmd_m).isdigit() else 0
+        self.channels.set_led(channel, brightness > 0, brightness)
+        self.send_status_update(led_addr, f"{brightness}%")
+        self.log.info("💡 %s: Brightness %s%%", led_addr, brightness)
+    
+    def set_shade_state(self, command, channel):
+        """SHADE cmd 113 (open), 114 (close), 111 (stop)"""
+        shade_addr = SHADE_NAMES[channel]
+        state, label = SHADE_COMMANDS[command["cmd"]]
+        self.channels.set_shade(channel, state)
+        self.send_status_update(shade_addr, SHADE_STATE_NAMES[state])
+        self.log.info("🪟 %s: %s", shade_addr, label)
+    
+    def process_scene_command(self, command, channel=None):
+        """Process scene commands as one masked update over the LED channels"""
+        self.log.debug("🎨 Received scene command")
         cmd_m = command.get("cmd_m")
         channels = command.get("ch_addr", [])
+        if not isinstance(channels, list):
+            channels = []
+        
+        self.log.debug("📋 Scene Command Details: %s channels", len(channels))
         
-        print(f"📋 Scene Command Details:")
-        print(f"   Channels: {len(channels)}")
-        
-        if isinstance(cmd_m, str):
-            action = cmd_m
-            print(f"   Action: {action}")
-            if action in ["LED_ON", "LED_OFF"]:
-                for ch in channels:
-                    if isinstance(ch, int) and 1 <= ch <= 12:
-                        led_addr = f"LED{ch}"
-                        state = "on" if action == "LED_ON" else "off"
-                        self.led_states[led_addr] = {"state": state, "brightness": 100 if state == "on" else 0}
-                        self.send_status_update(led_addr, state)
-                        print(f"💡 {led_addr}: {state.upper()}")
-        elif isinstance(cmd_m, dict):
-            if "LED_BRIGHTNESS" in cmd_m:
-                brightness = cmd_m["LED_BRIGHTNESS"]
-                print(f"   Brightness: {brightness}%")
-                for ch in channels:
-                    if isinstance(ch, int) and 1 <= ch <= 12:
-                        led_addr = f"LED{ch}"
-                        self.led_states[led_addr] = {"state": "on", "brightness": brightness}
-                        self.send_status_update(led_addr, f"{brightness}%")
-                        print(f"💡 {led_addr}: Brightness {brightness}%")
+        if isinstance(cmd_m, str) and cmd_m in ("LED_ON", "LED_OFF"):
+            self.log.debug("   Action: %s", cmd_m)
+            on = cmd_m == "LED_ON"
+            brightness = 100 if on else 0
+            status = "on" if on else "off"
+        elif isinstance(cmd_m, dict) and "LED_BRIGHTNESS" in cmd_m:
+            try:
+                brightness = clamp_brightness(cmd_m["LED_BRIGHTNESS"])
+            except (TypeError, ValueError):
+                self.log.warning("❌ Invalid scene brightness: %s", cmd_m["LED_BRIGHTNESS"])
+                return
+            self.log.debug("   Brightness: %s%%", brightness)
+            on = True
+            status = f"{brightness}%"
+        else:
+            return
+        
+        mask = led_mask(channels)
+        if not mask:
+            return
+        self.channels.set_leds(mask, on, brightness)
+        self.send_scene_status(mask, status)
+    
+    def send_scene_status(self, mask, status):
+        """Report a scene: one status per channel, or one aggregated message when opted in"""
+        channels = mask_channels(mask)
+        if self.per_channel_scene_status:
+            for ch in channels:
+                self.send_status_update(LED_NAMES[ch], status)
+            return
+        
+        if self.status_coalescer is not None:
+            for ch in channels:
+                self.status_coalescer.superseded(LED_NAMES[ch], status)
+        payload = self.payloads.scene_status(channels, status)
+        self.publish(self.status_topic, payload, key=("scene", mask))
+        self.log.debug("📤 Sent Scene Status: %s", payload)
+    
+    def coalesce_status(self, window, max_delay=STATUS_MAX_DELAY):
+        """Collapse bursts of brightness statuses per channel (window 0 turns it off)"""
+        if self.status_coalescer is not None:
+            self.status_coalescer.flush()
+        self.status_coalescer = None
+        if window:
+            self.status_coalescer = StatusCoalescer(self.publish_status_update, self.scheduler, self.clock,
+                                                    window, max_delay)
     
     def send_status_update(self, channel, status):
-        """Send status update for LED/Shade"""
-        payload = {
-            "device_id": self.device_id,
-            "ch_t": "LED" if channel.startswith("LED") else "SHADE",
-            "ch_addr": channel,
-            "status": status
-        }
-        
-        self.client.publish(self.status_topic, json.dumps(payload))
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        print(f"{timestamp} -> 📤 Sent Status Update: {json.dumps(payload)}")
-    
-    def handle_reboot_command(self, data):
+        """Send status update for LED/Shade (held briefly if status coalescing is on)"""
+        if self.status_coalescer is not None:
+            self.status_coalescer.submit(channel, status)
+        else:
+            self.publish_status_update(channel, status)
+    
+    def publish_status_update(self, channel, status):
+        payload = self.payloads.status_update("LED" if channel.startswith("LED") else "SHADE", channel, status)
+        self.publish(self.status_topic, payload, key=("status", channel))
+        self.log.debug("📤 Sent Status Update: %s", payload)
+    
+    def handle_reboot_command(self, data, channel=None):
         """Handle reboot command"""
+        self.log.debug("🔄 Received reboot command")
         if data.get("deviceId") == "reboot":
-            print("🔄 Rebooting ESP32...")
-            print("⚠️ Simulator will continue running (real ESP32 would restart)")
+            self.log.info("🔄 Rebooting ESP32...")
+            self.log.info("⚠️ Simulator will continue running (real ESP32 would restart)")
     
-    def handle_timer_command(self, data):
-        """Handle timer configuration commands"""
-        cmd = data.get("cmd", 0)
+    def set_sensor_timer(self, data, channel=None):
+        """Timer cmd 200: set the timer value for a sensor/port"""
+        self.log.debug("⏰ Received timer configuration")
+        timer_value = data.get("timer_value", 0)
+        sensor_id = data.get("sensor_id", self.current_sensor_id)
+        port = data.get("port", self.current_port)
+        
+        if not sensor_address_ok(sensor_id, port):
+            self.log.warning("❌ Invalid sensor_id/port: %r/%r", sensor_id, port)
+            error_response = self.payloads.timer_error(sensor_id, port, self.sense_timeout / 1000,
+                                                       "Invalid sensor_id or port. Must be integers")
+            self.publish(self.status_topic, error_response, 201)
+            return
         
-        if cmd == 200:  # Set timer value
-            timer_value = data.get("timer_value", 0)
-            sensor_id = data.get("sensor_id", self.current_sensor_id)
-            port = data.get("port", self.current_port)
-            
-            if 5 <= timer_value <= 3600:
-                # Store timer for this sensor/port combination
-                sensor_key = f"{sensor_id}_{port}"
-                self.sensor_timers[sensor_key] = timer_value * 1000
-                
-                # Update current sensor if it matches
-                if sensor_id == self.current_sensor_id and port == self.current_port:
-                    self.sense_timeout = timer_value * 1000
-                
-                print(f"✅ Sensor timer updated - ID:{sensor_id} Port:{port} Timer:{timer_value}s")
-                
-                # Send confirmation
-                response = {
-                    "device_id": self.device_id,
-                    "ch_t": "TIMER",
-                    "ch_addr": "TIMER_CONFIG",
-                    "cmd": 201,
-                    "sensor_id": sensor_id,
-                    "port": port,
-                    "timer_value": timer_value,
-                    "status": "success"
-                }
-                self.client.publish(self.status_topic, json.dumps(response))
-                print(f"📤 Sent timer confirmation: {json.dumps(response)}")
+        if type(timer_value) in (int, float) and 5 <= timer_value <= 3600:
+            # Each sensor/port runs its own timer; a running one moves to the new deadline
+            sensor = self.sensor(sensor_id, port)
+            if sensor is self.pir:
+                self.set_sense_timeout(timer_value * 1000)
             else:
-                print(f"❌ Invalid timer value! Must be 5-3600 seconds")
-                
-                # Send error response
-                error_response = {
-                    "device_id": self.device_id,
-                    "ch_t": "TIMER",
-                    "ch_addr": "TIMER_CONFIG",
-                    "cmd": 201,
-                    "sensor_id": sensor_id,
-                    "port": port,
-                    "timer_value": self.sense_timeout / 1000,
-                    "status": "error",
-                    "error": "Invalid timer value. Must be 5-3600 seconds"
-                }
-                self.client.publish(self.status_topic, json.dumps(error_response))
-        
-        elif cmd == 202:  # Get current timer value
-            sensor_id = data.get("sensor_id", self.current_sensor_id)
-            port = data.get("port", self.current_port)
-            sensor_key = f"{sensor_id}_{port}"
+                sensor.set_timeout(timer_value * 1000)
+                if self.eeprom is not None:
+                    self.eeprom.save_sensor_timer(sensor_id, port, timer_value * 1000)
             
-            # Get timer for this sensor, or use default
-            timer_value = self.sensor_timers.get(sensor_key, self.sense_timeout) / 1000
+            self.log.info("✅ Sensor timer updated - ID:%s Port:%s Timer:%ss", sensor_id, port, timer_value)
             
-            response = {
-                "device_id": self.device_id,
-                "ch_t": "TIMER",
-                "ch_addr": "TIMER_STATUS",
-                "cmd": 203,
-                "sensor_id": sensor_id,
-                "port": port,
-                "timer_value": timer_value,
-                "status": "current"
-            }
-            self.client.publish(self.status_topic, json.dumps(response))
-            print(f"📤 Sent current timer value: {json.dumps(response)}")
-        
-        elif cmd == 203:  # Get all sensors timer status
-            response = {
-                "device_id": self.device_id,
-                "ch_t": "TIMER",
-                "ch_addr": "ALL_SENSORS",
-                "cmd": 204,
-                "sensors": [
-                    {
-                        "sensor_id": self.current_sensor_id,
-                        "port": self.current_port,
-                        "timer_value": self.sense_timeout / 1000,
-                        "active": self.timer_active
-                    }
-                ]
-            }
-            self.client.publish(self.status_topic, json.dumps(response))
-            print(f"📤 Sent all sensors timer status: {json.dumps(response)}")
+            # Send confirmation
+            response = self.payloads.timer_set(sensor_id, port, timer_value)
+            self.publish(self.status_topic, response, 201)
+            self.log.debug("📤 Sent timer confirmation: %s", response)
+        else:
+            self.log.warning("❌ Invalid timer value! Must be 5-3600 seconds")
+            
+            # Send error response
+            error_response = self.payloads.timer_error(sensor_id, port, self.sense_timeout / 1000,
+                                                       "Invalid timer value. Must be 5-3600 seconds")
+            self.publish(self.status_topic, error_response, 201)
+    
+    def get_sensor_timer(self, data, channel=None):
+        """Timer cmd 202: report the timer value for a sensor/port"""
+        self.log.debug("⏰ Received timer configuration")
+        sensor_id = data.get("sensor_id", self.current_sensor_id)
+        port = data.get("port", self.current_port)
+        if not sensor_address_ok(sensor_id, port):
+            self.log.warning("❌ Invalid sensor_id/port: %r/%r", sensor_id, port)
+            return
+        
+        # Get timer for this sensor, or use default
+        sensor = self.sensors.get((sensor_id, port))
+        timer_value = (sensor or self.pir).sense_timeout / 1000
+        
+        response = self.payloads.timer_current(sensor_id, port, timer_value)
+        self.publish(self.status_topic, response, 203)
+        self.log.debug("📤 Sent current timer value: %s", response)
+    
+    def get_all_sensor_timers(self, data, channel=None):
+        """Timer cmd 203: report every sensor's timer status"""
+        self.log.debug("⏰ Received timer configuration")
+        response = self.payloads.all_timers([
+            (sensor.sensor_id, sensor.port, sensor.sense_timeout / 1000, sensor.timer_active)
+            for sensor in self.sensors.values()
+        ])
+        self.publish(self.status_topic, response, 204)
+        self.log.debug("📤 Sent all sensors timer status: %s", response)
     
     def send_ping(self):
         """Send ping message (like ESP32)"""
-        ping_data = {
-            "device_id": self.device_id,
-            "status": "online",
-            "uptime": int(time.time()),
-            "rssi": -50,  # Simulated RSSI
-            "pir_motion": self.motion_detected
-        }
-        
-        self.client.publish(self.ping_topic, json.dumps(ping_data))
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        print(f"{timestamp} -> 📡 Sent Ping: {json.dumps(ping_data)}")
-    
-    def send_device_discovery(self):
-        """Send device discovery message (like ESP32 boot)"""
-        discovery_data = {
-            "device_id": self.device_id,
-            "SNO": "234AM87697",
-            "Firmware": "v1.0.0.1",
-            "MacAddr": "AA:BB:CC:DD:EE:FF"
-        }
-        
-        result = self.client.publish(self.discovery_topic, json.dumps(discovery_data), retain=True)
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        print(f"{timestamp} -> 📢 Published Discovery Data:")
-        print(f"   {json.dumps(discovery_data)}")
-        print(f"📤 Message published (mid: {result.mid})")
-        
-        # Wait for message to be sent
-        time.sleep(0.5)
-        print("✅ Discovery message sent to broker")
+        ping_data = self.payloads.ping(int(self.clock.time()), self.motion_detected, rssi=-50)  # Simulated RSSI
+        self.publish(self.ping_topic, ping_data, key="ping")
+        self.last_ping = self.clock.time()
+        self.log.debug("📡 Sent Ping: %s", ping_data)
+    
+    def send_device_discovery(self, timeout=None):
+        """Send device discovery message (like ESP32 boot) and wait for the broker's PUBACK"""
+        timeout = self.boot_timeout if timeout is None else timeout
+        result = self.publish_discovery(qos=1)
+        try:
+            result.wait_for_publish(timeout)
+        except (ValueError, RuntimeError) as e:
+            self.log.error("❌ Discovery publish failed: %s", e)
+            return False
+        
+        if not result.is_published():
+            self.log.warning("⚠️ No PUBACK for discovery within %ss", timeout)
+            return False
         self.discovery_sent = True
+        self.log.info("✅ Discovery message sent to broker")
+        return True
+    
+    def publish_discovery(self, qos=0):
+        """Publish the retained discovery message without waiting for delivery"""
+        discovery_data = self.payloads.discovery
+        result = self.publish(self.discovery_topic, discovery_data, qos=qos, retain=True, key="discovery")
+        self.log.debug("📢 Published Discovery Data: %s", discovery_data)
+        self.log.debug("📤 Message published (mid: %s)", result.mid)
+        return result
     
     def send_config_response(self):
         """Send config response"""
-        config_data = {
-            "ch_t": "LED",
-            "ch_addr": "LED1",
-            "cmd": 100,
-            "cmd_m": "config"
-        }
-        
-        self.client.publish(self.config_topic, json.dumps(config_data))
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        print(f"{timestamp} -> 📤 Sent Config Response:")
-        print(f"   {json.dumps(config_data)}")
-    
-    def send_pir_status(self, status):
+        config_data = self.payloads.config_response
+        self.publish(self.config_topic, config_data, 100, key="config")
+        self.log.debug("📤 Sent Config Response: %s", config_data)
+    
+    def send_pir_status(self, status, sensor=None):
         """Send PIR status to MQTT broker"""
-        payload = {
-            "ch_t": "PIR",
-            "ch_addr": f"Port-{self.port}_{self.sensor_id}",
-            "cmd": 115,
-            "cmd_m": f"PIR State = {'1' if status == 'motion_detected' else '0'}"
-        }
-        
-        self.client.publish(self.status_topic, json.dumps(payload))
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        print(f"{timestamp} -> 📤 Sent PIR Status: {json.dumps(payload)}")
-    
-    def simulate_motion_detection(self, motion_state):
-        """Simulate PIR motion detection (like ESP32 checkPIRMotion)"""
-        current_time = time.time() * 1000
-        
-        if motion_state:
-            print(f"{datetime.now().strftime('%H:%M:%S.%f')[:-3]} -> 🔴 PIR MOTION DETECTED!")
-            self.motion_detected = True
-            
-            if not self.first_motion_sent:
-                print("📤 FIRST MOTION - Sending MQTT config to turn ON lights")
-                self.send_pir_status("motion_detected")
-                self.first_motion_sent = True
-                self.timer_start = current_time
-                self.timer_active = True
-                print(f"⏰ Timer started ({self.sense_timeout/1000} seconds) - subsequent motion will show on serial only")
-            else:
-                print("⏳ Motion during timer period - Serial only (NO MQTT)")
+        sensor = sensor or self.pir
+        payload = self.payloads.pir_status(sensor.port, sensor.sensor_id, status == "motion_detected")
+        self.publish(self.status_topic, payload, 115, key=("pir", sensor.sensor_id, sensor.port))
+        self.log.debug("📤 Sent PIR Status: %s", payload)
+    
+    def simulate_motion_detection(self, motion_state, sensor_id=None, port=None):
+        """Simulate PIR motion detection (like ESP32 checkPIRMotion) on one sensor, default the current one
+
+        Only sensors already configured (default sensor, cmd 200, EEPROM) can see motion
+        """
+        if sensor_id is None:
+            sensor = self.pir
         else:
-            print(f"{datetime.now().strftime('%H:%M:%S.%f')[:-3]} -> 🟢 PIR NO MOTION")
-            self.motion_detected = False
-            
-            if not self.timer_active:
-                print("📤 Sending no motion MQTT to turn OFF lights")
-                self.send_pir_status("no_motion")
-                self.first_motion_sent = False
-            else:
-                print("⏳ No motion detected but timer still active - showing on serial only")
+            port = self.current_port if port is None else port
+            sensor = self.sensors.get((sensor_id, port)) if sensor_address_ok(sensor_id, port) else None
+            if sensor is None:
+                self.log.warning("❌ Unknown sensor %r/%r: motion ignored", sensor_id, port)
+                return
+        sensor.motion(motion_state)
     
     def check_timer_timeout(self):
-        """Check if timer has expired"""
-        if self.timer_active and (time.time() * 1000 - self.timer_start > self.sense_timeout):
-            print("⏰ Timer expired - sending no motion MQTT to turn OFF lights")
-            elapsed = (time.time() * 1000 - self.timer_start) / 1000
-            print(f"   Timer was active for: {elapsed:.1f} seconds")
-            self.send_pir_status("no_motion")
-            self.motion_detected = False
-            self.first_motion_sent = False
-            self.timer_active = False
-    
-    def connect_to_broker(self):
-        """Connect to MQTT broker"""
-        try:
-            print(f"🔌 Connecting to MQTT broker: {self.broker_host}:{self.broker_port}")
-            self.client.connect(self.broker_host, self.broker_port, 60)
-            self.client.loop_start()
-            time.sleep(3)  # Wait longer for connection to stabilize
-            return True
-        except Exception as e:
-            print(f"❌ Connection failed: {e}")
+        """Check if any sensor's timer has expired"""
+        for sensor in list(self.sensors.values()):
+            sensor.check_timeout()
+    
+    def arm_pir_timer(self):
+        """Schedule the no-motion expiry for the current sensor's timer period"""
+        self.pir.arm_timer()
+    
+    def on_pir_timer_expired(self):
+        """Scheduler callback: PIR sense timeout reached"""
+        self.pir.on_timer_expired()
+    
+    def set_sense_timeout(self, timeout_ms):
+        """Change the current sensor's sense timeout, moving a running timer to the new deadline"""
+        self.pir.set_timeout(timeout_ms)
+        if self.eeprom is not None:
+            # TIMER_VALUE_ADDR holds the current sensor's timer; its slot only mirrors it
+            self.eeprom.save_timer_value(timeout_ms)
+            self.eeprom.save_sensor_timer(self.pir.sensor_id, self.pir.port, timeout_ms)
+    
+    def restore_from_eeprom(self):
+        """Load the saved timer value and per-sensor timers (like the firmware's setup())"""
+        self.pir.sense_timeout = self.eeprom.load_timer_value()
+        current = (self.pir.sensor_id, self.pir.port)
+        for (sensor_id, port), timer_ms in self.eeprom.sensor_timers().items():
+            if (sensor_id, port) != current:  # images saved before the mirror may hold a stale slot
+                self.sensor(sensor_id, port).sense_timeout = timer_ms
+        self.log.debug("📋 Loaded from EEPROM: timer %ss, %s sensors",
+                       self.sense_timeout / 1000, len(self.sensors))
+    
+    def start_pings(self, delay=0):
+        """Schedule the periodic session ping (delay = this device's phase offset)"""
+        if self.ping_timer is not None:
+            self.ping_timer.cancel()
+        self.ping_timer = self.scheduler.call_later(delay, self.on_ping_timer)
+    
+    def on_ping_timer(self):
+        schedule = self.ping_schedule
+        wait = schedule.deferral(self.clock.time(), self.last_ping, self.last_status)
+        if wait:
+            PINGS_DEFERRED.inc()
+            self.ping_timer = self.scheduler.call_later(wait, self.on_ping_timer)
+            return
+        self.send_ping()
+        self.ping_timer = self.scheduler.call_later(schedule.next_delay(), self.on_ping_timer)
+    
+    def stop_timers(self):
+        if self.status_coalescer is not None:
+            self.status_coalescer.flush()
+        for sensor in self.sensors.values():
+            sensor.cancel()
+        if self.reconnect_timer is not None:
+            self.reconnect_timer.cancel()
+            self.reconnect_timer = None
+        if self.ping_timer is not None:
+            self.ping_timer.cancel()
+        self.ping_timer = None
+    
+    def connect_to_broker(self, timeout=None):
+        """Connect to MQTT broker and wait for its CONNACK, retrying with jittered backoff"""
+        timeout = self.boot_timeout if timeout is None else timeout
+        self.log.info("🔌 Connecting to MQTT broker: %s:%s", self.broker_host, self.broker_port)
+        self.connected.clear()
+        for attempt in range(1, self.connect_attempts + 1):
+            try:
+                self.client.connect(self.broker_host, self.broker_port, 60)
+                self.client.loop_start()
+                break
+            except OSError as e:
+                if attempt == self.connect_attempts:
+                    self.log.error("❌ Connection failed: %s", e)
+                    return False
+                delay = self.backoff.next_delay()
+                self.log.warning("❌ Connection failed: %s - retrying in %.1fs", e, delay)
+                self.clock.sleep(delay)
+        
+        if not self.connected.wait(timeout):
+            self.log.error("❌ No CONNACK from broker within %ss", timeout)
             return False
+        return self.connect_rc == 0
     
     def boot_sequence(self):
         """Simulate ESP32 boot sequence"""
-        print("🚀 ESP32 Starting...")
-        print(f"📋 Device ID: {self.device_id}")
-        print(f"📋 Serial Number: 234AM87695")
-        print(f"📋 Firmware Version: 2.01")
-        print(f"📋 MAC Address: AA:BB:CC:DD:EE:FF")
+        self.log.info("🚀 ESP32 Starting...")
+        self.log.info("📋 Device ID: %s", self.device_id)
+        self.log.info("📋 Serial Number: 234AM87695")
+        self.log.info("📋 Firmware Version: 2.01")
+        self.log.info("📋 MAC Address: AA:BB:CC:DD:EE:FF")
         
         if not self.connect_to_broker():
             return False
         
-        print("📡 Setting up MQTT client...")
-        print("✅ MQTT client setup complete")
+        self.log.info("📡 Setting up MQTT client...")
+        self.log.info("✅ MQTT client setup complete")
         
         # Send discovery message
-        print("📢 Sending device discovery...")
-        self.send_device_discovery()
-        time.sleep(1)  # Wait for discovery message to be published
+        self.log.info("📢 Sending device discovery...")
+        for attempt in range(1, self.discovery_attempts + 1):
+            if self.send_device_discovery():
+                break
+            if attempt < self.discovery_attempts:
+                delay = self.backoff.next_delay()
+                self.log.warning("⚠️ Discovery not acknowledged - retrying in %.1fs", delay)
+                self.clock.sleep(delay)
+        else:
+            self.log.error("❌ Discovery not acknowledged after %s attempts - the backend may not know this device",
+                           self.discovery_attempts)
         
-        print("⏳ Waiting for config request from MQTT layer...")
-        print("💡 Tip: Send config request from your MQTT client to continue")
+        self.log.info("⏳ Waiting for config request from MQTT layer...")
+        self.log.info("💡 Tip: Send config request from your MQTT client to continue")
         
         return True
     
     def timer_background_thread(self):
-        """Background thread to check timer timeout and send pings"""
-        last_ping_time = 0
-        ping_interval = 30  # 30 seconds
-        
-        while True:
-            try:
-                current_time = time.time()
-                
-                # Check timer timeout
-                if self.timer_active:
-                    current_time_ms = current_time * 1000
-                    elapsed = (current_time_ms - self.timer_start) / 1000
-                    remaining = (self.sense_timeout / 1000) - elapsed
-                    
-                    # Show timer status every 5 seconds
-                    if int(elapsed) % 5 == 0 and elapsed > 0 and remaining > 0:
-                        print(f"⏱️ Timer status: {elapsed:.0f}s elapsed, {remaining:.0f}s remaining")
-                    
-                    # Check for timeout
-                    if remaining <= 0:
-                        print("⏰ Timer expired - sending no motion MQTT to turn OFF lights")
-                        elapsed_total = (current_time_ms - self.timer_start) / 1000
-                        print(f"   Timer was active for: {elapsed_total:.1f} seconds")
-                        self.send_pir_status("no_motion")
-                        self.motion_detected = False
-                        self.first_motion_sent = False
-                        self.timer_active = False
-                        print("🔄 Timer reset - ready for next motion cycle")
-                
-                # Send ping every 30 seconds
-                if current_time - last_ping_time >= ping_interval:
-                    self.send_ping()
-                    last_ping_time = current_time
-                
-                time.sleep(1)  # Check every second
-            except:
-                break
+        """Background thread firing PIR timeouts and pings as they come due"""
+        self.start_pings()
+        try:
+            self.scheduler.run_forever()
+        except Exception as e:
+            self.log.exception("❌ Timer thread stopped: %s", e)
     
     def interactive_mode(self):
         """Interactive mode for manual motion control"""
@@ -540,7 +705,7 @@ class ESP32Simulator:
                     try:
                         new_timer = int(command.split()[1])
                         if 5 <= new_timer <= 3600:
-                            self.sense_timeout = new_timer * 1000
+                            self.set_sense_timeout(new_timer * 1000)
                             print(f"✅ Timer set to {new_timer} seconds")
                         else:
                             print("❌ Timer must be between 5-3600 seconds")
@@ -576,11 +741,17 @@ class ESP32Simulator:
         print(f"   Config Received: {'YES' if self.config_received else 'NO'}")
         
         if self.timer_active:
-            elapsed = (time.time() * 1000 - self.timer_start) / 1000
+            elapsed = (self.clock.time() * 1000 - self.timer_start) / 1000
             remaining = (self.sense_timeout / 1000) - elapsed
             print(f"   Timer Elapsed: {elapsed:.1f} seconds")
             print(f"   Timer Remaining: {remaining:.1f} seconds")
         
+        if len(self.sensors) > 1:
+            print(f"\n📡 PIR Sensors:")
+            for sensor in self.sensors.values():
+                state = f"active, {sensor.remaining():.1f}s left" if sensor.timer_active else "idle"
+                print(f"   Sensor {sensor.sensor_id} Port {sensor.port}: {sensor.sense_timeout / 1000}s timer ({state})")
+        
         print(f"\n💡 LED States:")
         for led, state in self.led_states.items():
             if state["state"] != "off":
@@ -611,11 +782,52 @@ class ESP32Simulator:
         self.interactive_mode()
         
         # Cleanup
+        self.auto_reconnect = False
+        self.stop_timers()  # sends any held statuses before the connection goes
+        self.scheduler.stop()
         self.client.disconnect()
+        self.client.loop_stop()
         print("🔌 Disconnected from MQTT broker")
         print("👋 Goodbye!")
 
+def build_dispatcher():
+    """Dispatch table for the commands every simulated device understands"""
+    dispatcher = CommandDispatcher()
+    dispatcher.register_channels("LED", LED_INDEX)
+    dispatcher.register_channels("SHADE", SHADE_INDEX)
+    
+    dispatcher.register("config", ESP32Simulator.handle_config_message)
+    dispatcher.register("control", ESP32Simulator.set_led_power, "LED", 104, channel=True)
+    dispatcher.register("control", ESP32Simulator.set_led_brightness, "LED", 102, channel=True)
+    for cmd in SHADE_COMMANDS:
+        dispatcher.register("control", ESP32Simulator.set_shade_state, "SHADE", cmd, channel=True)
+    dispatcher.register("scene", ESP32Simulator.process_scene_command)
+    dispatcher.declare_commands(106, 117)  # config request and scene, checked inside their handlers
+    dispatcher.register("reboot", ESP32Simulator.handle_reboot_command)
+    dispatcher.register("timer", ESP32Simulator.set_sensor_timer, cmd=200)
+    dispatcher.register("timer", ESP32Simulator.get_sensor_timer, cmd=202)
+    dispatcher.register("timer", ESP32Simulator.get_all_sensor_timers, cmd=203)
+    return dispatcher
+
+DEFAULT_DISPATCHER = build_dispatcher()
+
 # Main execution
 if __name__ == "__main__":
-    simulator = ESP32Simulator()
-    simulator.run()
+    configure_logging(logging.DEBUG)
+    eeprom = EepromStore(os.environ.get("ESP32_EEPROM", "esp32_eeprom.bin"))
+    metrics_port = os.environ.get("ESP32_METRICS_PORT")
+    metrics = MetricsServer(port=int(metrics_port)).start() if metrics_port else None
+    capture_path = os.environ.get("ESP32_CAPTURE")
+    capture = TrafficRecorder(capture_path) if capture_path else None
+    simulator = ESP32Simulator(eeprom=eeprom.image("123456"), capture=capture)
+    status_window = os.environ.get("ESP32_STATUS_WINDOW")  # seconds, e.g. 0.05
+    if status_window:
+        simulator.coalesce_status(float(status_window))
+    try:
+        simulator.run()
+    finally:
+        if metrics is not None:
+            metrics.stop()
+        if capture is not None:
+            capture.close()
+        eeprom.close()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Multi-process sharded fleet runner
+Splits a fleet of simulated ESP32 devices across worker processes (one shard
+per core by default). Every shard runs its own FleetRunner - event loop, timer
+scheduler and broker connections - and takes commands from the parent over a
+pipe: start/stop a motion workload, report metrics, shut down. The parent
+aggregates the per-shard metrics into fleet-wide rates
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from esp32_fleet import FIRST_DEVICE_ID, MQTT_BROKER, MQTT_PORT, FleetRunner
+from motion_workload import MotionLoadGenerator, OccupancyShiftArrivals, PoissonArrivals
+from sim_logging import configure_logging, get_logger
+
+log = get_logger("shards")
+
+# Metrics summed across shards; everything else is reported per shard
+SUMMED_METRICS = ("devices", "received", "published", "motion_events", "cpu_seconds")
+
+
+class ShardConfig:
+    """What one worker process simulates (picklable for spawned workers)"""
+
+    def __init__(self, index, device_count, first_device_id, broker_host, broker_port, connections,
+                 ping_interval, log_level):
+        self.index = index
+        self.device_count = device_count
+        self.first_device_id = first_device_id
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.connections = connections
+        self.ping_interval = ping_interval
+        self.log_level = log_level
+
+
+class Shard:
+    """Worker side: a FleetRunner driven by commands from the parent"""
+
+    def __init__(self, config, conn):
+        self.config = config
+        self.conn = conn
+        self.fleet = None
+        self.generator = None
+        self.started = time.monotonic()
+
+    def metrics(self):
+        fleet = self.fleet
+        generator = self.generator
+        return {
+            "shard": self.config.index,
+            "pid": os.getpid(),
+            "devices": len(fleet.devices) if fleet else 0,
+            "boot_time": fleet.boot_time if fleet else None,
+            "received": sum(c.received for c in fleet.connections) if fleet else 0,
+            "published": sum(c.published for c in fleet.connections) if fleet else 0,
+            "motion_events": generator.fired if generator else 0,
+            "max_lag_ms": round(generator.max_lag * 1000, 2) if generator else 0.0,
+            "cpu_seconds": time.process_time(),
+            "uptime": time.monotonic() - self.started,
+        }
+
+    async def run(self):
+        config = self.config
+        loop = asyncio.get_running_loop()
+        commands = asyncio.Queue()
+
+        def read_commands():
+            # Pipe reads block, so a helper thread hands commands to the loop
+            while True:
+                try:
+                    command = self.conn.recv()
+                except (EOFError, OSError):
+                    command = ("stop", {})
+                loop.call_soon_threadsafe(commands.put_nowait, command)
+                if command[0] == "stop":
+                    return
+
+        self.fleet = FleetRunner(config.device_count, config.broker_host, config.broker_port,
+                                 config.connections, config.first_device_id, ping_interval=config.ping_interval)
+        await self.fleet.start()
+        threading.Thread(target=read_commands, daemon=True).start()
+        self.conn.send(("ready", self.metrics()))
+
+        while True:
+            name, params = await commands.get()
+            if name == "start_workload":
+                self.start_workload(params)
+                self.conn.send(("workload_started", self.metrics()))
+            elif name == "stop_workload":
+                if self.generator is not None:
+                    self.generator.stop()
+                self.conn.send(("workload_stopped", self.metrics()))
+            elif name == "metrics":
+                self.conn.send(("metrics", self.metrics()))
+            elif name == "stop":
+                if self.generator is not None:
+                    self.generator.stop()
+                self.fleet.stop()
+                try:
+                    self.conn.send(("stopped", self.metrics()))
+                except (BrokenPipeError, OSError):
+                    pass
+                return
+            else:
+                self.conn.send(("error", f"unknown command {name!r}"))
+
+    def start_workload(self, params):
+        if self.generator is not None:
+            self.generator.stop()
+        rate = params["rate"]
+        if params.get("model") == "rush":
+            model = OccupancyShiftArrivals.morning_rush(rate, ramp=params.get("ramp", 600), peak=params.get("peak", 1800))
+        else:
+            model = PoissonArrivals(rate)
+        self.generator = MotionLoadGenerator(self.fleet.devices, model, seed=params.get("seed", 0),
+                                             duration=params.get("duration"), motion_hold=params.get("hold"))
+        self.generator.start(self.fleet.scheduler)
+
+
+def shard_main(config, conn):
+    """Worker process entry point"""
+    configure_logging(config.log_level)
+    try:
+        asyncio.run(Shard(config, conn).run())
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        log.exception("❌ Shard %s failed: %s", config.index, e)
+        try:
+            conn.send(("error", str(e)))
+        except OSError:
+            pass
+
+
+class ShardedFleet:
+    """Parent side: launches the shards and talks to them over the control pipes"""
+
+    def __init__(self, device_count, shards=None, broker_host=MQTT_BROKER, broker_port=MQTT_PORT,
+                 connections=2, first_device_id=FIRST_DEVICE_ID, ping_interval=30, log_level=logging.WARNING):
+        self.shard_count = max(1, min(shards or os.cpu_count() or 1, device_count))
+        context = multiprocessing.get_context("spawn")
+        self.configs = []
+        self.processes = []
+        self.pipes = []
+        base, extra = divmod(device_count, self.shard_count)
+        first = first_device_id
+        for index in range(self.shard_count):
+            count = base + (1 if index < extra else 0)
+            config = ShardConfig(index, count, first, broker_host, broker_port, connections,
+                                 ping_interval, log_level)
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=shard_main, args=(config, child_conn),
+                                      name=f"esp32-shard-{index}", daemon=True)
+            self.configs.append(config)
+            self.pipes.append(parent_conn)
+            self.processes.append(process)
+            first += count
+
+    def start(self, timeout=120):
+        """Start every shard and wait until all their devices have booted"""
+        for process in self.processes:
+            process.start()
+        return self._collect("ready", timeout)
+
+    def command(self, name, params=None, reply=None, timeout=30):
+        """Send a command to every shard and return their replies (one metrics dict per shard)"""
+        for pipe in self.pipes:
+            pipe.send((name, params or {}))
+        return self._collect(reply or name, timeout)
+
+    def start_workload(self, rate, seed=0, **params):
+        """Split an aggregate motion rate evenly over the devices; each shard gets its own seed"""
+        total = sum(config.device_count for config in self.configs)
+        for pipe, config in zip(self.pipes, self.configs):
+            share = dict(params, rate=rate * config.device_count / total, seed=seed * 1000 + config.index)
+            pipe.send(("start_workload", share))
+        return self._collect("workload_started")
+
+    def stop_workload(self):
+        return self.command("stop_workload", reply="workload_stopped")
+
+    def metrics(self):
+        return self.command("metrics")
+
+    def stop(self, timeout=30):
+        replies = []
+        for pipe in self.pipes:
+            try:
+                pipe.send(("stop", {}))
+            except OSError:
+                pass
+        try:
+            replies = self._collect("stopped", timeout)
+        except (RuntimeError, TimeoutError) as e:
+            log.warning("⚠️ %s", e)
+        for process in self.processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        return replies
+
+    def _collect(self, expected, timeout=30):
+        deadline = time.monotonic() + timeout
+        replies = []
+        for index, pipe in enumerate(self.pipes):
+            if not pipe.poll(max(0.0, deadline - time.monotonic())):
+                raise TimeoutError(f"shard {index} did not answer {expected!r} in {timeout}s")
+            kind, payload = pipe.recv()
+            if kind != expected:
+                raise RuntimeError(f"shard {index}: expected {expected!r}, got {kind!r}: {payload}")
+            replies.append(payload)
+        return replies
+
+
+def aggregate(replies):
+    """Fleet-wide totals from per-shard metrics"""
+    totals = {name: sum(reply[name] for reply in replies) for name in SUMMED_METRICS}
+    totals["shards"] = len(replies)
+    totals["max_lag_ms"] = max((reply["max_lag_ms"] for reply in replies), default=0.0)
+    boot_times = [reply["boot_time"] for reply in replies if reply["boot_time"] is not None]
+    totals["boot_time"] = max(boot_times, default=None)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a simulated ESP32 fleet sharded across processes")
+    parser.add_argument("--devices", type=int, default=10000, help="devices across all shards")
+    parser.add_argument("--shards", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--connections", type=int, default=2, help="broker connections per shard")
+    parser.add_argument("--host", default=MQTT_BROKER, help='MQTT broker host ("memory" = one in-process broker per shard)')
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--first-id", type=int, default=FIRST_DEVICE_ID)
+    parser.add_argument("--rate", type=float, default=0, help="aggregate motion events/s (0 = no workload)")
+    parser.add_argument("--model", choices=["poisson", "rush"], default="poisson")
+    parser.add_argument("--hold", type=float, default=None, help="seconds until each no-motion reading")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between aggregated reports")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    level = getattr(logging, args.log_level.upper())
+    configure_logging(level)
+
+    print("🧪 Sharded ESP32 Fleet")
+    print("=" * 50)
+    fleet = ShardedFleet(args.devices, args.shards, args.host, args.port, args.connections, args.first_id,
+                         log_level=level)
+    print(f"🚀 Starting {fleet.shard_count} shards for {args.devices} devices...")
+    started = time.monotonic()
+    try:
+        totals = aggregate(fleet.start())
+        print(f"✅ {totals['devices']} devices up in {time.monotonic() - started:.1f}s "
+              f"(slowest shard boot {totals['boot_time']:.2f}s)")
+        if args.rate:
+            fleet.start_workload(args.rate, args.seed, model=args.model, hold=args.hold, duration=args.duration)
+            print(f"📈 Motion workload: {args.rate:.0f} events/s ({args.model}) across {fleet.shard_count} shards")
+
+        previous, previous_time = totals, time.monotonic()
+        end = previous_time + args.duration
+        while time.monotonic() < end:
+            time.sleep(min(args.interval, max(0.0, end - time.monotonic())))
+            totals, now = aggregate(fleet.metrics()), time.monotonic()
+            elapsed = now - previous_time
+            print(f"   motion {(totals['motion_events'] - previous['motion_events']) / elapsed:>9.0f}/s"
+                  f"   in {(totals['received'] - previous['received']) / elapsed:>9.0f} msg/s"
+                  f"   out {(totals['published'] - previous['published']) / elapsed:>9.0f} msg/s"
+                  f"   cpu {(totals['cpu_seconds'] - previous['cpu_seconds']) / elapsed:>5.1f} cores"
+                  f"   max lag {totals['max_lag_ms']:.1f} ms")
+            previous, previous_time = totals, now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        replies = fleet.stop()
+
+    if replies:
+        print("\n📊 Per-shard totals")
+        for reply in replies:
+            print(f"   shard {reply['shard']:>2} (pid {reply['pid']}): {reply['devices']} devices, "
+                  f"{reply['motion_events']} motion events, {reply['published']} published, "
+                  f"{reply['received']} received, {reply['cpu_seconds']:.1f}s cpu")
+        totals = aggregate(replies)
+        print(f"   total: {totals['motion_events']} motion events, {totals['published']} published, "
+              f"{totals['received']} received")
+    print("👋 Goodbye!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+In-process MQTT broker stand-in
+InMemoryBroker routes messages between InMemoryClient objects in the same
+process (no sockets): topic wildcards (+ and #), retained messages, QoS 0/1,
+per-topic fan-out and $share/<group>/ shared subscriptions. InMemoryClient implements the subset of the paho
+Client API used by the simulator and the timer scripts
+"""
+
+import itertools
+import threading
+from collections import deque
+
+from sim_logging import get_logger
+from topic_router import split_shared
+
+log = get_logger("broker")
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+MQTT_ERR_CONN_LOST = 7
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT topic filter match, including + and # wildcards"""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def encode_payload(payload):
+    """Payload to bytes the way paho does"""
+    if payload is None:
+        return b""
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, bytearray):
+        return bytes(payload)
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    if isinstance(payload, (int, float)):
+        return str(payload).encode("ascii")
+    raise TypeError("payload must be a string, bytearray, int, float or None.")
+
+
+class InMemoryMessage:
+    """Same attributes as paho's MQTTMessage"""
+
+    __slots__ = ("topic", "payload", "qos", "retain", "mid", "timestamp")
+
+    def __init__(self, topic, payload, qos=0, retain=False, mid=0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+        self.timestamp = 0
+
+
+class InMemoryMessageInfo:
+    """Same interface as paho's MQTTMessageInfo (delivery is immediate)"""
+
+    __slots__ = ("mid", "rc")
+
+    def __init__(self, mid, rc=MQTT_ERR_SUCCESS):
+        self.mid = mid
+        self.rc = rc
+
+    def is_published(self):
+        return self.rc == MQTT_ERR_SUCCESS
+
+    def wait_for_publish(self, timeout=None):
+        return None
+
+
+class InMemoryBroker:
+    """Routes publishes to matching subscriptions within one process"""
+
+    def __init__(self):
+        self.exact = {}      # topic -> {client: qos}
+        self.wildcards = {}  # filter with + or # -> {client: qos}
+        self.shared = {}     # (group, filter) -> {client: qos}; each message goes to one member
+        self._turn = itertools.count()
+        self.retained = {}   # topic -> InMemoryMessage
+        self.clients = {}    # client_id -> client
+        self.published = 0
+        self.delivered = 0
+        self.running = True
+        self._lock = threading.RLock()
+        self._pending = deque()
+        self._draining = False
+
+    def connect(self, client):
+        if not self.running:
+            raise ConnectionRefusedError("in-memory broker is stopped")
+        with self._lock:
+            previous = self.clients.get(client.client_id)
+            if previous is not None and previous is not client:
+                self.disconnect(previous)  # same client_id takes over the session
+            self.clients[client.client_id] = client
+
+    def disconnect(self, client):
+        with self._lock:
+            if self.clients.get(client.client_id) is client:
+                del self.clients[client.client_id]
+            for table in (self.exact, self.wildcards, self.shared):
+                for topic_filter in [f for f, subscribers in table.items() if client in subscribers]:
+                    del table[topic_filter][client]
+                    if not table[topic_filter]:
+                        del table[topic_filter]
+
+    def stop(self):
+        """Simulate a broker outage: drop every client and refuse connections until start()"""
+        with self._lock:
+            self.running = False
+            clients = list(self.clients.values())
+        for client in clients:
+            client._connection_lost()
+
+    def start(self):
+        self.running = True
+
+    def _table(self, topic_filter):
+        group, topic_filter = split_shared(topic_filter)
+        if group is not None:
+            return self.shared, (group, topic_filter)
+        return (self.wildcards if ("+" in topic_filter or "#" in topic_filter) else self.exact), topic_filter
+
+    def subscribe(self, client, topic_filter, qos):
+        table, topic_filter = self._table(topic_filter)
+        with self._lock:
+            if table is self.shared:
+                table.setdefault(topic_filter, {})[client] = qos  # no retained messages for shared subscriptions
+                return
+            table.setdefault(topic_filter, {})[client] = qos
+            retained = [message for topic, message in self.retained.items() if topic_matches(topic_filter, topic)]
+            for message in retained:
+                self._pending.append((client, message.topic, message.payload, min(qos, message.qos), True))
+            self._drain()
+
+    def unsubscribe(self, client, topic_filter):
+        table, topic_filter = self._table(topic_filter)
+        with self._lock:
+            subscribers = table.get(topic_filter)
+            if subscribers is not None:
+                subscribers.pop(client, None)
+                if not subscribers:
+                    del table[topic_filter]
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Fan a message out to every matching subscriber"""
+        with self._lock:
+            self.published += 1
+            if retain:
+                if payload:
+                    self.retained[topic] = InMemoryMessage(topic, payload, qos, True)
+                else:
+                    self.retained.pop(topic, None)
+            pending = self._pending
+            subscribers = self.exact.get(topic)
+            if subscribers:
+                for client, sub_qos in subscribers.items():
+                    pending.append((client, topic, payload, min(qos, sub_qos), False))
+            for topic_filter, subscribers in self.wildcards.items():
+                if topic_matches(topic_filter, topic):
+                    for client, sub_qos in subscribers.items():
+                        pending.append((client, topic, payload, min(qos, sub_qos), False))
+            for (group, topic_filter), subscribers in self.shared.items():
+                if topic_matches(topic_filter, topic):
+                    # Round robin over the group's members
+                    members = list(subscribers.items())
+                    client, sub_qos = members[next(self._turn) % len(members)]
+                    pending.append((client, topic, payload, min(qos, sub_qos), False))
+            self._drain()
+
+    def _drain(self):
+        # Deliver iteratively: handlers that publish queue more work instead of recursing
+        if self._draining:
+            return
+        self._draining = True
+        try:
+            pending = self._pending
+            while pending:
+                client, topic, payload, qos, retain = pending.popleft()
+                self.delivered += 1
+                try:
+                    client._deliver(InMemoryMessage(topic, payload, qos, retain))
+                except Exception as e:
+                    # Like a real broker: one subscriber's failure is not the publisher's or the others'
+                    log.exception("❌ Delivery to %s on %s failed: %s", client.client_id, topic, e)
+        finally:
+            self._draining = False
+
+
+DEFAULT_BROKER = InMemoryBroker()
+
+
+class InMemoryClient:
+    """paho-style client (VERSION1 callbacks) connected to an InMemoryBroker"""
+
+    def __init__(self, client_id="", broker=None, userdata=None):
+        self.client_id = client_id or f"inmemory-{id(self):x}"
+        self.broker = broker if broker is not None else DEFAULT_BROKER
+        self.userdata = userdata
+        self.connected = False
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+        self.on_subscribe = None
+        self._mids = itertools.count(1)
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def user_data_set(self, userdata):
+        self.userdata = userdata
+
+    def connect(self, host=None, port=None, keepalive=60, **kwargs):
+        self.broker.connect(self)
+        self.connected = True
+        if self.on_connect:
+            self.on_connect(self, self.userdata, {"session present": 0}, 0)
+        return MQTT_ERR_SUCCESS
+
+    connect_async = connect
+
+    def reconnect(self):
+        return self.connect()
+
+    def disconnect(self, *args, **kwargs):
+        if self.connected:
+            self.connected = False
+            self.broker.disconnect(self)
+            if self.on_disconnect:
+                self.on_disconnect(self, self.userdata, 0)
+        return MQTT_ERR_SUCCESS
+
+    def is_connected(self):
+        return self.connected
+
+    def loop_start(self):
+        return MQTT_ERR_SUCCESS
+
+    def loop_stop(self, force=False):
+        return MQTT_ERR_SUCCESS
+
+    def loop(self, timeout=1.0):
+        return MQTT_ERR_SUCCESS
+
+    def subscribe(self, topic, qos=0):
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        mid = next(self._mids)
+        if not self.connected:
+            return MQTT_ERR_NO_CONN, mid
+        for topic_filter, sub_qos in topics:
+            self.broker.subscribe(self, topic_filter, sub_qos)
+        if self.on_subscribe:
+            self.on_subscribe(self, self.userdata, mid, tuple(q for _, q in topics))
+        return MQTT_ERR_SUCCESS, mid
+
+    def unsubscribe(self, topic):
+        for topic_filter in (topic if isinstance(topic, list) else [topic]):
+            self.broker.unsubscribe(self, topic_filter)
+        return MQTT_ERR_SUCCESS, next(self._mids)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        mid = next(self._mids)
+        if not self.connected:
+            return InMemoryMessageInfo(mid, MQTT_ERR_NO_CONN)
+        self.broker.publish(topic, encode_payload(payload), qos, retain)
+        if self.on_publish:
+            self.on_publish(self, self.userdata, mid)
+        return InMemoryMessageInfo(mid)
+
+    def _connection_lost(self):
+        if self.connected:
+            self.connected = False
+            self.broker.disconnect(self)
+            if self.on_disconnect:
+                self.on_disconnect(self, self.userdata, MQTT_ERR_CONN_LOST)
+
+    def _deliver(self, message):
+        if self.connected and self.on_message:
+            self.on_message(self, self.userdata, message)
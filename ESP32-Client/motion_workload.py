@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+PIR motion workload generator
+Drives simulate_motion_detection() on every simulated device from a seeded,
+reproducible arrival process: Poisson, bursty occupancy shifts, or a recorded
+trace. Events are fed through the devices' TimerScheduler, so the same
+workload runs in real time on a fleet or in virtual time on a VirtualClock
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import random
+from collections import deque
+
+from esp32_fleet import FIRST_DEVICE_ID, MQTT_BROKER, MQTT_PORT, FleetRunner
+from sim_logging import configure_logging, get_logger
+
+BATCH_WINDOW = 0.001  # events this close together fire in one scheduler wakeup
+
+log = get_logger("workload")
+
+
+class PoissonArrivals:
+    """Motion onsets at a constant aggregate rate (events/s), spread uniformly over devices"""
+
+    def __init__(self, rate):
+        if rate < 0:
+            raise ValueError(f"arrival rate must be >= 0, got {rate}")
+        self.rate = rate
+
+    def arrivals(self, rng, device_count, duration):
+        if not self.rate:
+            return  # rate 0: a quiet workload, as for an OccupancyShiftArrivals phase
+        t = 0.0
+        while True:
+            t += rng.expovariate(self.rate)
+            if duration is not None and t >= duration:
+                return
+            yield t, rng.randrange(device_count), True
+
+
+class OccupancyShiftArrivals:
+    """Piecewise-constant Poisson phases, e.g. quiet night -> morning rush -> day
+
+    phases is a list of (seconds, aggregate rate); the last phase repeats
+    until the workload duration ends.
+    """
+
+    def __init__(self, phases):
+        self.phases = phases
+
+    def arrivals(self, rng, device_count, duration):
+        phase_start = 0.0
+        index = 0
+        while True:
+            length, rate = self.phases[min(index, len(self.phases) - 1)]
+            phase_end = phase_start + length
+            if duration is not None:
+                phase_end = min(phase_end, duration)
+            t = phase_start
+            while rate > 0:
+                t += rng.expovariate(rate)
+                if t >= phase_end:
+                    break
+                yield t, rng.randrange(device_count), True
+            if duration is not None and phase_end >= duration:
+                return
+            if rate <= 0 and index >= len(self.phases) - 1:
+                return  # a quiet last phase repeats forever: nothing more will arrive
+            phase_start = phase_end
+            index += 1
+
+    @classmethod
+    def morning_rush(cls, peak_rate, night_rate=None, ramp=600, peak=1800):
+        """Quiet -> ramp -> peak -> settle, scaled to a peak aggregate rate"""
+        night_rate = peak_rate / 100 if night_rate is None else night_rate
+        return cls([
+            (ramp, night_rate),
+            (ramp, peak_rate / 4),
+            (peak, peak_rate),
+            (ramp, peak_rate / 4),
+            (ramp, peak_rate / 10),
+        ])
+
+
+class TraceArrivals:
+    """Replays a CSV trace of time,device[,motion] rows (time in seconds from start)
+
+    device may be a device_id or a 0-based device index; speed > 1 compresses time.
+    """
+
+    def __init__(self, path, device_ids=None, speed=1.0):
+        self.path = path
+        self.device_ids = device_ids
+        self.speed = speed
+
+    def arrivals(self, rng, device_count, duration):
+        index_of = {device_id: i for i, device_id in enumerate(self.device_ids or [])}
+        with open(self.path, newline="") as trace:
+            for row in csv.DictReader(trace):
+                t = float(row["time"]) / self.speed
+                if duration is not None and t >= duration:
+                    return
+                device = row["device"]
+                index = index_of.get(device)
+                if index is None:
+                    try:
+                        index = int(device)
+                    except ValueError:
+                        continue  # unknown device_id: skipped like an out-of-range index
+                if not 0 <= index < device_count:
+                    continue
+                motion = row.get("motion", "1") not in ("0", "false", "False")
+                yield t, index, motion
+
+
+class MotionLoadGenerator:
+    """Feeds an arrival model's events to devices through a TimerScheduler"""
+
+    def __init__(self, devices, model, seed=0, duration=None, motion_hold=None):
+        self.devices = devices
+        self.model = model
+        self.seed = seed
+        self.duration = duration
+        self.motion_hold = motion_hold  # seconds until the matching no-motion reading
+        self.scheduler = None
+        self.fired = 0
+        self.max_lag = 0.0
+        self.done = False
+        self._events = None
+        self._start = 0.0
+        self._next = None
+
+    def schedule(self):
+        """The reproducible event stream: (offset seconds, device index, motion)"""
+        rng = random.Random(self.seed)
+        onsets = self.model.arrivals(rng, len(self.devices), self.duration)
+        if not self.motion_hold:
+            return onsets
+        return _with_releases(onsets, self.motion_hold)
+
+    def start(self, scheduler):
+        """Begin firing events on the scheduler, relative to its current time"""
+        self.scheduler = scheduler
+        self._events = iter(self.schedule())
+        self._start = scheduler.clock()
+        self._next = next(self._events, None)
+        self._arm()
+
+    def stop(self):
+        self.done = True
+        self._events = None
+
+    def _arm(self):
+        if self._next is None:
+            self.done = True
+            log.info("🏁 Motion workload finished: %s events", self.fired)
+        else:
+            self.scheduler.call_at(self._start + self._next[0], self._fire)
+
+    def _fire(self):
+        if self.done:
+            return
+        now = self.scheduler.clock()
+        devices = self.devices
+        event = self._next
+        horizon = now - self._start + BATCH_WINDOW
+        while event is not None and event[0] <= horizon:
+            lag = now - self._start - event[0]
+            if lag > self.max_lag:
+                self.max_lag = lag
+            devices[event[1]].simulate_motion_detection(event[2])
+            self.fired += 1
+            event = next(self._events, None)
+        self._next = event
+        self._arm()
+
+
+def _with_releases(onsets, hold):
+    """Interleave a no-motion reading hold seconds after every motion onset"""
+    releases = deque()  # already in time order: constant hold over sorted onsets
+    for event in onsets:
+        while releases and releases[0][0] <= event[0]:
+            yield releases.popleft()
+        yield event
+        if event[2]:
+            releases.append((event[0] + hold, event[1], False))
+    yield from releases
+
+
+def export_schedule(generator, path, device_ids):
+    """Write a generator's schedule as a trace CSV (replayable with --model trace)"""
+    count = 0
+    with open(path, "w", newline="") as trace:
+        writer = csv.writer(trace)
+        writer.writerow(["time", "device", "motion"])
+        for t, index, motion in generator.schedule():
+            writer.writerow([f"{t:.6f}", device_ids[index], 1 if motion else 0])
+            count += 1
+    return count
+
+
+def build_model(args, device_ids):
+    if args.model == "poisson":
+        return PoissonArrivals(args.rate)
+    if args.model == "rush":
+        return OccupancyShiftArrivals.morning_rush(args.rate, ramp=args.ramp, peak=args.peak)
+    return TraceArrivals(args.trace, device_ids, args.speed)
+
+
+async def run_fleet_workload(args):
+    fleet = FleetRunner(args.devices, args.host, args.port, args.connections, args.first_id)
+    await fleet.start()
+    generator = MotionLoadGenerator(fleet.devices, build_model(args, [d.device_id for d in fleet.devices]),
+                                    seed=args.seed, duration=args.duration, motion_hold=args.hold)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    generator.start(fleet.scheduler)
+    try:
+        while not generator.done and (args.duration is None or loop.time() - started < args.duration):
+            await asyncio.sleep(1)
+            elapsed = loop.time() - started
+            print(f"📈 {generator.fired} events in {elapsed:.0f}s ({generator.fired / elapsed:.0f}/s), "
+                  f"max lag {generator.max_lag * 1000:.1f} ms")
+    finally:
+        generator.stop()
+        fleet.stop()
+    elapsed = loop.time() - started
+    print(f"✅ {generator.fired} motion events in {elapsed:.1f}s ({generator.fired / elapsed:.0f}/s), "
+          f"max lag {generator.max_lag * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive PIR motion on a simulated fleet")
+    parser.add_argument("--model", choices=["poisson", "rush", "trace"], default="poisson")
+    parser.add_argument("--rate", type=float, default=1000.0, help="aggregate motion events/s (peak for rush)")
+    parser.add_argument("--ramp", type=float, default=600, help="rush: seconds per ramp phase")
+    parser.add_argument("--peak", type=float, default=1800, help="rush: seconds at peak rate")
+    parser.add_argument("--trace", help="trace: CSV file with time,device[,motion] columns")
+    parser.add_argument("--speed", type=float, default=1.0, help="trace: time compression factor")
+    parser.add_argument("--hold", type=float, default=None, help="seconds until each no-motion reading")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (same seed = same schedule)")
+    parser.add_argument("--duration", type=float, default=60, help="workload length in seconds")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--first-id", type=int, default=FIRST_DEVICE_ID)
+    parser.add_argument("--host", default=MQTT_BROKER)
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--export", help="write the schedule to this CSV instead of running it")
+    parser.add_argument("--log-level", default="WARNING", help="INFO logs every motion event")
+    args = parser.parse_args()
+    if args.model == "trace" and not args.trace:
+        parser.error("--model trace needs --trace FILE")
+    configure_logging(getattr(logging, args.log_level.upper()))
+
+    print("🧪 PIR Motion Workload")
+    print("=" * 50)
+    if args.export:
+        device_ids = [str(args.first_id + i) for i in range(args.devices)]
+        generator = MotionLoadGenerator(device_ids, build_model(args, device_ids),
+                                        seed=args.seed, duration=args.duration, motion_hold=args.hold)
+        count = export_schedule(generator, args.export, device_ids)
+        print(f"✅ Wrote {count} events to {args.export}")
+        return
+    try:
+        asyncio.run(run_fleet_workload(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
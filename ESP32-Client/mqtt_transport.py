@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+MQTT transport selection for the simulator and its client scripts
+A broker host of "memory" selects the in-process InMemoryBroker; anything else
+is a real broker reached through paho-mqtt. AsyncioHelper runs a paho client's
+socket I/O on an asyncio event loop
+"""
+
+import asyncio
+import os
+
+from inmemory_broker import DEFAULT_BROKER, MQTT_ERR_NO_CONN, MQTT_ERR_SUCCESS, InMemoryClient
+
+MEMORY_BROKER = "memory"
+DEFAULT_BROKER_HOST = os.environ.get("MQTT_BROKER", "192.168.29.128")  # Your MQTT broker IP
+
+
+def is_memory_broker(broker_host):
+    return broker_host == MEMORY_BROKER
+
+
+def create_client(client_id="", broker_host=DEFAULT_BROKER_HOST, broker=None, reconnect_on_failure=True):
+    """paho-compatible client for broker_host (VERSION1 callback signatures)
+
+    reconnect_on_failure=False stops paho's loop_start() thread from reconnecting
+    by itself, for callers that run their own reconnect policy.
+    """
+    if is_memory_broker(broker_host) or broker is not None:
+        return InMemoryClient(client_id, broker if broker is not None else DEFAULT_BROKER)
+
+    import paho.mqtt.client as mqtt
+    return mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1, client_id=client_id,
+                       reconnect_on_failure=reconnect_on_failure)
+
+
+class AsyncioHelper:
+    """Drives a paho client's socket from an asyncio loop instead of loop_start()"""
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc = None
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, lambda: client.loop_read(max_packets=100))
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        """Keepalive / retry housekeeping normally done by the network thread"""
+        while self.client.loop_misc() == MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
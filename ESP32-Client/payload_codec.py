@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Payload codecs for the simulator's MQTT messages
+JSON stays the default. "bin1" is a compact binary encoding of the same
+JSON-style values, in the spirit of MessagePack: small ints, short strings,
+lists and maps carry their size in the tag byte, and the keys, channel names,
+cmd_m texts and brightness levels the simulator sends are one-byte symbols.
+Binary payloads start with MAGIC (never the first byte of UTF-8 JSON), so
+decode_payload() accepts either form without knowing what was negotiated.
+
+Negotiation: a device that offers codecs lists them in its discovery message
+("codecs": ["bin1"]); a backend that accepts one names it in the cmd 106
+config request ("codec": "bin1") and the device switches after answering.
+A backend that says nothing (like mqtt.service.ts) keeps the device on JSON
+"""
+
+import json
+import struct
+
+from channel_state import LED_NAMES, SHADE_NAMES, SHADE_STATE_NAMES
+from payload_templates import PayloadTemplates, discovery_payload
+
+MAGIC = 0xB1
+_MAGIC = bytes((MAGIC,))
+
+# Tags; 0x00-0x7f are ints 0..127, 0xe0-0xff ints -32..-1
+FIXSTR, FIXLIST, FIXMAP = 0x80, 0xA0, 0xB0  # low bits: length 0..31 / 0..15 / 0..15
+NULL, FALSE, TRUE = 0xC0, 0xC1, 0xC2
+INT8, INT16, INT32, INT64 = 0xC3, 0xC4, 0xC5, 0xC6
+FLOAT64, STR8, STR16, LIST16, MAP16 = 0xC7, 0xC8, 0xC9, 0xCA, 0xCB
+SYMBOL = 0xCC  # one-byte index into SYMBOLS
+DIGITS = 0xCD  # decimal string without leading zeros (device ids) as uint32
+FLOAT32 = 0xCE  # float that survives a round trip through single precision
+WHOLE_FLOAT = 0xCF  # float with an integral value, as int16
+MAX_DEPTH = 32  # nested lists/maps accepted by decode(); simulator messages use two levels
+
+# Append-only: changing the order breaks every decoder that has the old table (bump MAGIC instead)
+SYMBOLS = (
+    # keys
+    "device_id", "ch_t", "ch_addr", "cmd", "cmd_m", "status", "uptime", "rssi", "pir_motion",
+    "sensor_id", "port", "timer_value", "active", "sensors", "error", "SNO", "Firmware", "MacAddr",
+    "codecs", "codec", "state",
+    # values
+    "LED", "SHADE", "PIR", "TIMER", "TIMER_CONFIG", "TIMER_STATUS", "ALL_SENSORS",
+    "online", "success", "current", "on", "off", "config", "control", "LED_ON", "LED_OFF",
+    "PIR State = 1", "PIR State = 0", "json", "bin1",
+    *SHADE_STATE_NAMES,
+    *LED_NAMES,
+    *SHADE_NAMES[1:],
+    *(f"{level}%" for level in range(101)),
+)
+_SYMBOL_IDS = {symbol: index for index, symbol in enumerate(SYMBOLS)}
+assert len(SYMBOLS) <= 256
+
+_pack_h = struct.Struct(">h").pack
+_pack_H = struct.Struct(">H").pack
+_pack_f = struct.Struct(">f").pack
+_unpack_f = struct.Struct(">f").unpack
+_FIXED = {8: struct.Struct(">b"), 16: struct.Struct(">h"), 32: struct.Struct(">i"), 64: struct.Struct(">q")}
+
+
+def _encode(value, out):
+    kind = type(value)
+    if kind is str:
+        symbol = _SYMBOL_IDS.get(value)
+        if symbol is not None:
+            out += bytes((SYMBOL, symbol))
+        elif value.isdigit() and value.isascii() and (value == "0" or value[0] != "0") and int(value) < 1 << 32:
+            out.append(DIGITS)
+            out += int(value).to_bytes(4, "big")
+        else:
+            data = value.encode("utf-8")
+            size = len(data)
+            if size < 32:
+                out.append(FIXSTR | size)
+            elif size < 256:
+                out += bytes((STR8, size))
+            else:
+                out.append(STR16)
+                out += _pack_H(size)
+            out += data
+    elif kind is int:
+        if 0 <= value < 128:
+            out.append(value)
+        elif -32 <= value < 0:
+            out.append(value & 0xFF)
+        elif -128 <= value < 128:
+            out += bytes((INT8, value & 0xFF))
+        elif -32768 <= value < 32768:
+            out.append(INT16)
+            out += _pack_h(value)
+        elif -(1 << 31) <= value < 1 << 31:
+            out.append(INT32)
+            out += value.to_bytes(4, "big", signed=True)
+        else:
+            out.append(INT64)
+            out += value.to_bytes(8, "big", signed=True)
+    elif kind is bool:
+        out.append(TRUE if value else FALSE)
+    elif kind is float:
+        if value.is_integer() and -32768 <= value < 32768:
+            out.append(WHOLE_FLOAT)
+            out += _pack_h(int(value))
+        else:
+            try:
+                single = _pack_f(value)
+            except OverflowError:
+                single = None
+            if single is not None and _unpack_f(single)[0] == value:
+                out.append(FLOAT32)
+                out += single
+            else:
+                out.append(FLOAT64)
+                out += struct.pack(">d", value)
+    elif value is None:
+        out.append(NULL)
+    elif kind is dict:
+        size = len(value)
+        if size < 16:
+            out.append(FIXMAP | size)
+        else:
+            out.append(MAP16)
+            out += _pack_H(size)
+        for key, item in value.items():
+            _encode(str(key), out)
+            _encode(item, out)
+    elif kind is list or kind is tuple:
+        size = len(value)
+        if size < 16:
+            out.append(FIXLIST | size)
+        else:
+            out.append(LIST16)
+            out += _pack_H(size)
+        for item in value:
+            _encode(item, out)
+    else:
+        raise TypeError(f"cannot encode {kind.__name__} in a binary payload")
+    return out
+
+
+def encode_value(value):
+    """One value without the MAGIC prefix (a fragment for the templates)"""
+    return bytes(_encode(value, bytearray()))
+
+
+_SMALL_INTS = {value: encode_value(value) for value in range(-128, 128)}
+_INT32 = bytes((INT32,))
+# Fragments of strings and floats the templates see over and over (bounded, shared by all devices)
+_fragments = {}
+_FRAGMENT_LIMIT = 8192
+
+
+def encode_int(value):
+    """encode_value() for an int, with the common small values prebuilt"""
+    encoded = _SMALL_INTS.get(value)
+    if encoded is None:
+        if -(1 << 31) <= value < 1 << 31:
+            return _INT32 + value.to_bytes(4, "big", signed=True)
+        encoded = encode_value(value)
+    return encoded
+
+
+def encode_scalar(value):
+    """encode_value() of a template field; str and bytes fragments are cached"""
+    kind = type(value)
+    if kind is int:
+        return encode_int(value)
+    if kind is not str and kind is not bytes:
+        return encode_value(value)  # floats (NaN never hits a cache), lists, dicts, ...
+    key = (kind, value)  # keeps b"1" apart from "1"
+    encoded = _fragments.get(key)
+    if encoded is None:
+        encoded = encode_value(value)
+        if len(_fragments) < _FRAGMENT_LIMIT:
+            _fragments[key] = encoded
+    return encoded
+
+
+def encode(value):
+    """Binary payload: MAGIC + value"""
+    return bytes(_encode(value, bytearray(_MAGIC)))
+
+
+def _decode(data, i, depth=0):
+    tag = data[i]
+    i += 1
+    if tag < 0x80:
+        return tag, i
+    if tag < FIXLIST:
+        end = i + (tag & 0x1F)
+        return data[i:end].decode("utf-8"), end
+    if tag < FIXMAP:
+        return _decode_list(data, i, tag & 0x0F, depth + 1)
+    if tag < NULL:
+        return _decode_map(data, i, tag & 0x0F, depth + 1)
+    if tag >= 0xE0:
+        return tag - 0x100, i
+    if tag == SYMBOL:
+        return SYMBOLS[data[i]], i + 1
+    if tag == DIGITS:
+        return str(int.from_bytes(data[i:i + 4], "big")), i + 4
+    if tag == NULL:
+        return None, i
+    if tag == FALSE:
+        return False, i
+    if tag == TRUE:
+        return True, i
+    if tag == WHOLE_FLOAT:
+        return float(_FIXED[16].unpack_from(data, i)[0]), i + 2
+    if tag == FLOAT32:
+        return _unpack_f(data[i:i + 4])[0], i + 4
+    if tag == FLOAT64:
+        return struct.unpack_from(">d", data, i)[0], i + 8
+    if INT8 <= tag <= INT64:
+        fixed = _FIXED[8 << (tag - INT8)]
+        return fixed.unpack_from(data, i)[0], i + fixed.size
+    if tag == STR8:
+        end = i + 1 + data[i]
+        return data[i + 1:end].decode("utf-8"), end
+    if tag == STR16:
+        end = i + 2 + int.from_bytes(data[i:i + 2], "big")
+        return data[i + 2:end].decode("utf-8"), end
+    if tag == LIST16:
+        return _decode_list(data, i + 2, int.from_bytes(data[i:i + 2], "big"), depth + 1)
+    if tag == MAP16:
+        return _decode_map(data, i + 2, int.from_bytes(data[i:i + 2], "big"), depth + 1)
+    raise ValueError(f"unknown binary payload tag 0x{tag:02x}")
+
+
+def _decode_list(data, i, size, depth):
+    if depth > MAX_DEPTH:
+        raise ValueError("binary payload nested too deeply")
+    items = []
+    for _ in range(size):
+        item, i = _decode(data, i, depth)
+        items.append(item)
+    return items, i
+
+
+def _decode_map(data, i, size, depth):
+    if depth > MAX_DEPTH:
+        raise ValueError("binary payload nested too deeply")
+    result = {}
+    for _ in range(size):
+        # Symbol keys and symbol or small-int values are most of every simulator message
+        if data[i] == SYMBOL:
+            key = SYMBOLS[data[i + 1]]
+            i += 2
+        else:
+            key, i = _decode(data, i, depth)
+            if type(key) is not str:
+                raise ValueError(f"binary payload map key is {type(key).__name__}, not str")
+        tag = data[i]
+        if tag == SYMBOL:
+            result[key] = SYMBOLS[data[i + 1]]
+            i += 2
+        elif tag < 0x80:
+            result[key] = tag
+            i += 1
+        else:
+            result[key], i = _decode(data, i, depth)
+    return result, i
+
+
+def decode(payload):
+    """Value of a binary payload (MAGIC included); ValueError if it is malformed"""
+    try:
+        value, end = _decode(payload, 1)
+    except (IndexError, struct.error) as e:
+        raise ValueError(f"truncated binary payload: {e}") from None
+    except (TypeError, RecursionError) as e:
+        raise ValueError(f"malformed binary payload: {e}") from None
+    if end != len(payload):
+        raise ValueError("malformed binary payload: length does not match its content")
+    return value
+
+
+def is_binary(payload):
+    return payload[:1] == _MAGIC
+
+
+def decode_payload(payload):
+    """Decode a binary or JSON payload (bytes); raises ValueError for neither"""
+    if payload[:1] == _MAGIC:
+        return decode(payload)
+    return json.loads(payload)
+
+
+def to_json(payload):
+    """JSON text of any payload, for consumers that only take JSON"""
+    if payload[:1] == _MAGIC:
+        return json.dumps(decode(payload))
+    return payload.decode("utf-8") if isinstance(payload, (bytes, bytearray)) else payload
+
+
+_KEY = {symbol: encode_value(symbol) for symbol in SYMBOLS[:SYMBOLS.index("LED")]}
+_MAP4 = _MAGIC + bytes((FIXMAP | 4,))
+_MAP5 = _MAGIC + bytes((FIXMAP | 5,))
+_MAP8 = _MAGIC + bytes((FIXMAP | 8,))
+_MAP9 = _MAGIC + bytes((FIXMAP | 9,))
+_ENTRY4 = bytes((FIXMAP | 4,))
+_FALSE = bytes((FALSE,))
+_TRUE = bytes((TRUE,))
+_ONLINE = _KEY["status"] + encode_value("online")
+_UPTIME, _RSSI = _KEY["uptime"], _KEY["rssi"]
+_MOTION_TRUE = _KEY["pir_motion"] + _TRUE
+_MOTION_FALSE = _KEY["pir_motion"] + _FALSE
+_SCENE_CH_T = _KEY["ch_t"] + encode_value("LED") + _KEY["ch_addr"]
+
+
+def _timer_head(ch_addr, cmd):
+    """Constant fields of a timer reply after device_id"""
+    return _KEY["ch_t"] + encode_value("TIMER") + _KEY["ch_addr"] + encode_value(ch_addr) + _KEY["cmd"] + encode_value(cmd)
+
+
+_TIMER_CONFIG = _timer_head("TIMER_CONFIG", 201)
+_TIMER_STATUS = _timer_head("TIMER_STATUS", 203)
+_ALL_SENSORS = _timer_head("ALL_SENSORS", 204) + _KEY["sensors"]
+_SUCCESS = _KEY["status"] + encode_value("success")
+_ERROR = _KEY["status"] + encode_value("error") + _KEY["error"]
+_CURRENT = _KEY["status"] + encode_value("current")
+_SENSOR_ID, _PORT, _TIMER_VALUE = _KEY["sensor_id"], _KEY["port"], _KEY["timer_value"]
+_ACTIVE_TRUE = _KEY["active"] + _TRUE
+_ACTIVE_FALSE = _KEY["active"] + _FALSE
+
+# Shared across devices, like the JSON templates' status tails
+_status_tails = {}
+_STATUS_TAIL_LIMIT = 8192
+
+
+def status_tail(ch_t, ch_addr, status):
+    key = (ch_t, ch_addr, status)
+    tail = _status_tails.get(key)
+    if tail is None:
+        tail = (_KEY["ch_t"] + encode_value(ch_t) + _KEY["ch_addr"] + encode_value(ch_addr)
+                + _KEY["status"] + encode_value(status))
+        if len(_status_tails) < _STATUS_TAIL_LIMIT:
+            _status_tails[key] = tail
+    return tail
+
+
+class BinaryPayloadTemplates:
+    """PayloadTemplates' interface, producing bin1 payloads (discovery stays JSON: it comes before negotiation)"""
+
+    __slots__ = ("device_id", "device_head", "pir_cache", "config_response", "discovery")
+
+    def __init__(self, device_id, serial_number="234AM87697", firmware="v1.0.0.1", mac="AA:BB:CC:DD:EE:FF",
+                 codecs=()):
+        self.device_id = device_id
+        self.device_head = _KEY["device_id"] + encode_value(device_id)
+        self.pir_cache = {}
+        self.config_response = encode({"ch_t": "LED", "ch_addr": "LED1", "cmd": 100, "cmd_m": "config"})
+        self.discovery = discovery_payload(device_id, serial_number, firmware, mac, codecs)
+
+    def status_update(self, ch_t, ch_addr, status):
+        return _MAP4 + self.device_head + status_tail(ch_t, ch_addr, status)
+
+    def scene_status(self, channels, status):
+        channels = list(channels)
+        if 0 < len(channels) < 16 and min(channels) >= 0 and max(channels) < 128:
+            addresses = bytes((FIXLIST | len(channels),)) + bytes(channels)  # ints 0..127 are their own byte
+        else:
+            addresses = encode_value(channels)
+        return _MAP4 + self.device_head + _SCENE_CH_T + addresses + _KEY["status"] + encode_scalar(status)
+
+    def pir_status(self, port, sensor_id, motion):
+        key = (port, sensor_id, motion)
+        payload = self.pir_cache.get(key)
+        if payload is None:
+            payload = self.pir_cache[key] = encode({
+                "ch_t": "PIR",
+                "ch_addr": f"Port-{port}_{sensor_id}",
+                "cmd": 115,
+                "cmd_m": f"PIR State = {'1' if motion else '0'}"
+            })
+        return payload
+
+    def ping(self, uptime, motion, rssi=-50):
+        return b"".join((_MAP5, self.device_head, _ONLINE, _UPTIME, encode_int(uptime), _RSSI, encode_int(rssi),
+                         _MOTION_TRUE if motion else _MOTION_FALSE))
+
+    def _timer_fields(self, sensor_id, port, timer_value):
+        return b"".join((_SENSOR_ID, encode_scalar(sensor_id), _PORT, encode_scalar(port),
+                         _TIMER_VALUE, encode_scalar(timer_value)))
+
+    def timer_set(self, sensor_id, port, timer_value):
+        """cmd 201 success confirmation"""
+        return _MAP8 + self.device_head + _TIMER_CONFIG + self._timer_fields(sensor_id, port, timer_value) + _SUCCESS
+
+    def timer_error(self, sensor_id, port, timer_value, error):
+        """cmd 201 error response"""
+        return (_MAP9 + self.device_head + _TIMER_CONFIG + self._timer_fields(sensor_id, port, timer_value)
+                + _ERROR + encode_scalar(error))
+
+    def timer_current(self, sensor_id, port, timer_value):
+        """cmd 203 reply to a single-sensor query"""
+        return _MAP8 + self.device_head + _TIMER_STATUS + self._timer_fields(sensor_id, port, timer_value) + _CURRENT
+
+    def all_timers(self, sensors):
+        """cmd 204 reply; sensors is an iterable of (sensor_id, port, timer_value, active)"""
+        parts = [_MAP5, self.device_head, _ALL_SENSORS, b""]
+        for sensor_id, port, timer_value, active in sensors:
+            parts += (_ENTRY4, _SENSOR_ID, encode_scalar(sensor_id), _PORT, encode_scalar(port),
+                      _TIMER_VALUE, encode_scalar(timer_value), _ACTIVE_TRUE if active else _ACTIVE_FALSE)
+        count = (len(parts) - 4) // 8
+        parts[3] = bytes((FIXLIST | count,)) if count < 16 else bytes((LIST16,)) + _pack_H(count)
+        return b"".join(parts)
+
+
+class Codec:
+    """A named payload encoding: templates for outbound messages, decode for inbound ones"""
+
+    __slots__ = ("name", "templates", "encode", "decode")
+
+    def __init__(self, name, templates, encode, decode):
+        self.name = name
+        self.templates = templates
+        self.encode = encode
+        self.decode = decode
+
+
+JSON = Codec("json", PayloadTemplates, json.dumps, json.loads)
+BIN1 = Codec("bin1", BinaryPayloadTemplates, encode, decode)
+CODECS = {codec.name: codec for codec in (JSON, BIN1)}
+
+
+def negotiate(offered, accepted):
+    """First codec the device offered that the backend accepts ("json" if none)"""
+    if isinstance(offered, (list, tuple)):
+        for name in offered:
+            if name in accepted and name in CODECS:
+                return name
+    return JSON.name
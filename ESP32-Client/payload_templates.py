@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Pre-serialized JSON payload templates for the simulator's outbound messages
+Each device builds its constant fragments once; sending a message only splices
+the variable fields in. Output is byte-identical to json.dumps() of the
+equivalent dict (default separators, ensure_ascii)
+"""
+
+import json
+
+_dumps = json.dumps
+
+# Shared across devices: status tails depend only on (ch_t, ch_addr, status)
+_status_tails = {}
+_STATUS_TAIL_LIMIT = 8192
+
+
+def json_value(value):
+    """json.dumps(value), short-circuiting the common scalar types"""
+    kind = type(value)
+    if kind is int:
+        return int.__repr__(value)
+    if kind is bool:
+        return "true" if value else "false"
+    if kind is float and value - value == 0:  # finite
+        return float.__repr__(value)
+    return _dumps(value)
+
+
+def status_tail(ch_t, ch_addr, status):
+    key = (ch_t, ch_addr, status)
+    tail = _status_tails.get(key)
+    if tail is None:
+        tail = f', "ch_t": {_dumps(ch_t)}, "ch_addr": {_dumps(ch_addr)}, "status": {_dumps(status)}}}'
+        if len(_status_tails) < _STATUS_TAIL_LIMIT:
+            _status_tails[key] = tail
+    return tail
+
+
+def discovery_payload(device_id, serial_number, firmware, mac, codecs=()):
+    """Discovery JSON; "codecs" lists the payload codecs a device offers (payload_codec)"""
+    discovery = {"device_id": device_id, "SNO": serial_number, "Firmware": firmware, "MacAddr": mac}
+    if codecs:
+        discovery["codecs"] = list(codecs)
+    return _dumps(discovery)
+
+
+class PayloadTemplates:
+    """Outbound payloads for one device_id"""
+
+    __slots__ = ("device_head", "pir_cache", "config_response", "discovery")
+
+    def __init__(self, device_id, serial_number="234AM87697", firmware="v1.0.0.1", mac="AA:BB:CC:DD:EE:FF",
+                 codecs=()):
+        self.device_head = '{"device_id": ' + _dumps(device_id)
+        self.pir_cache = {}
+        self.config_response = _dumps({"ch_t": "LED", "ch_addr": "LED1", "cmd": 100, "cmd_m": "config"})
+        self.discovery = discovery_payload(device_id, serial_number, firmware, mac, codecs)
+
+    def status_update(self, ch_t, ch_addr, status):
+        return self.device_head + status_tail(ch_t, ch_addr, status)
+
+    def scene_status(self, channels, status):
+        return (self.device_head + ', "ch_t": "LED", "ch_addr": ['
+                + ", ".join(map(str, channels)) + '], "status": ' + _dumps(status) + "}")
+
+    def pir_status(self, port, sensor_id, motion):
+        key = (port, sensor_id, motion)
+        payload = self.pir_cache.get(key)
+        if payload is None:
+            payload = _dumps({
+                "ch_t": "PIR",
+                "ch_addr": f"Port-{port}_{sensor_id}",
+                "cmd": 115,
+                "cmd_m": f"PIR State = {'1' if motion else '0'}"
+            })
+            self.pir_cache[key] = payload
+        return payload
+
+    def ping(self, uptime, motion, rssi=-50):
+        return (self.device_head + ', "status": "online", "uptime": ' + json_value(uptime)
+                + ', "rssi": ' + json_value(rssi) + ', "pir_motion": ' + ("true" if motion else "false") + "}")
+
+    def _timer_head(self, ch_addr, cmd, sensor_id, port, timer_value):
+        return (self.device_head + ', "ch_t": "TIMER", "ch_addr": "' + ch_addr + '", "cmd": ' + cmd
+                + ', "sensor_id": ' + json_value(sensor_id) + ', "port": ' + json_value(port)
+                + ', "timer_value": ' + json_value(timer_value))
+
+    def timer_set(self, sensor_id, port, timer_value):
+        """cmd 201 success confirmation"""
+        return self._timer_head("TIMER_CONFIG", "201", sensor_id, port, timer_value) + ', "status": "success"}'
+
+    def timer_error(self, sensor_id, port, timer_value, error):
+        """cmd 201 error response"""
+        return (self._timer_head("TIMER_CONFIG", "201", sensor_id, port, timer_value)
+                + ', "status": "error", "error": ' + _dumps(error) + "}")
+
+    def timer_current(self, sensor_id, port, timer_value):
+        """cmd 203 reply to a single-sensor query"""
+        return self._timer_head("TIMER_STATUS", "203", sensor_id, port, timer_value) + ', "status": "current"}'
+
+    def all_timers(self, sensors):
+        """cmd 204 reply; sensors is an iterable of (sensor_id, port, timer_value, active)"""
+        entries = ", ".join(
+            '{"sensor_id": ' + json_value(sensor_id) + ', "port": ' + json_value(port)
+            + ', "timer_value": ' + json_value(timer_value) + ', "active": ' + ("true" if active else "false") + "}"
+            for sensor_id, port, timer_value, active in sensors
+        )
+        return self.device_head + ', "ch_t": "TIMER", "ch_addr": "ALL_SENSORS", "cmd": 204, "sensors": [' + entries + "]}"
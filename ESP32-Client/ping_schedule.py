@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Session ping scheduling for simulated devices
+PingSchedule decides when a device's next sessionPing goes out. A fleet gives
+each device a phase offset so pings spread over the whole interval, jitter
+keeps them from drifting back into step, and in adaptive mode a device that
+sent a status within the last interval puts its ping off, since the backend is
+seeing traffic from it anyway. A ping is never put off for longer than
+max_gap, which stays under the backend's inactivity timeout (60 s in
+mqtt.service.ts, which only counts pings)
+"""
+
+import random
+
+PING_INTERVAL = 30.0  # seconds, as in the firmware
+MAX_PING_GAP = 50.0  # longest wait between two pings; the backend drops a device after 60 s
+
+
+class PingSchedule:
+    """Shared by every device of a fleet; the per-device state (last ping, last status) stays on the device"""
+
+    __slots__ = ("interval", "jitter", "adaptive", "max_gap", "rng")
+
+    def __init__(self, interval=PING_INTERVAL, jitter=0.0, adaptive=False, max_gap=MAX_PING_GAP, rng=None):
+        self.interval = interval
+        self.jitter = jitter  # fraction of the interval, e.g. 0.1 = +/-10%
+        self.adaptive = adaptive
+        self.max_gap = max_gap
+        self.rng = rng if rng is not None else random
+
+    def phase(self, index=None, count=None):
+        """Delay before a device's first ping: slot index of count, or random without them"""
+        if index is None or not count:
+            return self.rng.uniform(0, self.interval)
+        return self.interval * index / count
+
+    def longest_gap(self):
+        return max(self.max_gap, self.interval)
+
+    def next_delay(self):
+        """Delay from one ping to the next"""
+        if not self.jitter:
+            return self.interval
+        spread = self.interval * self.jitter
+        return min(self.interval + self.rng.uniform(-spread, spread), self.longest_gap())
+
+    def deferral(self, now, last_ping, last_status):
+        """Adaptive mode: how much longer a due ping can wait (0 = send it now)
+
+        A status sent within the last interval already shows the device is up,
+        so the ping moves to one interval after that status, but never past
+        last_ping + max_gap.
+        """
+        if not self.adaptive or last_ping is None or last_status is None:
+            return 0.0
+        if now - last_status >= self.interval:
+            return 0.0
+        wait = min(last_status + self.interval, last_ping + self.longest_gap()) - now
+        return wait if wait > 0 else 0.0
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+PIR sensor state machine for the ESP32 simulator
+Each (sensor_id, port) on a device runs the firmware's checkPIRMotion logic on
+its own: the first motion sends a status and starts the sense timer, further
+motion stays on serial, and the timer's expiry - an entry on the device's
+shared TimerScheduler, not a thread - sends no motion
+"""
+
+from sim_metrics import METRICS
+
+DEFAULT_SENSE_TIMEOUT = 30 * 1000  # ms
+
+MOTION_EVENTS = METRICS.counter("motion_events_total", "PIR readings by state", ("state",))
+TIMER_EXPIRATIONS = METRICS.counter("timer_expirations_total", "Sense timers that ran out and sent no motion")
+
+
+class PirSensor:
+    """Motion/timer state of one PIR sensor on a simulated device"""
+
+    __slots__ = ("device", "sensor_id", "port", "sense_timeout", "motion_detected",
+                 "first_motion_sent", "timer_active", "timer_start", "timer")
+
+    def __init__(self, device, sensor_id, port, sense_timeout=DEFAULT_SENSE_TIMEOUT):
+        self.device = device
+        self.sensor_id = sensor_id
+        self.port = port
+        self.sense_timeout = sense_timeout
+        self.motion_detected = False
+        self.first_motion_sent = False
+        self.timer_active = False
+        self.timer_start = 0
+        self.timer = None
+
+    @property
+    def key(self):
+        return self.sensor_id, self.port
+
+    def motion(self, motion_state):
+        """A PIR reading (like ESP32 checkPIRMotion)"""
+        device = self.device
+        log = device.log
+        MOTION_EVENTS.inc(("motion",) if motion_state else ("no_motion",))
+        if motion_state:
+            log.info("🔴 PIR MOTION DETECTED! (sensor %s, port %s)", self.sensor_id, self.port)
+            self.motion_detected = True
+
+            if not self.first_motion_sent:
+                log.info("📤 FIRST MOTION - Sending MQTT config to turn ON lights")
+                device.send_pir_status("motion_detected", self)
+                self.first_motion_sent = True
+                self.timer_start = device.clock.time() * 1000
+                self.timer_active = True
+                self.arm_timer()
+                log.info("⏰ Timer started (%s seconds) - subsequent motion will show on serial only",
+                         self.sense_timeout / 1000)
+            else:
+                log.debug("⏳ Motion during timer period - Serial only (NO MQTT)")
+        else:
+            log.info("🟢 PIR NO MOTION (sensor %s, port %s)", self.sensor_id, self.port)
+            self.motion_detected = False
+
+            if not self.timer_active:
+                log.info("📤 Sending no motion MQTT to turn OFF lights")
+                device.send_pir_status("no_motion", self)
+                self.first_motion_sent = False
+            else:
+                log.debug("⏳ No motion detected but timer still active - showing on serial only")
+
+    def remaining(self):
+        """Seconds left on the running timer (0 when idle)"""
+        if not self.timer_active:
+            return 0.0
+        return max(0.0, (self.timer_start + self.sense_timeout - self.device.clock.time() * 1000) / 1000)
+
+    def arm_timer(self):
+        """Schedule the no-motion expiry for the current timer period"""
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = self.device.scheduler.call_later(self.remaining(), self.on_timer_expired)
+
+    def on_timer_expired(self):
+        """Scheduler callback: sense timeout reached"""
+        self.timer = None
+        if not self.timer_active:
+            return
+        self.expire()
+
+    def check_timeout(self):
+        """Polling alternative to the scheduler callback"""
+        if self.timer_active and (self.device.clock.time() * 1000 - self.timer_start > self.sense_timeout):
+            self.cancel()
+            self.expire()
+
+    def expire(self):
+        TIMER_EXPIRATIONS.inc()
+        log = self.device.log
+        log.info("⏰ Timer expired - sending no motion MQTT to turn OFF lights")
+        log.info("   Timer was active for: %.1f seconds", (self.device.clock.time() * 1000 - self.timer_start) / 1000)
+        self.device.send_pir_status("no_motion", self)
+        self.motion_detected = False
+        self.first_motion_sent = False
+        self.timer_active = False
+        log.debug("🔄 Timer reset - ready for next motion cycle")
+
+    def set_timeout(self, timeout_ms):
+        """Change the sense timeout, moving a running timer to the new deadline"""
+        self.sense_timeout = timeout_ms
+        if self.timer_active:
+            self.arm_timer()
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
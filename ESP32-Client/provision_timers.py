@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Bulk timer provisioning
+Pushes cmd 200 timer updates from a CSV/JSON manifest of
+(device_id, sensor_id, port, timer_value) rows to any number of devices over a
+single MQTT connection, keeping a bounded window of requests in flight. Each
+row completes on its 201 confirmation; timeouts are retried with backoff and a
+summary with throughput and failures is printed at the end
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+
+from mqtt_transport import DEFAULT_BROKER_HOST
+from timer_client import AsyncTimerClient, TimerError
+
+MQTT_BROKER = DEFAULT_BROKER_HOST  # Your MQTT broker IP (MQTT_BROKER env var overrides)
+MQTT_PORT = 1883
+MANIFEST_FIELDS = ("device_id", "sensor_id", "port", "timer_value")
+
+
+class ProvisionRow:
+    """One manifest row and its outcome"""
+
+    __slots__ = ("device_id", "sensor_id", "port", "timer_value", "attempts", "error")
+
+    def __init__(self, device_id, sensor_id, port, timer_value):
+        self.device_id = str(device_id)
+        self.sensor_id = int(sensor_id)
+        self.port = int(port)
+        self.timer_value = int(timer_value)
+        self.attempts = 0
+        self.error = None
+
+
+def load_manifest(path):
+    """Rows from a CSV (header: device_id,sensor_id,port,timer_value) or a JSON list of objects"""
+    with open(path, newline="") as manifest:
+        if path.lower().endswith(".json"):
+            entries = json.load(manifest)
+            if isinstance(entries, dict):
+                entries = entries.get("rows", [])
+        else:
+            entries = list(csv.DictReader(manifest))
+
+    rows = []
+    for line, entry in enumerate(entries, start=1):
+        missing = [field for field in MANIFEST_FIELDS if entry.get(field) in (None, "")]
+        if missing:
+            raise ValueError(f"{path} row {line}: missing {', '.join(missing)}")
+        try:
+            rows.append(ProvisionRow(*(entry[field] for field in MANIFEST_FIELDS)))
+        except (TypeError, ValueError):
+            raise ValueError(f"{path} row {line}: sensor_id, port and timer_value must be integers")
+    return rows
+
+
+class TimerProvisioner:
+    """Sends every row with at most window requests outstanding"""
+
+    def __init__(self, timers, window=500, timeout=5.0, retries=3, backoff=0.5):
+        self.timers = timers
+        self.window = window
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.confirmed = 0
+        self.failed = []
+        self.retried = 0
+
+    async def provision(self, rows, progress=None):
+        semaphore = asyncio.Semaphore(self.window)
+
+        async def run(row):
+            async with semaphore:
+                await self.provision_row(row)
+            if progress is not None:
+                progress(self)
+
+        await asyncio.gather(*(run(row) for row in rows))
+
+    async def provision_row(self, row):
+        if not (5 <= row.timer_value <= 3600):
+            row.error = "Invalid timer value. Must be 5-3600 seconds"
+            self.failed.append(row)
+            return
+        while True:
+            row.attempts += 1
+            try:
+                await self.timers.set_timer(row.timer_value, row.sensor_id, row.port,
+                                            timeout=self.timeout, device_id=row.device_id)
+            except TimerError as e:
+                row.error = str(e)  # the device answered; retrying would get the same answer
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                row.error = str(e) or "no confirmation"
+                if row.attempts <= self.retries:
+                    self.retried += 1
+                    await asyncio.sleep(self.backoff * 2 ** (row.attempts - 1))
+                    continue
+            else:
+                row.error = None
+                self.confirmed += 1
+                return
+            self.failed.append(row)
+            return
+
+
+def write_failures(rows, path):
+    """Failed rows as a manifest, so they can be re-run directly"""
+    with open(path, "w", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(MANIFEST_FIELDS + ("error",))
+        for row in rows:
+            writer.writerow([row.device_id, row.sensor_id, row.port, row.timer_value, row.error])
+
+
+async def run_provisioning(args, rows):
+    timers = AsyncTimerClient(None, args.host, args.port, timeout=args.timeout)
+    print(f"🔌 Connecting to MQTT broker: {args.host}:{args.port}")
+    await timers.connect()
+    provisioner = TimerProvisioner(timers, args.window, args.timeout, args.retries, args.backoff)
+    started = time.perf_counter()
+    report_every = max(1, len(rows) // 10)
+
+    def progress(p):
+        done = p.confirmed + len(p.failed)
+        if done % report_every == 0:
+            print(f"   {done}/{len(rows)} done ({p.confirmed} confirmed, {len(p.failed)} failed)")
+
+    try:
+        await provisioner.provision(rows, progress)
+    finally:
+        await timers.close()
+    return provisioner, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provision PIR sensor timers from a manifest")
+    parser.add_argument("manifest", help="CSV or JSON file of device_id,sensor_id,port,timer_value rows")
+    parser.add_argument("--host", default=MQTT_BROKER, help='MQTT broker host ("memory" = in-process)')
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--window", type=int, default=500, help="maximum requests in flight")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds to wait for each 201 confirmation")
+    parser.add_argument("--retries", type=int, default=3, help="retries per row after a timeout")
+    parser.add_argument("--backoff", type=float, default=0.5, help="first retry delay, doubled per retry")
+    parser.add_argument("--failures", help="write failed rows to this CSV for a re-run")
+    args = parser.parse_args()
+
+    print("🧪 Bulk Timer Provisioning")
+    print("=" * 50)
+    try:
+        rows = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+    devices = len({row.device_id for row in rows})
+    print(f"📋 {len(rows)} sensors on {devices} devices, window {args.window}")
+
+    provisioner, elapsed = asyncio.run(run_provisioning(args, rows))
+
+    print("\n📊 Summary")
+    print(f"   confirmed:  {provisioner.confirmed}/{len(rows)}")
+    print(f"   failed:     {len(provisioner.failed)}")
+    print(f"   retries:    {provisioner.retried}")
+    print(f"   elapsed:    {elapsed:.2f}s ({provisioner.confirmed / elapsed if elapsed else 0:.0f} confirmations/s)")
+    for row in provisioner.failed[:10]:
+        print(f"   ❌ {row.device_id} sensor {row.sensor_id} port {row.port}: {row.error}")
+    if len(provisioner.failed) > 10:
+        print(f"   ... and {len(provisioner.failed) - 10} more")
+    if provisioner.failed:
+        if args.failures:
+            write_failures(provisioner.failed, args.failures)
+            print(f"💾 Failed rows written to {args.failures}")
+        sys.exit(1)
+    print("✅ All timers provisioned")
+
+
+if __name__ == "__main__":
+    main()
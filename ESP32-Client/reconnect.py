@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Reconnect policy for simulated devices
+Backoff spaces reconnect attempts with "full jitter" exponential backoff (a
+random delay up to a doubling cap), so devices that lose the broker together
+do not all come back in the same instant. OfflineQueue holds a device's QoS 0
+publishes while it is disconnected, keeping only the latest message for each
+channel so a reconnect sends current state rather than every intermediate one
+"""
+
+import random
+from collections import OrderedDict
+
+
+class Backoff:
+    """Jittered exponential backoff: attempt n waits uniform(0, min(maximum, initial * factor ** n))"""
+
+    def __init__(self, initial=1.0, maximum=60.0, factor=2.0, rng=None):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.rng = rng if rng is not None else random.Random()
+        self.attempts = 0
+
+    def next_delay(self):
+        cap = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return self.rng.uniform(0, cap)
+
+    def reset(self):
+        """Call once connected again"""
+        self.attempts = 0
+
+
+class OfflineQueue:
+    """Bounded, coalescing queue of (topic, payload, qos, retain) waiting for a connection
+
+    Messages put with the same key replace each other (the latest moves to the
+    back); messages without a key are all kept. When full, the oldest entry is
+    dropped.
+    """
+
+    def __init__(self, limit=64):
+        self.limit = limit
+        self.entries = OrderedDict()  # key -> (topic, payload, qos, retain)
+        self.dropped = 0
+        self.coalesced = 0
+        self._seq = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, topic, payload, qos=0, retain=False, key=None):
+        entries = self.entries
+        if key is None:
+            self._seq += 1
+            key = ("seq", self._seq)
+        elif key in entries:
+            del entries[key]
+            self.coalesced += 1
+        entries[key] = (topic, payload, qos, retain)
+        if len(entries) > self.limit:
+            entries.popitem(last=False)
+            self.dropped += 1
+
+    def peek(self):
+        """Oldest entry, or None when empty"""
+        for entry in self.entries.values():
+            return entry
+        return None
+
+    def pop(self):
+        return self.entries.popitem(last=False)[1]
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Pluggable clocks for the ESP32 simulator
+RealClock reads the system time; VirtualClock is a discrete-event clock that
+jumps straight to the next scheduled timer, so hours of PIR/timer/ping traffic
+replay in seconds with reproducible timestamps
+"""
+
+import time
+from datetime import datetime, timezone
+
+from timer_scheduler import TimerScheduler
+
+# Fixed start of simulated time so virtual runs are reproducible (2024-01-01 00:00:00 UTC)
+VIRTUAL_EPOCH = 1704067200.0
+
+
+class RealClock:
+    """Wall-clock time, real sleeps"""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def make_scheduler(self):
+        """A new scheduler for one device (fleets share theirs explicitly)"""
+        return TimerScheduler(clock=self.monotonic)
+
+
+class VirtualClock:
+    """Discrete-event clock: time only moves when advanced, firing timers in order"""
+
+    def __init__(self, start=VIRTUAL_EPOCH):
+        self._now = float(start)
+        self.scheduler = TimerScheduler(clock=self.monotonic)
+
+    def time(self):
+        return self._now
+
+    def monotonic(self):
+        return self._now
+
+    def now(self):
+        return datetime.fromtimestamp(self._now, timezone.utc)
+
+    def sleep(self, seconds):
+        """Sleeping advances simulated time, running every event due meanwhile"""
+        self.advance(seconds)
+
+    def make_scheduler(self):
+        """All devices on a virtual clock share its single event queue"""
+        return self.scheduler
+
+    def advance(self, seconds):
+        return self.run_until(self._now + seconds)
+
+    def run_until(self, end):
+        """Jump from event to event up to end; returns how many timers fired"""
+        fired = 0
+        scheduler = self.scheduler
+        while True:
+            deadline = scheduler.next_deadline()
+            if deadline is None or deadline > end:
+                break
+            if deadline > self._now:
+                self._now = deadline
+            fired += scheduler.run_due(self._now)
+        if end > self._now:
+            self._now = end
+        return fired
+
+
+REAL_CLOCK = RealClock()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Logging for the ESP32 simulator
+Level-gated, lazily formatted log calls feed a queue drained by one background
+writer thread, so hot paths never block on stdout. Console output keeps the
+simulator's "HH:MM:SS.mmm -> message" style; an optional JSON-lines sink
+records the same events for tooling
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOGGER_NAME = "esp32sim"
+
+_listener = None
+
+
+def get_logger(name=None):
+    """Simulator logger (child loggers share the configured handlers)"""
+    return logging.getLogger(LOGGER_NAME if name is None else f"{LOGGER_NAME}.{name}")
+
+
+def device_logger(device_id):
+    """Logger adapter that tags every record with a device_id"""
+    return logging.LoggerAdapter(get_logger("device"), {"device_id": device_id})
+
+
+class ConsoleFormatter(logging.Formatter):
+    """HH:MM:SS.mmm -> message"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s.%(msecs)03d -> %(message)s", datefmt="%H:%M:%S")
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        device_id = getattr(record, "device_id", None)
+        if device_id is not None:
+            entry["device_id"] = device_id
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted; the writer thread does all formatting"""
+
+    def prepare(self, record):
+        return record
+
+
+class ClockFilter(logging.Filter):
+    """Stamp records with a simulator clock (e.g. a VirtualClock) instead of wall time"""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def filter(self, record):
+        now = self.clock.time()
+        record.created = now
+        record.msecs = (now - int(now)) * 1000
+        return True
+
+
+def configure_logging(level=logging.INFO, json_path=None, console=True, clock=None):
+    """Route simulator logs through a queue to the console and/or a JSON-lines file
+
+    Calling it again replaces the previous configuration.
+    """
+    global _listener
+    shutdown_logging()
+
+    handlers = []
+    if console:
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(ConsoleFormatter())
+        handlers.append(stream)
+    if json_path:
+        sink = logging.FileHandler(json_path, encoding="utf-8")
+        sink.setFormatter(JsonLinesFormatter())
+        handlers.append(sink)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    if clock is not None:
+        queue_handler.addFilter(ClockFilter(clock))
+
+    logger = get_logger()
+    logger.handlers[:] = [queue_handler]
+    logger.setLevel(level)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Metrics for the ESP32 simulator
+Counters, gauges and fixed-bucket histograms kept in plain dicts keyed by label
+tuples, so recording one sample is a dict update (and a bisect for histograms).
+Values are rendered only when read: as Prometheus text from a local HTTP
+endpoint, or as JSON snapshots written periodically to a file
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds, 10 us .. 1 s: covers dispatch and publish times as well as broker round trips
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+perf_counter = time.perf_counter
+
+
+def label_value(value):
+    return "none" if value is None else str(value)
+
+
+def escape_label_value(value):
+    """Label value as the text exposition format quotes it (backslash, quote and newline escaped)"""
+    text = label_value(value)
+    if "\\" in text or '"' in text or "\n" in text:
+        text = text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return text
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label tuple"""
+
+    kind = "counter"
+    __slots__ = ("name", "help", "labelnames", "values")
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label tuple -> count
+        if not self.labelnames:
+            self.values[()] = 0  # an unlabelled series is reported even before its first update
+
+    def inc(self, labels=(), amount=1):
+        values = self.values
+        values[labels] = values.get(labels, 0) + amount
+
+    def total(self):
+        return sum(self.values.values())
+
+    def samples(self):
+        return [(self.name, labels, value) for labels, value in dict(self.values).items()]
+
+    def snapshot(self):
+        return {",".join(map(label_value, labels)): value for labels, value in dict(self.values).items()}
+
+
+class Gauge(Counter):
+    """Current value per label tuple, set directly or read from a function at scrape time"""
+
+    kind = "gauge"
+    __slots__ = ("function",)
+
+    def __init__(self, name, help, labelnames=(), function=None):
+        super().__init__(name, help, labelnames)
+        self.function = function  # () -> {label tuple: value}
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def _current(self):
+        if self.function is not None:
+            return dict(self.function())
+        return dict(self.values)
+
+    def samples(self):
+        return [(self.name, labels, value) for labels, value in self._current().items()]
+
+    def snapshot(self):
+        return {",".join(map(label_value, labels)): value for labels, value in self._current().items()}
+
+
+class Histogram:
+    """Fixed-bucket distribution per label tuple (bucket counts, sum, count)"""
+
+    kind = "histogram"
+    __slots__ = ("name", "help", "labelnames", "buckets", "values")
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label tuple -> [count per bucket..., count above the last bucket, sum]
+
+    def observe(self, value, labels=()):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def time(self, labels=()):
+        """Context manager observing the elapsed wall time of its block"""
+        return _Timed(self, labels)
+
+    def samples(self):
+        samples = []
+        for labels, entry in dict(self.values).items():
+            entry = list(entry)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry):
+                cumulative += count
+                samples.append((self.name + "_bucket", labels, cumulative, f'le="{format_number(bound)}"'))
+            samples.append((self.name + "_sum", labels, entry[-1]))
+            samples.append((self.name + "_count", labels, cumulative))
+        return samples
+
+    def snapshot(self):
+        result = {}
+        for labels, entry in dict(self.values).items():
+            entry = list(entry)
+            count = sum(entry[:-1])
+            result[",".join(map(label_value, labels))] = {
+                "count": count,
+                "sum": entry[-1],
+                "mean": entry[-1] / count if count else 0.0,
+                "p50": self._quantile(entry, count, 0.5),
+                "p99": self._quantile(entry, count, 0.99),
+            }
+        return result
+
+    def _quantile(self, entry, count, q):
+        """Upper bound of the bucket holding the q-quantile (None above the last bucket)"""
+        if not count:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, entry):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound
+        return None
+
+
+class _Timed:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(perf_counter() - self.started, self.labels)
+
+
+class MetricsRegistry:
+    """Named metrics of one process
+
+    Updates take no lock: they come from the event loop (or the simulator's
+    few threads), and readers copy each dict before iterating it.
+    """
+
+    def __init__(self, prefix="esp32sim_"):
+        self.prefix = prefix
+        self.metrics = {}
+        self.started = time.time()
+
+    def _add(self, cls, name, *args, **kwargs):
+        name = self.prefix + name
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, *args, **kwargs)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=(), function=None):
+        return self._add(Gauge, name, help, labelnames, function)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram, name, help, labelnames, buckets)
+
+    def reset(self):
+        """Clear every recorded value (metric definitions stay registered)"""
+        for metric in self.metrics.values():
+            metric.values.clear()
+            if isinstance(metric, Counter) and not metric.labelnames:
+                metric.values[()] = 0
+        self.started = time.time()
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for name, metric in list(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample in metric.samples():
+                sample_name, labels, value = sample[:3]
+                extra = sample[3] if len(sample) > 3 else ""
+                lines.append(f"{sample_name}{format_labels(metric.labelnames, labels, extra)} {format_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """JSON-ready view: {"ts", "uptime", "metrics": {name: {"label,values": value}}}"""
+        now = time.time()
+        return {
+            "ts": round(now, 3),
+            "uptime": round(now - self.started, 3),
+            "metrics": {name: metric.snapshot() for name, metric in list(self.metrics.items())},
+        }
+
+
+METRICS = MetricsRegistry()
+
+
+def client_queue_depth(client):
+    """Packets waiting to be written plus unacknowledged QoS>0 publishes of a paho client
+
+    (0 for the in-process client, which delivers synchronously)
+    """
+    return len(getattr(client, "_out_packet", ())) + len(getattr(client, "_out_messages", ()))
+
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text) and /metrics.json from a background thread"""
+
+    def __init__(self, registry=METRICS, host="127.0.0.1", port=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body = registry.render_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/metrics.json":
+                    body = json.dumps(registry.snapshot()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes would flood the console
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class SnapshotWriter:
+    """Appends a JSON snapshot line to a file every interval seconds (and once more on stop)"""
+
+    def __init__(self, path, interval=10.0, registry=METRICS):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        line = json.dumps(self.registry.snapshot())
+        with open(self.path, "a", encoding="utf-8") as output:
+            output.write(line + "\n")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write()
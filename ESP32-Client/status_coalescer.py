@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Status coalescing for rapid channel changes
+A dimmer slider sends a burst of cmd 102 brightness commands; without this
+stage every intermediate level goes out as its own status. StatusCoalescer
+sends the first change of a quiet channel at once, then holds the changes that
+follow within the window and sends only the latest when the channel goes
+quiet again, or after max_delay at most while the burst goes on. On/off
+transitions and non-brightness states (shades) are never held: they cancel
+anything pending for the channel and go out immediately
+"""
+
+import threading
+
+from sim_metrics import METRICS
+
+STATUS_WINDOW = 0.05  # seconds a channel must be quiet before its held status goes out
+STATUS_MAX_DELAY = 0.25  # longest a status is held during a continuous burst
+
+OFF_STATES = ("off", "0%")
+
+STATUS_COALESCED = METRICS.counter("status_coalesced_total", "Status updates replaced by a later one before being sent")
+
+
+def coalescible(status):
+    """Brightness levels can be held; everything else is a discrete state"""
+    return status.endswith("%")
+
+
+class _Pending:
+    __slots__ = ("status", "first", "timer")
+
+    def __init__(self, status, first):
+        self.status = status
+        self.first = first
+        self.timer = None
+
+
+class StatusCoalescer:
+    """Per-channel status hold for one device; send(channel, status) publishes"""
+
+    def __init__(self, send, scheduler, clock, window=STATUS_WINDOW, max_delay=STATUS_MAX_DELAY):
+        self.send = send
+        self.scheduler = scheduler
+        self.clock = clock
+        self.window = window
+        self.max_delay = max_delay
+        self.pending = {}  # channel -> _Pending
+        self.last_sent = {}  # channel -> (clock time, status) of the last status sent
+        self.coalesced = 0  # statuses replaced by a later one before being sent
+        # Commands arrive on the MQTT thread, held statuses go out on the timer thread
+        self._lock = threading.RLock()
+
+    def submit(self, channel, status):
+        """Send or hold a channel's new status; True if it is being held"""
+        with self._lock:
+            return self._submit(channel, status)
+
+    def _submit(self, channel, status):
+        now = self.clock.time()
+        pending = self.pending.get(channel)
+        last = self.last_sent.get(channel)
+        reference = pending.status if pending is not None else (last[1] if last is not None else None)
+        transition = reference is None or (status in OFF_STATES) != (reference in OFF_STATES)
+        if transition or not coalescible(status):
+            if pending is not None:
+                self._cancel(channel, pending)
+                self.coalesced += 1
+                STATUS_COALESCED.inc()
+            self._send(channel, status, now)
+            return False
+        if pending is not None:
+            pending.status = status
+            self.coalesced += 1
+            STATUS_COALESCED.inc()
+            self._arm(channel, pending, now)
+            return True
+        if last is None or now - last[0] >= self.window:
+            self._send(channel, status, now)
+            return False
+        pending = self.pending[channel] = _Pending(status, now)
+        self._arm(channel, pending, now)
+        return True
+
+    def superseded(self, channel, status):
+        """The channel's status went out another way (a scene status): drop what is held"""
+        with self._lock:
+            pending = self.pending.get(channel)
+            if pending is not None:
+                self._cancel(channel, pending)
+                self.coalesced += 1
+                STATUS_COALESCED.inc()
+            self.last_sent[channel] = (self.clock.time(), status)
+
+    def flush(self):
+        """Send everything held now (before shutting down)"""
+        with self._lock:
+            for channel, pending in list(self.pending.items()):
+                self._cancel(channel, pending)
+                self._send(channel, pending.status, self.clock.time())
+
+    def _arm(self, channel, pending, now):
+        # Quiet for a window, but never later than max_delay after the first held change
+        delay = min(now + self.window, pending.first + self.max_delay) - now
+        if pending.timer is not None:
+            pending.timer.cancel()
+        pending.timer = self.scheduler.call_later(max(0.0, delay), self._expire, channel)
+
+    def _expire(self, channel):
+        with self._lock:
+            pending = self.pending.pop(channel, None)
+            if pending is not None:
+                pending.timer = None
+                self._send(channel, pending.status, self.clock.time())
+
+    def _cancel(self, channel, pending):
+        del self.pending[channel]
+        if pending.timer is not None:
+            pending.timer.cancel()
+            pending.timer = None
+
+    def _send(self, channel, status, now):
+        self.last_sent[channel] = (now, status)
+        self.send(channel, status)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test script for EEPROM timer persistence
+Restarts a simulated device on the same EEPROM image after a cmd 200 for the
+default sensor followed by an interactive 'timer' change, and checks the later
+value survives the restart. Runs offline on the in-memory broker
+"""
+
+import os
+import sys
+import tempfile
+
+from eeprom_store import EepromStore
+from esp32_simulator_complete import ESP32Simulator
+from inmemory_broker import InMemoryBroker, InMemoryClient
+
+
+def boot(image, broker):
+    simulator = ESP32Simulator(client=InMemoryClient(broker=broker), eeprom=image)
+    simulator.client.connect()
+    return simulator
+
+
+def test_timer_change_survives_restart():
+    broker = InMemoryBroker()
+    with tempfile.TemporaryDirectory() as directory:
+        with EepromStore(os.path.join(directory, "eeprom.bin")) as store:
+            image = store.image("123456")
+            simulator = boot(image, broker)
+            # cmd 200 for the default sensor (2/1), then 'timer 10' from the console
+            simulator.set_sensor_timer({"ch_t": "TIMER", "cmd": 200, "sensor_id": 2, "port": 1, "timer_value": 60})
+            simulator.set_sense_timeout(10 * 1000)
+            simulator.stop_timers()
+
+            restarted = boot(image, broker)
+            assert restarted.sense_timeout == 10 * 1000, restarted.sense_timeout
+            assert restarted.sensor_timers["2_1"] == 10 * 1000, restarted.sensor_timers
+
+            # Other sensors keep their own slot
+            restarted.set_sensor_timer({"ch_t": "TIMER", "cmd": 200, "sensor_id": 3, "port": 1, "timer_value": 45})
+            restarted.stop_timers()
+            again = boot(image, broker)
+            assert again.sensor_timers == {"2_1": 10 * 1000, "3_1": 45 * 1000}, again.sensor_timers
+            again.stop_timers()
+
+
+if __name__ == "__main__":
+    print("🧪 EEPROM timer persistence test")
+    try:
+        test_timer_change_survives_restart()
+    except AssertionError as e:
+        print(f"❌ Timer restored wrong after restart: {e}")
+        sys.exit(1)
+    print("✅ Timers survive a restart after cmd 200 and 'timer' changes")
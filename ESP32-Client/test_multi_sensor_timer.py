@@ -4,113 +4,77 @@ Test script for Multi-Sensor Timer Configuration via MQTT
 This script demonstrates how to configure timer values for different sensors and ports
 """
 
-import paho.mqtt.client as mqtt
-import json
-import time
-import sys
+import asyncio
+
+from mqtt_transport import DEFAULT_BROKER_HOST
+from timer_client import AsyncTimerClient, TimerError
 
 # MQTT Configuration
-MQTT_BROKER = "192.168.29.128"  # Your MQTT broker IP
+MQTT_BROKER = DEFAULT_BROKER_HOST  # Your MQTT broker IP (MQTT_BROKER env var overrides)
 MQTT_PORT = 1883
 DEVICE_ID = "123456"
+REPLY_TIMEOUT = 5  # seconds to wait for the device's reply
 
-# Topics
-TIMER_TOPIC = f"MPS/global/{DEVICE_ID}/timer"
-STATUS_TOPIC = f"MPS/global/UP/{DEVICE_ID}/status"
-
-def on_connect(client, userdata, flags, rc):
-    """Callback for when the client connects to the broker"""
-    if rc == 0:
-        print("✅ Connected to MQTT broker")
-        # Subscribe to status topic to see responses
-        client.subscribe(STATUS_TOPIC)
-        print(f"📡 Subscribed to: {STATUS_TOPIC}")
-    else:
-        print(f"❌ Failed to connect, return code {rc}")
-
-def on_message(client, userdata, message):
-    """Callback for when a message is received"""
-    try:
-        data = json.loads(message.payload.decode())
-        print(f"📩 Received: {data}")
-    except json.JSONDecodeError:
-        print(f"❌ Invalid JSON received: {message.payload.decode()}")
-
-def set_sensor_timer(client, sensor_id, port, timer_seconds):
+async def set_sensor_timer(timers, sensor_id, port, timer_seconds):
     """Set timer value for specific sensor and port"""
     if not (5 <= timer_seconds <= 3600):
         print("❌ Timer value must be between 5-3600 seconds")
         return False
     
-    timer_config = {
-        "cmd": 200,
-        "sensor_id": sensor_id,
-        "port": port,
-        "timer_value": timer_seconds
-    }
-    
-    payload = json.dumps(timer_config)
-    result = client.publish(TIMER_TOPIC, payload)
-    
-    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-        print(f"📤 Sent timer configuration for Sensor ID:{sensor_id} Port:{port} - {timer_seconds} seconds")
-        return True
-    else:
-        print(f"❌ Failed to publish timer configuration")
+    print(f"📤 Sending timer configuration for Sensor ID:{sensor_id} Port:{port} - {timer_seconds} seconds")
+    try:
+        value = await timers.set_timer(timer_seconds, sensor_id, port)
+    except TimerError as e:
+        print(f"❌ Device rejected timer: {e}")
         return False
+    except asyncio.TimeoutError:
+        print("❌ No confirmation from device")
+        return False
+    
+    print(f"📩 Confirmed: Sensor ID:{sensor_id} Port:{port} timer = {value} seconds")
+    return True
 
-def get_sensor_timer(client, sensor_id, port):
+async def get_sensor_timer(timers, sensor_id, port):
     """Get current timer value for specific sensor and port"""
-    timer_request = {
-        "cmd": 202,
-        "sensor_id": sensor_id,
-        "port": port
-    }
-    
-    payload = json.dumps(timer_request)
-    result = client.publish(TIMER_TOPIC, payload)
-    
-    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-        print(f"📤 Requested timer value for Sensor ID:{sensor_id} Port:{port}")
-        return True
-    else:
-        print("❌ Failed to request timer value")
+    print(f"📤 Requested timer value for Sensor ID:{sensor_id} Port:{port}")
+    try:
+        value = await timers.get_timer(sensor_id, port)
+    except asyncio.TimeoutError:
+        print("❌ No reply from device")
         return False
+    
+    print(f"📩 Sensor ID:{sensor_id} Port:{port} timer = {value} seconds")
+    return True
 
-def get_all_sensors_timer(client):
+async def get_all_sensors_timer(timers):
     """Get all sensors timer status"""
-    timer_request = {
-        "cmd": 203
-    }
-    
-    payload = json.dumps(timer_request)
-    result = client.publish(TIMER_TOPIC, payload)
-    
-    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-        print("📤 Requested all sensors timer status")
-        return True
-    else:
-        print("❌ Failed to request all sensors timer status")
+    print("📤 Requested all sensors timer status")
+    try:
+        sensors = await timers.get_all_timers()
+    except asyncio.TimeoutError:
+        print("❌ No reply from device")
         return False
+    
+    for sensor in sensors:
+        state = "active" if sensor.get("active") else "idle"
+        print(f"📩 Sensor ID:{sensor.get('sensor_id')} Port:{sensor.get('port')} "
+              f"timer = {sensor.get('timer_value')} seconds ({state})")
+    return True
 
-def main():
+async def main():
     """Main function"""
     print("🧪 Multi-Sensor Timer Configuration Test")
     print("=" * 60)
     
-    # Create MQTT client
-    client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1)
-    client.on_connect = on_connect
-    client.on_message = on_message
+    timers = AsyncTimerClient(DEVICE_ID, MQTT_BROKER, MQTT_PORT, timeout=REPLY_TIMEOUT)
+    loop = asyncio.get_running_loop()
     
     try:
-        # Connect to broker
+        # Connect to broker (returns once the status topic is subscribed)
         print(f"🔌 Connecting to MQTT broker: {MQTT_BROKER}:{MQTT_PORT}")
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        client.loop_start()
-        
-        # Wait for connection
-        time.sleep(2)
+        await timers.connect()
+        print("✅ Connected to MQTT broker")
+        print(f"📡 Subscribed to: {timers.status_topic}")
         
         print("\n📋 Multi-Sensor Timer Configuration Examples:")
         print("1. Set Sensor ID 1, Port 1 to 30 seconds")
@@ -123,37 +87,37 @@ def main():
         
         while True:
             try:
-                choice = input("\n🎮 Enter your choice (1-7): ").strip()
+                choice = (await loop.run_in_executor(None, input, "\n🎮 Enter your choice (1-7): ")).strip()
                 
+                # Each action returns as soon as the device replies
                 if choice == "1":
-                    set_sensor_timer(client, 1, 1, 30)
+                    await set_sensor_timer(timers, 1, 1, 30)
                 elif choice == "2":
-                    set_sensor_timer(client, 2, 1, 60)
+                    await set_sensor_timer(timers, 2, 1, 60)
                 elif choice == "3":
-                    set_sensor_timer(client, 1, 2, 90)
+                    await set_sensor_timer(timers, 1, 2, 90)
                 elif choice == "4":
-                    get_sensor_timer(client, 1, 1)
+                    await get_sensor_timer(timers, 1, 1)
                 elif choice == "5":
-                    get_sensor_timer(client, 2, 1)
+                    await get_sensor_timer(timers, 2, 1)
                 elif choice == "6":
-                    get_all_sensors_timer(client)
+                    await get_all_sensors_timer(timers)
                 elif choice == "7":
                     break
                 else:
                     print("❌ Invalid choice. Please enter 1-7.")
                 
-                # Wait for response
-                time.sleep(1)
-                
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, EOFError):
                 break
                 
     except Exception as e:
         print(f"❌ Error: {e}")
     finally:
-        client.loop_stop()
-        client.disconnect()
+        await timers.close()
         print("\n👋 Disconnected from MQTT broker")
 
 if __name__ == "__main__":
-    main()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
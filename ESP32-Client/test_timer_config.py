@@ -4,93 +4,62 @@ Test script for ESP32 Timer Configuration via MQTT
 This script demonstrates how to configure the timer value remotely via MQTT
 """
 
-import paho.mqtt.client as mqtt
-import json
-import time
-import sys
+import asyncio
+
+from mqtt_transport import DEFAULT_BROKER_HOST
+from timer_client import AsyncTimerClient, TimerError
 
 # MQTT Configuration
-MQTT_BROKER = "192.168.29.128"  # Your MQTT broker IP
+MQTT_BROKER = DEFAULT_BROKER_HOST  # Your MQTT broker IP (MQTT_BROKER env var overrides)
 MQTT_PORT = 1883
 DEVICE_ID = "123456"
+REPLY_TIMEOUT = 5  # seconds to wait for the device's reply
 
-# Topics
-TIMER_TOPIC = f"MPS/global/{DEVICE_ID}/timer"
-STATUS_TOPIC = f"MPS/global/UP/{DEVICE_ID}/status"
-
-def on_connect(client, userdata, flags, rc):
-    """Callback for when the client connects to the broker"""
-    if rc == 0:
-        print("✅ Connected to MQTT broker")
-        # Subscribe to status topic to see responses
-        client.subscribe(STATUS_TOPIC)
-        print(f"📡 Subscribed to: {STATUS_TOPIC}")
-    else:
-        print(f"❌ Failed to connect, return code {rc}")
-
-def on_message(client, userdata, message):
-    """Callback for when a message is received"""
-    try:
-        data = json.loads(message.payload.decode())
-        print(f"📩 Received: {data}")
-    except json.JSONDecodeError:
-        print(f"❌ Invalid JSON received: {message.payload.decode()}")
-
-def set_timer_value(client, timer_seconds):
+async def set_timer_value(timers, timer_seconds):
     """Set timer value via MQTT"""
     if not (5 <= timer_seconds <= 3600):
         print("❌ Timer value must be between 5-3600 seconds")
         return False
     
-    timer_config = {
-        "cmd": 200,
-        "timer_value": timer_seconds
-    }
-    
-    payload = json.dumps(timer_config)
-    result = client.publish(TIMER_TOPIC, payload)
-    
-    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-        print(f"📤 Sent timer configuration: {timer_seconds} seconds")
-        return True
-    else:
-        print(f"❌ Failed to publish timer configuration")
+    print(f"📤 Sent timer configuration: {timer_seconds} seconds")
+    try:
+        value = await timers.set_timer(timer_seconds)
+    except TimerError as e:
+        print(f"❌ Device rejected timer: {e}")
+        return False
+    except asyncio.TimeoutError:
+        print("❌ No confirmation from device")
         return False
+    
+    print(f"📩 Confirmed: timer = {value} seconds")
+    return True
 
-def get_timer_value(client):
+async def get_timer_value(timers):
     """Get current timer value via MQTT"""
-    timer_request = {
-        "cmd": 202
-    }
-    
-    payload = json.dumps(timer_request)
-    result = client.publish(TIMER_TOPIC, payload)
-    
-    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-        print("📤 Requested current timer value")
-        return True
-    else:
-        print("❌ Failed to request timer value")
+    print("📤 Requested current timer value")
+    try:
+        value = await timers.get_timer()
+    except asyncio.TimeoutError:
+        print("❌ No reply from device")
         return False
+    
+    print(f"📩 Current timer = {value} seconds")
+    return True
 
-def main():
+async def main():
     """Main function"""
     print("🧪 ESP32 Timer Configuration Test")
     print("=" * 50)
     
-    # Create MQTT client
-    client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1)
-    client.on_connect = on_connect
-    client.on_message = on_message
+    timers = AsyncTimerClient(DEVICE_ID, MQTT_BROKER, MQTT_PORT, timeout=REPLY_TIMEOUT)
+    loop = asyncio.get_running_loop()
     
     try:
-        # Connect to broker
+        # Connect to broker (returns once the status topic is subscribed)
         print(f"🔌 Connecting to MQTT broker: {MQTT_BROKER}:{MQTT_PORT}")
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        client.loop_start()
-        
-        # Wait for connection
-        time.sleep(2)
+        await timers.connect()
+        print("✅ Connected to MQTT broker")
+        print(f"📡 Subscribed to: {timers.status_topic}")
         
         print("\n📋 Available Commands:")
         print("1. Set timer to 30 seconds")
@@ -101,33 +70,33 @@ def main():
         
         while True:
             try:
-                choice = input("\n🎮 Enter your choice (1-5): ").strip()
+                choice = (await loop.run_in_executor(None, input, "\n🎮 Enter your choice (1-5): ")).strip()
                 
+                # Each action returns as soon as the device replies
                 if choice == "1":
-                    set_timer_value(client, 30)
+                    await set_timer_value(timers, 30)
                 elif choice == "2":
-                    set_timer_value(client, 60)
+                    await set_timer_value(timers, 60)
                 elif choice == "3":
-                    set_timer_value(client, 120)
+                    await set_timer_value(timers, 120)
                 elif choice == "4":
-                    get_timer_value(client)
+                    await get_timer_value(timers)
                 elif choice == "5":
                     break
                 else:
                     print("❌ Invalid choice. Please enter 1-5.")
                 
-                # Wait for response
-                time.sleep(1)
-                
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, EOFError):
                 break
                 
     except Exception as e:
         print(f"❌ Error: {e}")
     finally:
-        client.loop_stop()
-        client.disconnect()
+        await timers.close()
         print("\n👋 Disconnected from MQTT broker")
 
 if __name__ == "__main__":
-    main()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
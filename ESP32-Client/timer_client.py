@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Async request/response client for the ESP32 timer commands
+set_timer / get_timer / get_all_timers publish cmd 200 / 202 / 203 on the
+device's timer topic and resolve on the matching 201 / 203 / 204 reply on its
+status topic, so callers wait exactly as long as the device takes to answer.
+Any number of requests may be in flight at once over one connection; a client
+created without a device_id serves every device (device_id= on each call)
+"""
+
+import asyncio
+import json
+import os
+from collections import deque
+
+from mqtt_transport import DEFAULT_BROKER_HOST, MQTT_ERR_SUCCESS, AsyncioHelper, create_client, is_memory_broker
+from payload_codec import decode_payload
+
+DEFAULT_TIMEOUT = 5.0
+ALL_DEVICES_STATUS = "MPS/global/UP/+/status"
+ANY_SENSOR = None  # request without sensor_id/port: the device answers for its current sensor
+
+
+class TimerError(Exception):
+    """The device rejected a timer command (status "error" reply)"""
+
+    def __init__(self, reply):
+        super().__init__(reply.get("error", "timer command failed"))
+        self.reply = reply
+
+
+class AsyncTimerClient:
+    """Timer commands for one device (or any device), awaited on their replies"""
+
+    def __init__(self, device_id=None, broker_host=DEFAULT_BROKER_HOST, broker_port=1883, timeout=DEFAULT_TIMEOUT,
+                 client=None):
+        self.device_id = None if device_id is None else str(device_id)
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.timeout = timeout
+        if self.device_id is None:
+            self.timer_topic = None
+            self.status_topic = ALL_DEVICES_STATUS
+        else:
+            self.timer_topic = f"MPS/global/{self.device_id}/timer"
+            self.status_topic = f"MPS/global/UP/{self.device_id}/status"
+        self.client = client
+        self.helper = None
+        self._pending = {}  # (device_id, reply cmd, sensor_id, port) -> deque of futures, oldest first
+        self._subscribed = None
+
+    async def connect(self, timeout=10.0):
+        """Connect and subscribe to the status topic; returns once replies can be received"""
+        loop = asyncio.get_running_loop()
+        self._subscribed = loop.create_future()
+        if self.client is None:
+            self.client = create_client(f"esp32-timer-{os.getpid()}-{id(self):x}", self.broker_host)
+            self.client.username_pw_set("mps-bam100", "bam100")
+        self.client.on_connect = self._on_connect
+        self.client.on_subscribe = self._on_subscribe
+        self.client.on_message = self._on_message
+        if not is_memory_broker(self.broker_host):
+            self.helper = AsyncioHelper(loop, self.client)
+        self.client.connect(self.broker_host, self.broker_port, 60)
+        await asyncio.wait_for(asyncio.shield(self._subscribed), timeout)
+        return self
+
+    async def close(self):
+        for waiting in self._pending.values():
+            for future in waiting:
+                if not future.done():
+                    future.cancel()
+        self._pending.clear()
+        if self.client is not None:
+            self.client.disconnect()
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            if not self._subscribed.done():
+                self._subscribed.set_exception(ConnectionError(f"MQTT connect failed, return code {rc}"))
+            return
+        client.subscribe(self.status_topic)
+
+    def _on_subscribe(self, client, userdata, mid, granted_qos):
+        if not self._subscribed.done():
+            self._subscribed.set_result(True)
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            data = decode_payload(msg.payload)
+        except ValueError:
+            return
+        if not isinstance(data, dict) or data.get("ch_t") != "TIMER":
+            return
+        device_id = data.get("device_id", self.device_id)
+        cmd = data.get("cmd")
+        waiting = self._pending.get((device_id, cmd, data.get("sensor_id"), data.get("port")))
+        if not waiting:
+            waiting = self._pending.get((device_id, cmd, ANY_SENSOR, ANY_SENSOR))
+        while waiting:
+            future = waiting.popleft()
+            if not future.done():  # skip requests that already timed out
+                future.set_result(data)
+                return
+
+    async def request(self, payload, reply_key, timeout=None, device_id=None):
+        """Publish a timer command and wait for the reply matching (cmd, sensor_id, port) reply_key"""
+        device_id = self.device_id if device_id is None else str(device_id)
+        if device_id is None:
+            raise ValueError("device_id is required when the client serves all devices")
+        future = asyncio.get_running_loop().create_future()
+        waiting = self._pending.setdefault((device_id,) + reply_key, deque())
+        waiting.append(future)  # before publishing: in-process replies arrive synchronously
+        result = self.client.publish(f"MPS/global/{device_id}/timer", json.dumps(payload))
+        if result.rc != MQTT_ERR_SUCCESS:
+            waiting.remove(future)
+            raise ConnectionError(f"publish failed, return code {result.rc}")
+        try:
+            return await asyncio.wait_for(future, self.timeout if timeout is None else timeout)
+        finally:
+            if future in waiting:
+                waiting.remove(future)
+
+    async def set_timer(self, timer_seconds, sensor_id=ANY_SENSOR, port=ANY_SENSOR, timeout=None, device_id=None):
+        """cmd 200 -> 201; returns the confirmed timer value in seconds"""
+        if not (5 <= timer_seconds <= 3600):
+            raise ValueError("Timer value must be between 5-3600 seconds")
+        payload = {"cmd": 200}
+        if sensor_id is not ANY_SENSOR:
+            payload.update(sensor_id=sensor_id, port=port)
+        payload["timer_value"] = timer_seconds
+        reply = await self.request(payload, (201, sensor_id, port), timeout, device_id)
+        if reply.get("status") == "error":
+            raise TimerError(reply)
+        return reply.get("timer_value")
+
+    async def get_timer(self, sensor_id=ANY_SENSOR, port=ANY_SENSOR, timeout=None, device_id=None):
+        """cmd 202 -> 203; returns the timer value in seconds"""
+        payload = {"cmd": 202}
+        if sensor_id is not ANY_SENSOR:
+            payload.update(sensor_id=sensor_id, port=port)
+        reply = await self.request(payload, (203, sensor_id, port), timeout, device_id)
+        return reply.get("timer_value")
+
+    async def get_all_timers(self, timeout=None, device_id=None):
+        """cmd 203 -> 204; returns the device's list of sensor timer entries"""
+        reply = await self.request({"cmd": 203}, (204, None, None), timeout, device_id)
+        return reply.get("sensors", [])
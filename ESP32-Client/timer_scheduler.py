@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Event-driven timer scheduler for the ESP32 simulator
+A single heap of deadlines replaces the per-device 1-second polling threads:
+nothing wakes up until the earliest armed timer is due
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from sim_logging import get_logger
+from sim_metrics import METRICS, perf_counter
+
+log = get_logger("timers")
+
+TIMER_LAG = METRICS.histogram("timer_lag_seconds", "How late timers fired after their deadline (scheduler clock)")
+TIMER_CALLBACK_SECONDS = METRICS.histogram("timer_callback_seconds", "Time spent in timer callbacks", ("callback",))
+
+
+class Timer:
+    """Handle returned by TimerScheduler.call_at / call_later"""
+
+    __slots__ = ("deadline", "callback", "args", "scheduler", "cancelled", "queued")
+
+    def __init__(self, deadline, callback, args, scheduler):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.scheduler = scheduler
+        self.cancelled = False
+        self.queued = True  # still in the scheduler's heap (not yet popped for firing)
+
+    def active(self):
+        """True while the timer is armed and has not fired or been cancelled"""
+        return self.scheduler is not None and not self.cancelled
+
+    def cancel(self):
+        """Disarm the timer (lazily removed from the heap); works until its callback starts"""
+        scheduler = self.scheduler
+        if scheduler is not None:
+            scheduler._cancel(self)
+
+
+class TimerScheduler:
+    """Heap-ordered one-shot timers with three ways to drive them:
+
+    - run_due(now): fire everything due, for callers that own the loop
+    - attach_loop(loop): a single asyncio call_later handle tracking the earliest deadline
+    - run_forever(): a single thread sleeping on a condition until the next deadline
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.running = False
+        self._heap = []  # (deadline, seq, Timer)
+        self._seq = itertools.count()
+        self._cancelled = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._loop = None
+        self._loop_handle = None
+        self._loop_deadline = None
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    def call_at(self, deadline, callback, *args):
+        """Arm a timer for an absolute deadline on this scheduler's clock"""
+        timer = Timer(deadline, callback, args, self)
+        with self._cond:
+            heapq.heappush(self._heap, (deadline, next(self._seq), timer))
+            is_head = self._heap[0][2] is timer
+            if is_head:
+                self._cond.notify()
+        if is_head and self._loop is not None:
+            self._rearm_loop()
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        """Arm a timer delay seconds from now"""
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def next_deadline(self):
+        """Earliest live deadline, or None when nothing is armed"""
+        with self._cond:
+            self._drop_cancelled_head()
+            return self._heap[0][0] if self._heap else None
+
+    def run_due(self, now=None):
+        """Fire every timer whose deadline has passed; returns how many fired"""
+        if now is None:
+            now = self.clock()
+        fired = 0
+        while True:
+            # Pop the whole due batch under one lock hold, then fire outside it
+            due = []
+            with self._cond:
+                heap = self._heap
+                while heap and heap[0][0] <= now:
+                    timer = heapq.heappop(heap)[2]
+                    if timer.cancelled:
+                        self._cancelled -= 1
+                        continue
+                    timer.queued = False
+                    due.append(timer)
+            if not due:
+                return fired
+            for timer in due:
+                # An earlier callback of the batch may have cancelled this one
+                if timer.cancelled:
+                    continue
+                timer.scheduler = None
+                TIMER_LAG.observe(now - timer.deadline)
+                started = perf_counter()
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    log.exception("❌ Timer callback %r failed: %s", timer.callback, e)
+                finally:
+                    TIMER_CALLBACK_SECONDS.observe(perf_counter() - started,
+                                                   (getattr(timer.callback, "__qualname__", "other"),))
+                fired += 1
+
+    def _drop_cancelled_head(self):
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+            self._cancelled -= 1
+
+    def _cancel(self, timer):
+        with self._cond:
+            if timer.cancelled or timer.scheduler is None:
+                return
+            timer.cancelled = True
+            if not timer.queued:
+                return  # popped for firing: run_due skips it, nothing left in the heap to count
+            self._cancelled += 1
+            # Compact once cancelled entries dominate so memory tracks live timers
+            if self._cancelled > 1024 and self._cancelled * 2 > len(self._heap):
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    # asyncio driver
+    def attach_loop(self, loop):
+        """Drive timers from an asyncio loop (timers must then be armed from the loop thread)"""
+        self._loop = loop
+        self.running = True
+        self._rearm_loop()
+
+    def _rearm_loop(self):
+        deadline = self.next_deadline()
+        if deadline == self._loop_deadline or not self.running:
+            return
+        if self._loop_handle is not None:
+            self._loop_handle.cancel()
+            self._loop_handle = None
+        self._loop_deadline = deadline
+        if deadline is not None:
+            self._loop_handle = self._loop.call_later(max(0.0, deadline - self.clock()), self._on_loop_timer)
+
+    def _on_loop_timer(self):
+        self._loop_handle = None
+        self._loop_deadline = None
+        try:
+            self.run_due()
+        finally:
+            self._rearm_loop()
+
+    # thread driver
+    def run_forever(self):
+        """Block the calling thread, firing timers as they come due until stop()"""
+        self.running = True
+        while self.running:
+            self.run_due()
+            with self._cond:
+                if not self.running:
+                    break
+                self._drop_cancelled_head()
+                if not self._heap:
+                    self._cond.wait()
+                else:
+                    delay = self._heap[0][0] - self.clock()
+                    if delay > 0:
+                        self._cond.wait(delay)
+
+    def stop(self):
+        self.running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._loop_handle is not None:
+            self._loop_handle.cancel()
+            self._loop_handle = None
+            self._loop_deadline = None
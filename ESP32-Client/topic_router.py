@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Topic router for fleets multiplexed over shared connections
+TopicRouter is a trie keyed by topic level: exact topics are dict lookups all
+the way down, and filters with + or # live on the same trie, so routing a
+message costs one lookup per topic level (plus one per wildcard branch)
+whether the fleet holds 10 devices or 100k. Handlers can be added and removed
+while the fleet runs
+"""
+
+SHARED_PREFIX = "$share/"
+
+
+def split_shared(topic_filter):
+    """("group", "filter") for $share/group/filter, (None, topic_filter) otherwise"""
+    if not topic_filter.startswith(SHARED_PREFIX):
+        return None, topic_filter
+    group, _, shared_filter = topic_filter[len(SHARED_PREFIX):].partition("/")
+    return group, shared_filter
+
+
+class _Node:
+    __slots__ = ("children", "handlers")
+
+    def __init__(self):
+        self.children = None  # level -> _Node, created with the first child
+        self.handlers = ()  # handlers of the filter ending at this node
+
+
+class TopicRouter:
+    """Maps topics to the handlers of every matching filter"""
+
+    def __init__(self):
+        self.root = _Node()
+        self.filters = 0  # filters with at least one handler
+        self.wildcards = 0  # of those, filters using + or #
+
+    def add(self, topic_filter, handler):
+        node = self.root
+        for level in topic_filter.split("/"):
+            children = node.children
+            if children is None:
+                children = node.children = {}
+            child = children.get(level)
+            if child is None:
+                child = children[level] = _Node()
+            node = child
+        if handler in node.handlers:
+            return
+        if not node.handlers:
+            self.filters += 1
+            if "+" in topic_filter or "#" in topic_filter:
+                self.wildcards += 1
+        node.handlers = node.handlers + (handler,)
+
+    def remove(self, topic_filter, handler):
+        """Drop one handler of a filter, pruning nodes nothing hangs off any more"""
+        path = [self.root]
+        levels = topic_filter.split("/")
+        for level in levels:
+            children = path[-1].children
+            node = children.get(level) if children is not None else None
+            if node is None:
+                return False
+            path.append(node)
+        node = path[-1]
+        if handler not in node.handlers:
+            return False
+        node.handlers = tuple(h for h in node.handlers if h != handler)
+        if not node.handlers:
+            self.filters -= 1
+            if "+" in topic_filter or "#" in topic_filter:
+                self.wildcards -= 1
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.handlers or node.children:
+                break
+            parent = path[depth - 1]
+            del parent.children[levels[depth - 1]]
+            if not parent.children:
+                parent.children = None
+        return True
+
+    def match(self, topic):
+        """Handlers of every filter matching topic ($-topics skip first-level wildcards)"""
+        levels = topic.split("/")
+        if not self.wildcards:
+            node = self.root
+            for level in levels:
+                children = node.children
+                node = children.get(level) if children is not None else None
+                if node is None:
+                    return ()
+            return node.handlers
+        found = []
+        count = len(levels)
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            children = node.children
+            if depth == count:
+                found.extend(node.handlers)
+                if children is not None and "#" in children:
+                    found.extend(children["#"].handlers)  # "a/#" also matches "a"
+                continue
+            if children is None:
+                continue
+            wildcard_ok = depth > 0 or not levels[0].startswith("$")
+            if wildcard_ok:
+                any_level = children.get("#")
+                if any_level is not None:
+                    found.extend(any_level.handlers)
+                one_level = children.get("+")
+                if one_level is not None:
+                    stack.append((one_level, depth + 1))
+            child = children.get(levels[depth])
+            if child is not None:
+                stack.append((child, depth + 1))
+        return found
+
+    def route(self, topic, *args):
+        """Call every matching handler with args; returns how many there were"""
+        handlers = self.match(topic)
+        for handler in handlers:
+            handler(*args)
+        return len(handlers)
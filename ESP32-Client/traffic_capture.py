@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Traffic capture for the ESP32 simulator
+TrafficRecorder appends every message a simulator receives (on_message) or
+sends (its publish helper) to a compact binary capture file; read_capture and
+load_capture read it back for traffic_replay.py
+
+File layout: an 8-byte magic, then records. Each capture session starts with
+a SESSION record; topics are interned per session (TOPIC records) so a message
+costs a 17-byte header plus its payload
+"""
+
+import os
+import struct
+import threading
+import time
+
+from inmemory_broker import encode_payload
+from sim_logging import get_logger
+
+log = get_logger("capture")
+
+MAGIC = b"ESPCAP1\n"
+SESSION, TOPIC, INBOUND, OUTBOUND = 0, 1, 2, 3
+
+# Every record is a kind byte followed by its fields
+_SESSION = struct.Struct(">Bd")      # kind, wall-clock start (epoch seconds)
+_TOPIC = struct.Struct(">BIH")       # kind, topic id, topic length
+_MESSAGE = struct.Struct(">BIdI")    # kind, topic id, seconds since session start, payload length
+_RECORD_SIZES = {SESSION: _SESSION.size, TOPIC: _TOPIC.size, INBOUND: _MESSAGE.size, OUTBOUND: _MESSAGE.size}
+
+
+class TrafficRecorder:
+    """Appends captured messages to a file; one recorder can serve a whole fleet"""
+
+    def __init__(self, path, clock=time.perf_counter, buffer_size=1 << 20):
+        self.path = path
+        self.clock = clock
+        self.messages = 0
+        self._topics = {}  # topic -> id in this session
+        self._lock = threading.Lock()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab", buffering=buffer_size)
+        if new_file:
+            self._file.write(MAGIC)
+        self._start = clock()
+        self._file.write(_SESSION.pack(SESSION, time.time()))
+
+    def record(self, direction, topic, payload):
+        """direction is INBOUND or OUTBOUND; payload as passed to publish or received"""
+        payload = encode_payload(payload)
+        with self._lock:
+            write = self._file.write
+            topic_id = self._topics.get(topic)
+            if topic_id is None:
+                topic_id = self._topics[topic] = len(self._topics)
+                name = topic.encode("utf-8")
+                write(_TOPIC.pack(TOPIC, topic_id, len(name)))
+                write(name)
+            write(_MESSAGE.pack(direction, topic_id, self.clock() - self._start, len(payload)))
+            write(payload)
+            self.messages += 1
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CapturedMessage:
+    __slots__ = ("session", "time", "direction", "topic", "payload")
+
+    def __init__(self, session, time, direction, topic, payload):
+        self.session = session
+        self.time = time
+        self.direction = direction
+        self.topic = topic
+        self.payload = payload
+
+
+def read_capture(path):
+    """Yield CapturedMessage in file order; time is seconds since its session started"""
+    with open(path, "rb") as capture:
+        if capture.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a simulator capture file")
+        read = capture.read
+        session = -1
+        topics = {}
+        while True:
+            kind = read(1)
+            if not kind:
+                return
+            size = _RECORD_SIZES.get(kind[0], 1)
+            record = kind + read(size - 1)
+            kind = kind[0]
+            if len(record) < size:
+                # Tail of a capture that was still being written (or was cut short): keep what is complete
+                log.warning("⚠️ %s: truncated capture, stopped in a record of type %s", path, kind)
+                return
+            if kind == SESSION:
+                session += 1
+                topics = {}
+            elif kind == TOPIC:
+                _, topic_id, length = _TOPIC.unpack(record)
+                topic = read(length)
+                if len(topic) < length:
+                    log.warning("⚠️ %s: truncated capture, stopped in a topic record", path)
+                    return
+                topics[topic_id] = topic.decode("utf-8")
+            elif kind in (INBOUND, OUTBOUND):
+                _, topic_id, offset, length = _MESSAGE.unpack(record)
+                payload = read(length)
+                if len(payload) < length:
+                    log.warning("⚠️ %s: truncated capture, stopped in a message record", path)
+                    return
+                yield CapturedMessage(session, offset, kind, topics[topic_id], payload)
+            else:
+                raise ValueError(f"{path}: unknown record type {kind}")
+
+
+def load_capture(path, directions=(INBOUND,), session=None):
+    """Messages of the chosen directions (and session), with times on one timeline"""
+    messages = []
+    base = 0.0
+    current = None
+    last = 0.0
+    for message in read_capture(path):
+        if session is not None and message.session != session:
+            continue
+        if message.session != current:
+            # Sessions follow each other back to back on the replay timeline
+            base, current = last, message.session
+        message.time += base
+        last = message.time
+        if message.direction in directions:
+            messages.append(message)
+    return messages
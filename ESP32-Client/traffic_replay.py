@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Replay of captured simulator traffic
+Publishes the messages of a traffic_capture file through a broker again - to
+devices running elsewhere, or to a local fleet started for the run with the
+captured devices mapped onto it - at real-time speed, N x speed or as fast as
+possible, so a recorded traffic pattern can be reproduced and benchmarked
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from collections import Counter
+
+from esp32_fleet import FIRST_DEVICE_ID, MQTT_BROKER, MQTT_PORT, FleetRunner
+from mqtt_transport import MQTT_ERR_SUCCESS, AsyncioHelper, create_client, is_memory_broker
+from sim_logging import configure_logging
+from traffic_capture import INBOUND, OUTBOUND, load_capture, read_capture
+
+DIRECTIONS = {"in": (INBOUND,), "out": (OUTBOUND,), "both": (INBOUND, OUTBOUND)}
+
+
+def topic_device(topic):
+    """Device id in MPS/global/<id>/<suffix> or MPS/global/UP/<id>/status, else None"""
+    parts = topic.split("/")
+    if len(parts) == 4 and parts[2] != "UP":
+        return parts[2]
+    if len(parts) == 5 and parts[2] == "UP":
+        return parts[3]
+    return None
+
+
+def device_map(messages, targets):
+    """Spread the captured devices over target ids: each captured id -> list of targets
+
+    With more targets than captured devices, each captured device drives several
+    targets (its traffic is cloned); with fewer, devices share a target.
+    """
+    captured = sorted({device for device in map(topic_device, (m.topic for m in messages)) if device})
+    mapping = {device_id: [] for device_id in captured}
+    if captured:
+        for index, target in enumerate(targets):
+            mapping[captured[index % len(captured)]].append(target)
+        for index, device_id in enumerate(captured[len(targets):], start=len(targets)):
+            mapping[device_id].append(targets[index % len(targets)])
+    return mapping
+
+
+def rewrite_topic(topic, device_id, target):
+    return topic.replace(f"/{device_id}/", f"/{target}/", 1)
+
+
+def expand(messages, mapping=None):
+    """(time, topic, payload) to publish, with topics rewritten for the device mapping"""
+    if mapping is None:
+        return [(m.time, m.topic, m.payload) for m in messages]
+    plan = []
+    for m in messages:
+        device_id = topic_device(m.topic)
+        if device_id is None:
+            plan.append((m.time, m.topic, m.payload))
+            continue
+        for target in mapping[device_id]:
+            plan.append((m.time, rewrite_topic(m.topic, device_id, target), m.payload))
+    return plan
+
+
+class TrafficReplayer:
+    """Publishes a replay plan on schedule: speed 1 = real time, N = N x faster, 0 = as fast as possible"""
+
+    def __init__(self, client, plan, speed=1.0):
+        self.client = client
+        self.plan = plan
+        self.speed = speed
+        self.sent = 0
+        self.failed = 0
+        self.max_lag = 0.0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        publish = self.client.publish
+        started = loop.time()
+        for index, (offset, topic, payload) in enumerate(self.plan):
+            if self.speed:
+                due = started + offset / self.speed
+                ahead = due - loop.time()
+                if ahead > 0.001:
+                    await asyncio.sleep(ahead)
+                else:
+                    self.max_lag = max(self.max_lag, -ahead)
+                    if index % 500 == 499:
+                        await asyncio.sleep(0)
+            elif index % 500 == 499:
+                await asyncio.sleep(0)  # let socket writers and receivers run
+            if publish(topic, payload).rc == MQTT_ERR_SUCCESS:
+                self.sent += 1
+            else:
+                self.failed += 1
+        return loop.time() - started
+
+
+async def connect_replay_client(host, port):
+    loop = asyncio.get_running_loop()
+    connected = loop.create_future()
+    client = create_client(f"esp32-replay-{os.getpid()}", host)
+    client.username_pw_set("mps-bam100", "bam100")
+
+    def on_connect(client, userdata, flags, rc):
+        if not connected.done():
+            if rc == 0:
+                connected.set_result(True)
+            else:
+                connected.set_exception(ConnectionError(f"MQTT connect failed, return code {rc}"))
+
+    client.on_connect = on_connect
+    if not is_memory_broker(host):
+        AsyncioHelper(loop, client)
+    client.connect(host, port, 60)
+    await asyncio.wait_for(connected, 10)
+    return client
+
+
+def describe(path):
+    """Print a capture's sessions, duration, directions and busiest topic suffixes"""
+    size = os.path.getsize(path)
+    sessions = set()
+    directions = Counter()
+    suffixes = Counter()
+    devices = set()
+    payload_bytes = 0
+    duration = 0.0
+    for message in read_capture(path):
+        sessions.add(message.session)
+        directions[message.direction] += 1
+        suffixes[message.topic.rpartition("/")[2]] += 1
+        device_id = topic_device(message.topic)
+        if device_id:
+            devices.add(device_id)
+        payload_bytes += len(message.payload)
+        duration = max(duration, message.time)
+    total = sum(directions.values())
+    print(f"📼 {path}: {size} bytes, {len(sessions)} sessions, {total} messages, {len(devices)} devices")
+    print(f"   inbound {directions[INBOUND]}, outbound {directions[OUTBOUND]}, longest session {duration:.1f}s")
+    if total:
+        print(f"   {size / total:.1f} bytes/message on disk ({payload_bytes / total:.1f} payload)")
+    for suffix, count in suffixes.most_common(8):
+        print(f"   {suffix:<12} {count}")
+
+
+async def replay(args):
+    messages = load_capture(args.capture, DIRECTIONS[args.direction], args.session)
+    fleet = None
+    mapping = None
+    if args.devices:
+        targets = [str(args.first_id + i) for i in range(args.devices)]
+        mapping = device_map(messages, targets)
+        fleet = FleetRunner(args.devices, args.host, args.port, args.connections, args.first_id,
+                            ping_interval=args.ping_interval)
+        print(f"🚀 Starting {args.devices} local devices for the replay...")
+        await fleet.start()
+    plan = expand(messages, mapping)
+    speed = "max" if not args.speed else f"{args.speed:g}x"
+    print(f"▶️ Replaying {len(plan)} messages from {len(messages)} captured at {speed} speed")
+
+    client = await connect_replay_client(args.host, args.port)
+    replayer = TrafficReplayer(client, plan, args.speed)
+    try:
+        elapsed = await replayer.run()
+        await asyncio.sleep(args.drain)
+    finally:
+        client.disconnect()
+        if fleet is not None:
+            fleet.stop()
+
+    print("\n📊 Replay summary")
+    print(f"   sent:     {replayer.sent} ({replayer.failed} failed)")
+    print(f"   elapsed:  {elapsed:.2f}s ({replayer.sent / elapsed if elapsed else 0:.0f} msg/s)")
+    if args.speed:
+        print(f"   max lag:  {replayer.max_lag * 1000:.1f} ms behind schedule")
+    if fleet is not None:
+        received = sum(connection.received for connection in fleet.connections)
+        published = sum(connection.published for connection in fleet.connections)
+        print(f"   devices:  {received} messages received, {published} published")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay a simulator traffic capture")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="summarize a capture file")
+    info.add_argument("capture")
+    play = commands.add_parser("replay", help="publish a capture's messages again")
+    play.add_argument("capture")
+    play.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N x faster, 0 = as fast as possible")
+    play.add_argument("--direction", choices=sorted(DIRECTIONS), default="in",
+                      help="in = commands the devices received (default), out = what they published")
+    play.add_argument("--session", type=int, default=None, help="replay only this capture session")
+    play.add_argument("--host", default=MQTT_BROKER, help='MQTT broker host ("memory" = in-process)')
+    play.add_argument("--port", type=int, default=MQTT_PORT)
+    play.add_argument("--devices", type=int, default=0,
+                      help="start N local devices and map the captured devices onto them (0 = publish as captured)")
+    play.add_argument("--first-id", type=int, default=FIRST_DEVICE_ID)
+    play.add_argument("--connections", type=int, default=4)
+    play.add_argument("--ping-interval", type=float, default=30)
+    play.add_argument("--drain", type=float, default=1.0, help="seconds to wait for replies after the last message")
+    play.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        describe(args.capture)
+        return
+    configure_logging(getattr(logging, args.log_level.upper()))
+    print("🧪 Traffic Replay")
+    print("=" * 50)
+    try:
+        asyncio.run(replay(args))
+    except KeyboardInterrupt:
+        pass
+    print("👋 Goodbye!")
+
+
+if __name__ == "__main__":
+    main()